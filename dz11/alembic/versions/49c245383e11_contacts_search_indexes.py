@@ -0,0 +1,38 @@
+"""contacts search indexes
+
+Revision ID: 49c245383e11
+Revises: 6c45bf7ffa69
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '49c245383e11'
+down_revision: Union[str, None] = '6c45bf7ffa69'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must stay identical to search_text() in src/repository/contacts.py, otherwise the planner skips the indexes.
+SEARCH_TEXT = "(first_name || ' ' || last_name || ' ' || email || ' ' || phone_number)"
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute(f"CREATE INDEX ix_contacts_search_tsv ON contacts USING gin (to_tsvector('simple', {SEARCH_TEXT}))")
+    op.execute(f"CREATE INDEX ix_contacts_search_trgm ON contacts USING gin ({SEARCH_TEXT} gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.execute("DROP INDEX IF EXISTS ix_contacts_search_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_contacts_search_tsv")
@@ -0,0 +1,27 @@
+"""drop users refresh token
+
+Revision ID: 5e7b2d94c1a8
+Revises: a3c81f2e9d57
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e7b2d94c1a8'
+down_revision: Union[str, None] = 'a3c81f2e9d57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Refresh tokens live in Redis token families, run this once no worker of the older code selects the column.
+    op.drop_column('users', 'refresh_token')
+
+
+def downgrade() -> None:
+    op.add_column('users', sa.Column('refresh_token', sa.String(length=255), nullable=True))
@@ -0,0 +1,26 @@
+"""contacts keyset index
+
+Revision ID: 6c45bf7ffa69
+Revises: cebbaf8467f7
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6c45bf7ffa69'
+down_revision: Union[str, None] = 'cebbaf8467f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_id', table_name='contacts')
@@ -0,0 +1,34 @@
+"""contact counts
+
+Revision ID: a3c81f2e9d57
+Revises: ddf1df54eecf
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c81f2e9d57'
+down_revision: Union[str, None] = 'ddf1df54eecf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('contact_counts',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Code before this revision does not maintain the counters, stop it writing contacts before the backfill.
+    op.execute("INSERT INTO contact_counts (user_id, count) "
+               "SELECT user_id, COUNT(*) FROM contacts WHERE user_id IS NOT NULL GROUP BY user_id")
+
+
+def downgrade() -> None:
+    op.drop_table('contact_counts')
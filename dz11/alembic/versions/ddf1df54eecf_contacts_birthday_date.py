@@ -0,0 +1,45 @@
+"""contacts birthday date
+
+Revision ID: ddf1df54eecf
+Revises: 49c245383e11
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ddf1df54eecf'
+down_revision: Union[str, None] = '49c245383e11'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Birthdays were stored as 'DD.MM.YYYY' strings.
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("ALTER TABLE contacts ALTER COLUMN birthday TYPE date USING to_date(birthday, 'DD.MM.YYYY')")
+        op.add_column('contacts', sa.Column('birthday_md', sa.SmallInteger(), nullable=True))
+        op.execute("UPDATE contacts SET birthday_md = EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday)")
+    else:
+        # SQLite keeps dates as ISO strings, rewriting the values is enough, a CAST to DATE would mangle them.
+        op.execute("UPDATE contacts SET birthday = substr(birthday, 7, 4) || '-' || substr(birthday, 4, 2) || '-' || substr(birthday, 1, 2) "
+                   "WHERE birthday LIKE '__.__.____'")
+        op.add_column('contacts', sa.Column('birthday_md', sa.SmallInteger(), nullable=True))
+        op.execute("UPDATE contacts SET birthday_md = CAST(strftime('%m', birthday) AS INTEGER) * 100 + CAST(strftime('%d', birthday) AS INTEGER)")
+
+    op.create_index('ix_contacts_user_id_birthday_md', 'contacts', ['user_id', 'birthday_md'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birthday_md', table_name='contacts')
+
+    if op.get_bind().dialect.name == "postgresql":
+        op.drop_column('contacts', 'birthday_md')
+        op.execute("ALTER TABLE contacts ALTER COLUMN birthday TYPE varchar(30) USING to_char(birthday, 'DD.MM.YYYY')")
+    else:
+        op.drop_column('contacts', 'birthday_md')
+        op.execute("UPDATE contacts SET birthday = substr(birthday, 9, 2) || '.' || substr(birthday, 6, 2) || '.' || substr(birthday, 1, 4)")
@@ -1,49 +1,74 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, Request, status
-from fastapi.responses import JSONResponse, HTMLResponse
-from fastapi_limiter import FastAPILimiter
+from fastapi.responses import JSONResponse, HTMLResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.cors import CORSMiddleware
 
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.database.db import get_db
+from src.database.db import get_db, sessonmanager
+from src.database.models import Role
 from src.routes import contacts as contacts_routes
 from src.routes import auth as auth_routes
 from src.routes import users as users_routes
+from src.services.auth import auth_service
+from src.services.avatars import avatar_processor
+from src.services.banlist import ban_list
+from src.services.email import email_outbox
+from src.services.logger import log_pipeline
+from src.services.metrics import metrics, MetricsMiddleware, redis_collector
+from src.services.profiler import query_profiler, QueryProfilerMiddleware
+from src.services.ratelimit import rate_limiter
+from src.services.refresh_tokens import refresh_tokens
+from src.services.roles import RoleAccess
+from src.services.versions import contact_versions
 from src.conf.config import config
 
-import re
-from ipaddress import ip_address
+import logging
 from typing import Callable
 from pathlib import Path
 import redis.asyncio as redis
 
 
+logger = logging.getLogger(__name__)
+
+
 # app = FastAPI()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup event
+    log_pipeline.start()
     r = await redis.Redis(
-        host=config.REDIS_HOST,
+        host=config.REDIS_DOMAIN,
         port=config.REDIS_PORT,
         password=config.REDIS_PASSWORD,
         db=0,
     )
     
-    await FastAPILimiter.init(r)
+    auth_service.cache.init(r)
+    email_outbox.init(r)
+    refresh_tokens.init(r)
+    contact_versions.init(r)
+    sessonmanager.init(r)
+    auth_service.hasher.start()
+    avatar_processor.executor.start()
+    await ban_list.start(r)
+    await rate_limiter.start(r)
+    metrics.add_collector(redis_collector(r))
+    await metrics.start()
     yield
+    await metrics.stop()
+    await rate_limiter.stop()
+    await ban_list.stop()
+    avatar_processor.executor.shutdown()
+    auth_service.hasher.shutdown()
+    await sessonmanager.close()
+    log_pipeline.stop()
 
 
 app = FastAPI(lifespan=lifespan)
 
-banned_ips = [
-    ip_address("192.168.1.1"),
-    ip_address("192.168.1.2"),
-    ip_address("127.0.0.1"),
-]
-
 origins = [ 
     "http://localhost:3000"
     ]
@@ -57,28 +82,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-user_agent_ban_list = [r"Googlebot", r"Python-urllib"]
-
 
-@app.add_middleware("http")
+@app.middleware("http")
 async def user_ban_middleware(request: Request, call_next: Callable):
     
-    print(request.headers.get("Authorization"))
+    """
+    The user_ban_middleware function rejects requests from banned addresses and user agents.
+    The rules are precompiled by the ban list and reloaded from Redis in the background.
+    
+    :param request: Request: The incoming request
+    :param call_next: Callable: The next handler
+    :return: A 403 response for banned clients, otherwise the response of the route
+    :doc-author: Trelent
+    """
     
+    host = request.client.host if request.client else None
     user_agent = request.headers.get("user-agent")
-    print(user_agent)
-
-    for ban_pattern in user_agent_ban_list:
-        if re.search(ban_pattern, user_agent):
-            return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": "You are banned"},)
+    if ban_list.is_banned(host, user_agent):
+        logger.info("request banned", extra={"event": "request_banned", "client": host, "user_agent": user_agent,
+                                             "path": request.url.path})
+        return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": "You are banned"},)
     
     response = await call_next(request)
     
     return response
 
 
+if config.PROFILER_ENABLED:
+    query_profiler.install()
+    app.add_middleware(QueryProfilerMiddleware, profiler=query_profiler)
+
+app.add_middleware(MetricsMiddleware, registry=metrics)
+
+
 BASE_DIR = Path(".")
 # app.mount("/static", StaticFiles(directory=BASE_DIR / "src" / "static"), name="static")
+if config.STORAGE_BACKEND == "local":
+    Path(config.STORAGE_LOCAL_DIR).mkdir(parents=True, exist_ok=True)
+    app.mount(config.STORAGE_BASE_URL, StaticFiles(directory=config.STORAGE_LOCAL_DIR), name="media")
 
 app.include_router(auth_routes.router, prefix="/api")
 app.include_router(users_routes.router, prefix="/api")
@@ -143,5 +184,36 @@ async def healthchecker(db: AsyncSession = Depends(get_db)):
             raise HTTPException(status_code=500, detail="Database is not configured correctly")
         return {"message": "Welcome to FastAPI!"}
     except Exception as err:
-        print (err)
-        raise HTTPException(status_code=500, detail="Error connecting to the database") 
\ No newline at end of file
+        logger.error("database health check failed", exc_info=err)
+        raise HTTPException(status_code=500, detail="Error connecting to the database") 
+
+
+access_to_pool_stats = RoleAccess([Role.admin])
+
+
+@app.get("/api/healthchecker/pool", dependencies=[Depends(access_to_pool_stats)])
+async def pool_stats():
+    
+    """
+    The pool_stats function returns the live state of the database connection pool of this worker:
+    checked out connections, overflow, checkout wait time and timeouts. Only admins may read it.
+    
+    :return: A dictionary with the pool statistics
+    :doc-author: Trelent
+    """
+    
+    return sessonmanager.pool_stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics_endpoint():
+    
+    """
+    The metrics_endpoint function exposes request, pool and service metrics in the Prometheus text format.
+    Values of the other workers are read from the snapshots they write to METRICS_DIR every METRICS_FLUSH_SECONDS.
+    
+    :return: The metrics as plain text
+    :doc-author: Trelent
+    """
+    
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,13 +1,248 @@
+import asyncio
 import contextlib
+import logging
+import random
+import time
+
+import redis.asyncio as redis
+from sqlalchemy import event, exc as sa_exc
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker,create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.sql import Executable
 from src.conf.config import config
 
 
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    
+    """
+    The InstrumentedPool is the default SQLAlchemy async pool that also counts how long
+    a checkout waited for a connection and how many checkouts timed out.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.stats.checkouts += 1
+            self.stats.wait_seconds += waited
+            self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+            
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def create_engine(url: str) -> AsyncEngine:
+    
+    """
+    The create_engine function creates an async engine with the pool settings from the config.
+    In-memory SQLite databases keep the SQLAlchemy default pool, every connection there is a separate database.
+    
+    :param url: str: Database url
+    :return: An AsyncEngine
+    :doc-author: Trelent
+    """
+    
+    if ":memory:" in url:
+        return create_async_engine(url)
+    
+    connect_args = {}
+    if url.startswith("postgresql+asyncpg"):
+        connect_args = {"statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+                        "prepared_statement_cache_size": config.DB_STATEMENT_CACHE_SIZE}
+    
+    return create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+def read_only(stmt):
+    
+    """
+    The read_only function marks a SELECT as safe to run on a read replica.
+    
+    :param stmt: The statement to mark
+    :return: The marked statement
+    :doc-author: Trelent
+    """
+    
+    return stmt.execution_options(replica=True)
+
+
+def use_primary(db: AsyncSession) -> None:
+    
+    """
+    The use_primary function sends the marked reads of the rest of the session to the primary.
+    It is used when the rows are tagged with a version kept outside the database, e.g. the ETag of the contacts,
+    a lagging replica could otherwise serve old rows under the new version.
+    
+    :param db: AsyncSession: The session of the request
+    :return: None
+    :doc-author: Trelent
+    """
+    
+    db.info["primary"] = True
+
+
+class RoutingSession(Session):
+    
+    """
+    The RoutingSession sends statements marked with read_only() to a random replica and everything else to the primary.
+    After the session writes, and for DB_READ_YOUR_WRITES_SECONDS after a commit by the same user
+    (session.info["user_id"], set by DatabaseSessionManager.attach_user), marked reads go to the primary as well,
+    as do all reads of a session pinned with use_primary().
+    """
+    
+    def __init__(self, *args, manager: "DatabaseSessionManager" = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.manager = manager
+        
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        manager = self.manager
+        if manager is None or not manager.replicas:
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        
+        if isinstance(clause, Executable) and not self._flushing and clause.get_execution_options().get("replica"):
+            if (not self.info.get("wrote") and not self.info.get("primary") and not self.info.get("recent_write")
+                    and not manager.recent_write(self.info.get("user_id"))):
+                return random.choice(manager.replicas).sync_engine
+        elif self._flushing or getattr(clause, "is_dml", False):
+            self.info["wrote"] = True
+        
+        return manager.engine.sync_engine
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def remember_write(session: RoutingSession):
+    if session.info.pop("wrote", False) and session.manager is not None:
+        session.manager.mark_write(session.info.get("user_id"))
+
+
 class DatabaseSessionManager:
-    def __init__(self, url:str):
-        self._engine: AsyncEngine | None = create_async_engine(url)
+    recent_prefix = "db:recent_write:"
+    
+    def __init__(self, url:str, replica_urls: list[str] | None = None):
+        self._engine: AsyncEngine | None = create_engine(url)
+        self.replicas: list[AsyncEngine] = [create_engine(replica_url) for replica_url in replica_urls or []]
+        self.redis: redis.Redis | None = None
+        self._recent_writes: dict[int, float] = {}
+        self._marking: set[asyncio.Task] = set()
         # self.session_maker: async_sessionmaker = async_sessionmaker(autoflush=False, autocommit=False, bind=self._engine)
-        self._session_maker: async_sessionmaker | None = async_sessionmaker(autocommit=False, autoflush=False, bind=self._engine)
+        self._session_maker: async_sessionmaker | None = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=self._engine,
+                                                                            sync_session_class=RoutingSession, manager=self)
+        
+    @property
+    def engine(self) -> AsyncEngine:
+        return self._engine
+    
+    def init(self, r: redis.Redis) -> None:
+        
+        """
+        The init function attaches the Redis client created in the application lifespan.
+        With it the recent writes of a user are seen by every worker, without it only by the one that wrote.
+        
+        :param self: Represent the instance of the class
+        :param r: redis.Redis: Redis client
+        :return: None
+        :doc-author: Trelent
+        """
+        
+        self.redis = r
+    
+    def recent_key(self, user_id: int) -> str:
+        return f"{self.recent_prefix}{user_id}"
+    
+    def mark_write(self, user_id: int | None) -> None:
+        
+        """
+        The mark_write function remembers that the user just committed a write, so their reads stay on the primary
+        until the replicas have caught up. It is called from the after_commit event, so the Redis key with
+        a TTL of DB_READ_YOUR_WRITES_SECONDS is set in a background task; the in-process window is kept as well
+        and is all there is when Redis is not attached or not reachable.
+        
+        :param self: Represent the instance of the class
+        :param user_id: int | None: The user who wrote, None when unknown
+        :return: None
+        :doc-author: Trelent
+        """
+        
+        if user_id is None or not self.replicas:
+            return
+        
+        now = time.monotonic()
+        self._recent_writes[user_id] = now
+        
+        if len(self._recent_writes) > 10000:
+            window = config.DB_READ_YOUR_WRITES_SECONDS
+            self._recent_writes = {key: at for key, at in self._recent_writes.items() if now - at < window}
+        
+        if self.redis is not None:
+            task = asyncio.get_running_loop().create_task(self._mark_remote(user_id))
+            self._marking.add(task)
+            task.add_done_callback(self._marking.discard)
+    
+    async def _mark_remote(self, user_id: int) -> None:
+        try:
+            await self.redis.set(self.recent_key(user_id), 1, px=int(config.DB_READ_YOUR_WRITES_SECONDS * 1000))
+        except redis.RedisError as err:
+            logger.warning("recent write not shared", extra={"user_id": user_id}, exc_info=err)
+    
+    def recent_write(self, user_id: int | None) -> bool:
+        at = self._recent_writes.get(user_id)
+        return at is not None and time.monotonic() - at < config.DB_READ_YOUR_WRITES_SECONDS
+    
+    async def attach_user(self, db: AsyncSession, user_id: int) -> None:
+        
+        """
+        The attach_user function tells the session of a request whose it is. When the user committed a write
+        within DB_READ_YOUR_WRITES_SECONDS on any worker, as recorded in Redis, the marked reads of the session
+        go to the primary. If Redis can not be reached only the in-process window of this worker is used.
+        
+        :param self: Represent the instance of the class
+        :param db: AsyncSession: The session of the request
+        :param user_id: int: Id of the current user
+        :return: None
+        :doc-author: Trelent
+        """
+        
+        db.info["user_id"] = user_id
+        if self.redis is None or not self.replicas or self.recent_write(user_id):
+            return
+        
+        try:
+            if await self.redis.exists(self.recent_key(user_id)):
+                db.info["recent_write"] = True
+        except redis.RedisError:
+            pass
         
     @contextlib.asynccontextmanager
     async def session(self):
@@ -21,17 +256,77 @@ class DatabaseSessionManager:
             yield session
             
         except Exception as err:
-            print(err)
+            if isinstance(err, sa_exc.SQLAlchemyError):
+                logger.error("database error, session rolled back", exc_info=err)
             
             await session.rollback()
+            raise
             
         finally:
             await session.close()
             
+    async def close(self):
+        
+        """
+        The close function closes every pooled connection, it is called when the application stops.
+        
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        
+        if self._engine is not None:
+            await self._engine.dispose()
+        
+        for replica in self.replicas:
+            await replica.dispose()
+            
+    def pool_stats(self) -> dict:
+        
+        """
+        The pool_stats function reports the live state of the connection pools of this worker.
+        
+        :param self: Represent the instance of the class
+        :return: A dict with the stats of the primary pool and a list with the stats of the replica pools
+        :doc-author: Trelent
+        """
+        
+        return {"primary": self.engine_stats(self._engine), "replicas": [self.engine_stats(replica) for replica in self.replicas]}
+    
+    @staticmethod
+    def engine_stats(engine: AsyncEngine) -> dict:
+        
+        """
+        The engine_stats function reports the pool size, checked out connections, overflow, wait time and timeouts of an engine.
+        
+        :param engine: AsyncEngine: The engine to report on
+        :return: A dict with the pool statistics
+        :doc-author: Trelent
+        """
+        
+        pool = engine.pool
+        stats = {"pool": type(pool).__name__}
+        
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            stats.update(size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(), overflow=pool.overflow(),
+                         max_overflow=pool._max_overflow, timeout=pool.timeout())
+        
+        if isinstance(pool, InstrumentedPool):
+            checkouts = pool.stats.checkouts
+            stats.update(checkouts=checkouts, timeouts=pool.stats.timeouts,
+                         avg_wait_seconds=pool.stats.wait_seconds / checkouts if checkouts else 0.0,
+                         max_wait_seconds=pool.stats.max_wait_seconds)
+        
+        return stats
+            
+
+sessonmanager = DatabaseSessionManager(config.DB_URL, config.DB_REPLICA_URLS)
+
 
-sessonmanager = DatabaseSessionManager(config.DB_URL)
+def dialect_name(db: AsyncSession) -> str:
+    return db.get_bind().dialect.name
 
 
 async def get_db():
     async with sessonmanager.session() as session:
-        yield session
\ No newline at end of file
+        yield session
@@ -1,8 +1,8 @@
 import enum
 from datetime import date
 
-from sqlalchemy import Boolean, String, Integer,ForeignKey, DateTime, func, Enum
-from sqlalchemy.orm import Mapped, DeclarativeBase, mapped_column, relationship 
+from sqlalchemy import Boolean, String, Integer,ForeignKey, DateTime, func, Enum, Index, Date, SmallInteger
+from sqlalchemy.orm import Mapped, DeclarativeBase, mapped_column, relationship, validates
 
 class Base(DeclarativeBase):
     pass
@@ -13,7 +13,7 @@ class Role(enum.Enum):
     user:str = "user"
     
     
-class User():
+class User(Base):
 
     __tablename__ = "users"
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -21,26 +21,44 @@ class User():
     email: Mapped[str] = mapped_column(String(150), nullable=False, unique=True)
     password: Mapped[str] = mapped_column(String(255), nullable=False)
     avatar: Mapped[str] = mapped_column(String(255), nullable=True)
-    refresh_token: Mapped[str] = mapped_column(String(255), nullable=True)
     created_at: Mapped[date] = mapped_column("created_at", DateTime, default=func.now())
     updated_at: Mapped[date] = mapped_column("updated_at", DateTime, default=func.now(), onupdate=func.now())
     role: Mapped[Enum] = mapped_column("role", Enum(Role), default=Role.user, nullable=True)
     confirmed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=True)
     
 
+def birthday_key(birthday: date) -> int:
+    return birthday.month * 100 + birthday.day
+
+
 class Contact(Base):
     
     __tablename__ = "contacts"
+    __table_args__ = (Index("ix_contacts_user_id_id", "user_id", "id"),
+                      Index("ix_contacts_user_id_birthday_md", "user_id", "birthday_md"),)
     id: Mapped[int] = mapped_column(primary_key=True)
     first_name: Mapped[str] = mapped_column(String(150))
     last_name: Mapped[str] = mapped_column(String(150), unique=True, index=True)
     email: Mapped[str] = mapped_column(String(150))
     phone_number: Mapped[str] = mapped_column(String(30))
-    birthday: Mapped[str] = mapped_column(String(30))
+    birthday: Mapped[date] = mapped_column(Date)
+    birthday_md: Mapped[int] = mapped_column(SmallInteger, nullable=True)
     data: Mapped[bool] = mapped_column(default=False, nullable=True)
 
     created_at: Mapped[date] = mapped_column("created_at", DateTime, default=func.now(), nullable=True)
     updated_at: Mapped[date] = mapped_column("updated_at", DateTime, default=func.now(), onupdate=func.now(), nullable=True)
 
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=True)
-    user: Mapped["User"] = relationship("User", backref="contacts", lazy="joined")
\ No newline at end of file
+    user: Mapped["User"] = relationship("User", backref="contacts", lazy="joined")
+
+    @validates("birthday")
+    def validate_birthday(self, key, value):
+        self.birthday_md = birthday_key(value) if isinstance(value, date) else None
+        return value
+
+
+class ContactCount(Base):
+    
+    __tablename__ = "contact_counts"
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
@@ -1,49 +1,274 @@
-from sqlalchemy import select
+from datetime import date, timedelta
+
+from sqlalchemy import select, insert, update, delete, func, or_, case, true, literal_column, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.database.models import Contact, User
-from src.schemas.contacts import ContactSchema, ContactUpdateSchema
+from sqlalchemy.orm import raiseload
+from sqlalchemy.orm.attributes import set_committed_value
+from src.database.db import dialect_name, read_only
+from src.database.models import Contact, ContactCount, User, birthday_key
+from src.schemas.contacts import ContactSchema, ContactUpdateSchema, ContactPatchSchema
+from src.services.versions import contact_versions
 
 
-async def get_contacts(limit: int, offset: int, db: AsyncSession, user: User):
+def select_contacts(columns: tuple[str, ...] | None = None, owner: bool = False):
     
     """
-    The get_contacts function returns a list of contacts for the user.
-        
+    The select_contacts function starts a SELECT of whole contacts or of the given columns only.
+        Lists send user_id instead of the owner, so whole contacts are loaded without the users join
+        (and the password hash of the owner) unless owner is True, touching contact.user then raises instead of querying.
+    
+    :param columns: tuple[str, ...] | None: Names of the Contact columns, None for whole contacts
+    :param owner: bool: Join the owner through Contact.user, for responses with the nested user
+    :return: A select statement
+    :doc-author: Trelent
+    """
+    
+    if columns is None:
+        sq = select(Contact)
+        return sq if owner else sq.options(raiseload(Contact.user))
+    
+    return select(*[getattr(Contact, column) for column in columns])
+
+
+def fetch_contacts(result, columns: tuple[str, ...] | None = None) -> list:
+    return result.scalars().all() if columns is None else result.all()
+
+
+async def change_count(user_id: int, delta: int, db: AsyncSession) -> None:
+    
+    """
+    The change_count function adds delta to the contact counter of the user with one upsert.
+        It runs in the transaction of the change it counts, so the counter is committed or rolled back with it.
+    
+    :param user_id: int: The owner of the contacts
+    :param delta: int: Number of contacts added, negative for removed ones
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    :doc-author: Trelent
+    """
+    
+    if not delta:
+        return
+    
+    dialects = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+    
+    if dialect_name(db) in dialects:
+        stmt = (dialects[dialect_name(db)](ContactCount)
+                .values(user_id=user_id, count=delta)
+                .on_conflict_do_update(index_elements=[ContactCount.user_id], set_={"count": ContactCount.count + delta}))
+        await db.execute(stmt)
+    else:
+        result = await db.execute(update(ContactCount).where(ContactCount.user_id == user_id)
+                                  .values(count=ContactCount.count + delta))
+        if result.rowcount == 0:
+            await db.execute(insert(ContactCount).values(user_id=user_id, count=delta))
+
+
+async def count_contacts(db: AsyncSession, user: User) -> int:
+    
+    """
+    The count_contacts function returns the number of contacts of the user from the maintained counter,
+        a primary key lookup instead of a COUNT(*) over the contacts.
+    
+    :param db: AsyncSession: Pass the database session to the function
+    :param user: User: The owner of the contacts
+    :return: The number of contacts
+    :doc-author: Trelent
+    """
+    
+    sq = select(ContactCount.count).where(ContactCount.user_id == user.id)
+    
+    count = (await db.execute(read_only(sq))).scalar_one_or_none()
+    return count or 0
+
+
+async def estimate_all_contacts(db: AsyncSession) -> tuple[int, bool]:
+    
+    """
+    The estimate_all_contacts function returns the number of all contacts without counting them.
+        On Postgres it reads the row estimate the planner keeps in pg_class, which is refreshed by (auto)vacuum and analyze.
+        Before the table was ever analyzed, and on other databases, the per-user counters are added up.
+    
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The number of contacts and whether it is an estimate
+    :doc-author: Trelent
+    """
+    
+    if dialect_name(db) == "postgresql":
+        sq = text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'contacts'::regclass")
+        estimate = (await db.execute(read_only(sq))).scalar_one_or_none()
+        if estimate is not None and estimate >= 0:
+            return estimate, True
+    
+    total = (await db.execute(read_only(select(func.coalesce(func.sum(ContactCount.count), 0))))).scalar_one()
+    return total, False
+
+
+async def get_contacts(limit: int, offset: int, db: AsyncSession, user: User, after_id: int | None = None,
+                       columns: tuple[str, ...] | None = None):
+    
+    """
+    The get_contacts function returns a list of contacts for the user ordered by id.
+        When after_id is given the page starts right after that contact (keyset pagination),
+        the (user_id, id) index makes such a page cost O(limit) however deep it is.
     
     :param limit: int: Limit the number of contacts returned
-    :param offset: int: Skip the first n records
+    :param offset: int: Skip the first n records, ignored when after_id is given
     :param db: AsyncSession: Pass a database connection to the function
     :param user: User: Filter the contacts by user
+    :param after_id: int | None: Id of the last contact of the previous page
+    :param columns: tuple[str, ...] | None: Select only these columns, the rows are returned instead of contacts
     :return: A list of contacts
     :doc-author: Trelent
     """
     
-    sq = select(Contact).filter_by(user=user).offset(offset).limit(limit)
+    sq = select_contacts(columns).where(Contact.user_id == user.id).order_by(Contact.id).limit(limit)
+    if after_id is not None:
+        sq = sq.where(Contact.id > after_id)
+    else:
+        sq = sq.offset(offset)
     
-    contacts = await db.execute(sq)
-    return contacts.scalar().all()
+    contacts = await db.execute(read_only(sq))
+    return fetch_contacts(contacts, columns)
 
 
-async def get_all_contacts(limit: int, offset: int, db: AsyncSession):
+async def get_all_contacts(limit: int, offset: int, db: AsyncSession, after_id: int | None = None,
+                           columns: tuple[str, ...] | None = None):
     
     """
-    The get_all_contacts function returns a list of all contacts in the database.
-        
+    The get_all_contacts function returns a list of all contacts in the database ordered by id.
+        When after_id is given the page starts right after that contact (keyset pagination).
     
     :param limit: int: Limit the number of contacts returned
-    :param offset: int: Skip the first n rows of data
+    :param offset: int: Skip the first n rows of data, ignored when after_id is given
     :param db: AsyncSession: Pass in the database session to the function
+    :param after_id: int | None: Id of the last contact of the previous page
+    :param columns: tuple[str, ...] | None: Select only these columns, the rows are returned instead of contacts
     :return: A list of contact objects
     :doc-author: Trelent
     """
     
-    sq = select(Contact).offset(offset).limit(limit)
+    sq = select_contacts(columns).order_by(Contact.id).limit(limit)
+    if after_id is not None:
+        sq = sq.where(Contact.id > after_id)
+    else:
+        sq = sq.offset(offset)
+    
+    contacts = await db.execute(read_only(sq))
+    return fetch_contacts(contacts, columns)
+    
+
+def search_text():
+    
+    """
+    The search_text function builds first_name || ' ' || last_name || ' ' || email || ' ' || phone_number.
+    The separators are inlined literals so the expression matches the search indexes created by the migration.
+    
+    :return: A SQL expression
+    :doc-author: Trelent
+    """
+    
+    space = literal_column("' '")
+    
+    return Contact.first_name + space + Contact.last_name + space + Contact.email + space + Contact.phone_number
+
+
+async def search_contacts(q: str, limit: int, db: AsyncSession, user: User):
+    
+    """
+    The search_contacts function finds the contacts of the user matching q in any name, email or phone field.
+        On Postgres full-text matches and trigram word similarity (which tolerates typos) are combined
+        and served by the GIN indexes on search_text(). Other databases (SQLite in tests) fall back
+        to a case-insensitive substring match without ranking or typo tolerance.
+    
+    :param q: str: The search query
+    :param limit: int: Limit the number of contacts returned
+    :param db: AsyncSession: Pass the database session to the function
+    :param user: User: Filter the contacts by user
+    :return: A list of contacts, best match first
+    :doc-author: Trelent
+    """
+    
+    if dialect_name(db) == "postgresql":
+        text = search_text()
+        document = func.to_tsvector(literal_column("'simple'"), text)
+        query = func.websearch_to_tsquery(literal_column("'simple'"), q)
+        rank = func.ts_rank(document, query) + func.word_similarity(q, text)
+        
+        sq = (select_contacts()
+              .where(Contact.user_id == user.id, or_(document.op("@@")(query), text.op("%>")(q)))
+              .order_by(rank.desc(), Contact.id)
+              .limit(limit))
+    else:
+        columns = (Contact.first_name, Contact.last_name, Contact.email, Contact.phone_number)
+        
+        sq = (select_contacts()
+              .where(Contact.user_id == user.id, or_(*[column.icontains(q, autoescape=True) for column in columns]))
+              .order_by(Contact.id)
+              .limit(limit))
+    
+    contacts = await db.execute(read_only(sq))
+    return contacts.scalars().all()
+    
+
+async def get_upcoming_birthdays(days: int, db: AsyncSession, user: User, today: date | None = None):
+    
+    """
+    The get_upcoming_birthdays function returns the contacts of the user whose birthday is within the next days days.
+        Birthdays are matched on the indexed month*100+day key, a range crossing the new year becomes
+        two open ranges in the same query.
+    
+    :param days: int: How many days ahead to look, today included
+    :param db: AsyncSession: Pass the database session to the function
+    :param user: User: Filter the contacts by user
+    :param today: date | None: The first day of the range, defaults to today
+    :return: A list of contacts ordered by the next birthday
+    :doc-author: Trelent
+    """
+    
+    today = today or date.today()
+    start = birthday_key(today)
+    end = birthday_key(today + timedelta(days=days))
+    
+    if days >= 365:
+        in_range = true()
+    elif start <= end:
+        in_range = Contact.birthday_md.between(start, end)
+    else:
+        in_range = or_(Contact.birthday_md >= start, Contact.birthday_md <= end)
+    
+    sq = (select_contacts()
+          .where(Contact.user_id == user.id, in_range)
+          .order_by(case((Contact.birthday_md >= start, 0), else_=1), Contact.birthday_md, Contact.id))
+    
+    contacts = await db.execute(read_only(sq))
+    return contacts.scalars().all()
+    
+
+async def stream_contacts(fields: list[str], db: AsyncSession, user_id: int | None = None):
+    
+    """
+    The stream_contacts function yields the selected columns of the contacts row by row from a server-side cursor.
+    
+    :param fields: list[str]: Names of the Contact columns to select
+    :param db: AsyncSession: Pass the database session to the function
+    :param user_id: int | None: Filter the contacts by owner, None for every contact
+    :return: An async iterator of row tuples
+    :doc-author: Trelent
+    """
+    
+    sq = select(*[getattr(Contact, field) for field in fields]).order_by(Contact.id).execution_options(yield_per=1000)
+    if user_id is not None:
+        sq = sq.where(Contact.user_id == user_id)
     
-    contacts = await db.execute(sq)
-    return contacts.scalar().all()
+    result = await db.stream(read_only(sq))
+    async for row in result:
+        yield row
     
 
-async def get_contact(contact_id: int, db: AsyncSession, user: User):
+async def get_contact(contact_id: int, db: AsyncSession, user: User, columns: tuple[str, ...] | None = None):
     
     """
     The get_contact function returns a contact object from the database.
@@ -51,20 +276,21 @@ async def get_contact(contact_id: int, db: AsyncSession, user: User):
     :param contact_id: int: Filter the query by contact id
     :param db: AsyncSession: Pass in the database session
     :param user: User: Filter the contacts by user
+    :param columns: tuple[str, ...] | None: Select only these columns, the row is returned instead of the contact
     :return: A contact object
     :doc-author: Trelent
     """
     
-    sq = select(Contact).filter_by(id=contact_id, user=User)
+    sq = select_contacts(columns, owner=True).where(Contact.id == contact_id, Contact.user_id == user.id)
     
-    contact = await db.execute(sq)
-    return contact.scalar_one_or_none()
+    contact = await db.execute(read_only(sq))
+    return contact.scalar_one_or_none() if columns is None else contact.one_or_none()
     
 
 async def create_todo(body: ContactSchema, db: AsyncSession, user: User):
     
     """
-    The create_todo function creates a new todo item.
+    The create_todo function creates a new todo item with a single INSERT ... RETURNING.
     
     :param body: ContactSchema: Validate the request body
     :param db: AsyncSession: Pass the database connection to the function
@@ -73,46 +299,93 @@ async def create_todo(body: ContactSchema, db: AsyncSession, user: User):
     :doc-author: Trelent
     """
     
-    contact = Contact(**body.model_dump(exclude_unset=True), user=user)
-    db.add(contact)
+    values = body.model_dump(exclude_unset=True)
+    values["birthday_md"] = birthday_key(body.birthday)
+    
+    sq = insert(Contact).values(**values, user_id=user.id).returning(Contact)
+    
+    contact = (await db.execute(sq)).scalar_one()
+    set_committed_value(contact, "user", user)
+    await change_count(user.id, 1, db)
     await db.commit()
-    await db.refresh(contact)
+    await contact_versions.bump(user.id)
     
     return contact
 
 
-async def update_contact(contact_id: int, body: ContactUpdateSchema, db: AsyncSession, user: User):
+async def insert_contacts(rows: list[dict], db: AsyncSession, user: User) -> list[tuple[int, str]]:
+    
+    """
+    The insert_contacts function inserts a batch of validated contacts with one multi-row INSERT and commits it.
+        If the batch violates a constraint, the rows are retried one by one in savepoints
+        so that only the offending rows are rejected.
     
+    :param rows: list[dict]: Contacts as dumped from ContactSchema
+    :param db: AsyncSession: Pass the database session to the function
+    :param user: User: The owner of the new contacts
+    :return: A list of (position in rows, error) for the rows that were not inserted
+    :doc-author: Trelent
     """
-    The update_contact function updates a contact in the database.
+    
+    values = [{**row, "user_id": user.id, "birthday_md": birthday_key(row["birthday"])} for row in rows]
+    failed = []
+    
+    try:
+        async with db.begin_nested():
+            await db.execute(insert(Contact), values)
+    except IntegrityError:
+        for index, row in enumerate(values):
+            try:
+                async with db.begin_nested():
+                    await db.execute(insert(Contact), [row])
+            except IntegrityError as err:
+                failed.append((index, str(err.orig)))
+    
+    await change_count(user.id, len(values) - len(failed), db)
+    await db.commit()
+    if len(failed) < len(values):
+        await contact_versions.bump(user.id)
+    
+    return failed
+
+
+async def update_contact(contact_id: int, body: ContactUpdateSchema | ContactPatchSchema, db: AsyncSession, user: User):
+    
+    """
+    The update_contact function updates a contact in the database with a single UPDATE ... RETURNING.
+        Ownership is checked in the WHERE clause, only the fields set in the body are written and updated_at is bumped.
     
     :param contact_id: int: Identify the contact that we want to update
-    :param body: ContactUpdateSchema: Validate the request body
+    :param body: ContactUpdateSchema | ContactPatchSchema: Validate the request body
     :param db: AsyncSession: Pass a database session to the function
     :param user: User: Get the user from the request
-    :return: A contact
+    :return: A contact or None if the user has no such contact
     :doc-author: Trelent
     """
-    sq = select(Contact).filter_by(id=contact_id, user=user)
+    
+    values = body.model_dump(exclude_unset=True, exclude={"id"})
+    if values.get("birthday") is not None:
+        values["birthday_md"] = birthday_key(values["birthday"])
+    
+    sq = (update(Contact)
+          .where(Contact.id == contact_id, Contact.user_id == user.id)
+          .values(**values, updated_at=func.now())
+          .returning(Contact)
+          .execution_options(populate_existing=True))
        
     upcontact = await db.execute(sq)
     contact = upcontact.scalar_one_or_none()
     if contact:
-        contact.first_name = body.first_name
-        contact.last_name = body.last_name
-        contact.email = body.email
-        contact.phone_number = body.phone_number
-        contact.birthday = body.birthday
-        contact.data = body.data
+        set_committed_value(contact, "user", user)
         await db.commit()
-        await db.refresh(contact)
+        await contact_versions.bump(user.id)
     
     return contact
 
 async def remove_contact(contact_id: int, db: AsyncSession, user: User):
     
     """
-    The remove_contact function removes a contact from the database.
+    The remove_contact function removes a contact from the database with a single DELETE ... RETURNING.
     
     :param contact_id: int: Specify which contact to remove
     :param db: AsyncSession: Pass the database session to the function
@@ -120,12 +393,166 @@ async def remove_contact(contact_id: int, db: AsyncSession, user: User):
     :return: A contact object if the contact was found and deleted, or none if it wasn't
     :doc-author: Trelent
     """
-    sq = select(Contact).filter_by(id=contact_id, user=user)
+    sq = delete(Contact).where(Contact.id == contact_id, Contact.user_id == user.id).returning(Contact)
        
     remcontact = await db.execute(sq)
     contact = remcontact.scalar_one_or_none()
     if contact:
-        await db.delete(contact)
+        set_committed_value(contact, "user", user)
+        await change_count(user.id, -1, db)
         await db.commit()
+        await contact_versions.bump(user.id)
         
-    return contact
\ No newline at end of file
+    return contact
+
+
+async def get_contacts_by_ids(ids: list[int], db: AsyncSession, user: User) -> dict[int, Contact]:
+    
+    """
+    The get_contacts_by_ids function loads the contacts of the user with the given ids in one query.
+    
+    :param ids: list[int]: Ids of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param user: User: Filter the contacts by user
+    :return: A dict of the found contacts keyed by id
+    :doc-author: Trelent
+    """
+    
+    sq = select(Contact).where(Contact.user_id == user.id, Contact.id.in_(ids)).execution_options(populate_existing=True)
+    
+    contacts = await db.execute(read_only(sq))
+    return {contact.id: contact for contact in contacts.scalars().all()}
+
+
+async def create_contacts(bodies: list[ContactSchema], db: AsyncSession, user: User) -> list[Contact | str]:
+    
+    """
+    The create_contacts function creates many contacts in one transaction.
+        The contacts are written with one multi-row INSERT ... ON CONFLICT (last_name) DO NOTHING RETURNING,
+        a last name taken in the table, also by a concurrent insert, or earlier in the batch is reported
+        for its item instead of failing the batch. The created contacts are loaded back with one SELECT.
+        Databases without ON CONFLICT insert row by row in savepoints.
+    
+    :param bodies: list[ContactSchema]: The new contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param user: User: The owner of the new contacts
+    :return: For every body the created contact or an error message
+    :doc-author: Trelent
+    """
+    
+    seen = set()
+    values = []
+    for body in bodies:
+        if body.last_name not in seen:
+            seen.add(body.last_name)
+            values.append({**body.model_dump(), "user_id": user.id, "birthday_md": birthday_key(body.birthday)})
+    
+    created: dict[str, int] = {}
+    dialects = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+    
+    if values and dialect_name(db) in dialects:
+        stmt = (dialects[dialect_name(db)](Contact)
+                .on_conflict_do_nothing(index_elements=[Contact.last_name])
+                .returning(Contact.id, Contact.last_name))
+        created = {last_name: contact_id for contact_id, last_name in (await db.execute(stmt, values)).all()}
+    else:
+        for row in values:
+            try:
+                async with db.begin_nested():
+                    created[row["last_name"]] = (await db.execute(insert(Contact).values(**row).returning(Contact.id))).scalar_one()
+            except IntegrityError:
+                pass
+    
+    contacts = {}
+    if created:
+        await change_count(user.id, len(created), db)
+        await db.commit()
+        await contact_versions.bump(user.id)
+        contacts = await get_contacts_by_ids(list(created.values()), db, user)
+    
+    results: list[Contact | str] = []
+    for body in bodies:
+        contact_id = created.pop(body.last_name, None)
+        results.append(contacts[contact_id] if contact_id is not None else "last_name already exists")
+    
+    return results
+
+
+async def update_contacts(items: list[ContactPatchSchema], db: AsyncSession, user: User) -> list[Contact | str | None]:
+    
+    """
+    The update_contacts function applies many partial updates in one transaction.
+        Ownership is checked with one query, the owned rows are updated with one executemany UPDATE by primary key
+        and loaded back with one SELECT. Only the fields sent for an item are changed.
+        New last names held by another contact, or by an earlier item of the batch, are found with one SELECT up front
+        and reported for their item. If the UPDATE still violates a constraint (a concurrent write),
+        the rows are retried one by one in savepoints so that only the offending items are rejected.
+    
+    :param items: list[ContactPatchSchema]: Contact id and the fields to change
+    :param db: AsyncSession: Pass the database session to the function
+    :param user: User: The owner of the contacts
+    :return: For every item the updated contact, an error message, or None if the user has no such contact
+    :doc-author: Trelent
+    """
+    
+    ids = [item.id for item in items]
+    owned = set((await db.execute(select(Contact.id).where(Contact.user_id == user.id, Contact.id.in_(ids)))).scalars().all())
+    
+    names = {item.last_name for item in items if item.id in owned and item.last_name is not None}
+    holders = dict((await db.execute(select(Contact.last_name, Contact.id).where(Contact.last_name.in_(names)))).all()) if names else {}
+    
+    errors: dict[int, str] = {}
+    values = []
+    for index, item in enumerate(items):
+        if item.id not in owned:
+            continue
+        row = item.model_dump(exclude_unset=True)
+        if "last_name" in row:
+            if holders.get(row["last_name"], item.id) != item.id:
+                errors[index] = "last_name already exists"
+                continue
+            holders[row["last_name"]] = item.id
+        if "birthday" in row:
+            row["birthday_md"] = birthday_key(row["birthday"])
+        values.append((index, row))
+    
+    if values:
+        try:
+            async with db.begin_nested():
+                await db.execute(update(Contact), [row for _, row in values])
+        except IntegrityError:
+            for index, row in values:
+                try:
+                    async with db.begin_nested():
+                        await db.execute(update(Contact), [row])
+                except IntegrityError as err:
+                    errors[index] = str(err.orig)
+        await db.commit()
+        await contact_versions.bump(user.id)
+    
+    contacts = await get_contacts_by_ids(list(owned), db, user) if owned else {}
+    
+    return [errors.get(index) or contacts.get(item.id) for index, item in enumerate(items)]
+
+
+async def remove_contacts(ids: list[int], db: AsyncSession, user: User) -> set[int]:
+    
+    """
+    The remove_contacts function deletes many contacts of the user with one DELETE ... RETURNING.
+    
+    :param ids: list[int]: Ids of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param user: User: The owner of the contacts
+    :return: The ids that were deleted
+    :doc-author: Trelent
+    """
+    
+    sq = delete(Contact).where(Contact.user_id == user.id, Contact.id.in_(ids)).returning(Contact.id)
+    
+    deleted = set((await db.execute(sq)).scalars().all())
+    await change_count(user.id, -len(deleted), db)
+    await db.commit()
+    if deleted:
+        await contact_versions.bump(user.id)
+    
+    return deleted
@@ -1,39 +1,52 @@
+import logging
+
 from fastapi import Depends
-from sqlalchemy import select
+from sqlalchemy import select, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from libgravatar import Gravatar
-from src.database.db import get_db
+from src.database.db import get_db, dialect_name, read_only
 from src.database.models import User
 from src.schemas.user import UserSchema
+from src.services.cache import user_cache
+
+
+logger = logging.getLogger(__name__)
 
 
-async def get_user_by_email(email: str, db: AsyncSession = Depends(get_db)):
+async def get_user_by_email(email: str, db: AsyncSession = Depends(get_db), primary: bool = False):
     
     """
     The get_user_by_email function returns a user object from the database based on the email address provided.
         If no user is found, None is returned.
+        Reads that fill the shared user cache or are followed by a change of the user pass primary=True,
+        a lagging replica could otherwise put an old row back into the cache right after it was invalidated.
     
     :param email: str: Specify the type of the parameter
     :param db: AsyncSession: Pass the database session into the function
+    :param primary: bool: Read from the primary instead of a replica
     :return: A single user object
     :doc-author: Trelent
     """
     
     stmt = select(User).filter_by(email=email)
-    user = await db.execute(stmt)
+    user = await db.execute(stmt if primary else read_only(stmt))
     user = user.scalar_one_or_none()
     
     return user
 
-async def create_user(body: UserSchema, db: AsyncSession = Depends(get_db)):
+async def create_user(body: UserSchema, db: AsyncSession = Depends(get_db)) -> User | None:
     
     """
     The create_user function creates a new user in the database.
         It takes a UserSchema object as input and returns the newly created user.
+        The row is written with a single INSERT ... ON CONFLICT DO NOTHING RETURNING,
+        so two signups with the same email can not race each other.
     
     :param body: UserSchema: Validate the request body
     :param db: AsyncSession: Pass in the database session
-    :return: A user object
+    :return: A user object or None if the email is taken
     :doc-author: Trelent
     """
     
@@ -44,49 +57,47 @@ async def create_user(body: UserSchema, db: AsyncSession = Depends(get_db)):
         avatar = atar.get_image()  
               
     except Exception as err:
-        print (err)
+        logger.warning("gravatar lookup failed: %s", err)
         
     
-    new_user = User(**body.model_dump(), avatar=avatar)    
-    db.add(new_user)
-    
-    await db.commit()
-    await db.refresh(new_user)
-    
-    return new_user
-
-async def update_token(user: User, token: str | None, db: AsyncSession):
-    
-    """
-    The update_token function updates the refresh token for a user.
+    values = dict(body.model_dump(), avatar=avatar)
+    dialects = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
     
-    :param user: User: Identify the user that is being updated
-    :param token: str | None: Specify that the token parameter can either be a string or none
-    :param db: AsyncSession: Pass the database session to the function
-    :return: Nothing
-    :doc-author: Trelent
-    """
-    
-    user.refresh_token = token
+    if dialect_name(db) in dialects:
+        stmt = dialects[dialect_name(db)](User).values(**values).on_conflict_do_nothing().returning(User)
+        new_user = (await db.execute(stmt)).scalar_one_or_none()
+    else:
+        try:
+            new_user = (await db.execute(insert(User).values(**values).returning(User))).scalar_one()
+        except IntegrityError:
+            await db.rollback()
+            return None
     
     await db.commit()
     
+    return new_user
 
-async def confirmed_email(email: str, db: AsyncSession) -> None:
+async def confirmed_email(email: str, db: AsyncSession) -> bool:
     
     """
     The confirmed_email function marks a user as confirmed in the database.
+        It is a single UPDATE ... WHERE confirmed = false RETURNING, the user is not loaded first.
     
     :param email: str: Specify the email of the user to be confirmed
     :param db: AsyncSession: Pass the database session to the function
-    :return: None
+    :return: True if the user was confirmed now, False if there is no such user or it was confirmed before
     :doc-author: Trelent
     """
     
-    user = await get_user_by_email(email, db)
-    user.confirmed  = True
+    stmt = (update(User).where(User.email == email, User.confirmed.is_not(True)).values(confirmed=True)
+            .returning(User.id))
+    confirmed = (await db.execute(stmt)).scalar_one_or_none() is not None
     
     await db.commit()
+    if confirmed:
+        await user_cache.invalidate(email)
+    
+    return confirmed
 
 
 async def update_avatar(email, url: str, db: AsyncSession) -> User:
@@ -106,9 +117,10 @@ async def update_avatar(email, url: str, db: AsyncSession) -> User:
     :doc-author: Trelent
     """
     
-    user = await get_user_by_email(email, db)
+    user = await get_user_by_email(email, db, primary=True)
     user.avatar  = url
     
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(email)
     
     return user
\ No newline at end of file
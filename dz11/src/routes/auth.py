@@ -1,5 +1,8 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Request, Response, status, Path, Query, Security
+import logging
+
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status, Path, Query, Security
 from fastapi.security import (OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer, )
+from redis.asyncio import RedisError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
@@ -7,15 +10,17 @@ from src.repository import users as repositories_users
 from src.schemas.user import UserSchema, TokenSchema, UserResponse, RequestEmail
 from src.services.auth import auth_service
 from src.services.email import send_email
+from src.services.refresh_tokens import refresh_tokens, RefreshTokenInvalid, RefreshTokenReused
 
 from fastapi.responses import FileResponse
 
 
+logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/auth", tags=["auth"])
 get_refresh_token = HTTPBearer()
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup (body: UserSchema, bt: BackgroundTasks, request: Request,  db: AsyncSession = Depends(get_db)):
+async def signup (body: UserSchema, request: Request,  db: AsyncSession = Depends(get_db)):
     
     """
     The signup function creates a new user in the database.
@@ -23,20 +28,18 @@ async def signup (body: UserSchema, bt: BackgroundTasks, request: Request,  db:
         The function returns the newly created User object.
     
     :param body: UserSchema: Validate the body of the request
-    :param bt: BackgroundTasks: Add the send_email function to a background task
     :param request: Request: Get the base url of the application
     :param db: AsyncSession: Get the database session
     :return: A user object, but we want to return a token
     :doc-author: Trelent
     """
         
-    exist_user = await repositories_users.get_user_by_email(body.email, db)
-    if exist_user:
+    body.password = await auth_service.get_password_hash(body.password)
+    new_user =await repositories_users.create_user(body, db)
+    if new_user is None:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
     
-    body.password = auth_service.get_password_hash(body.password)
-    new_user =await repositories_users.create_user(body, db)
-    bt.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
+    await send_email(new_user.email, new_user.username, str(request.base_url))
     
     return new_user
 
@@ -48,6 +51,7 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession =
     The login function is used to authenticate a user.
     It takes the username and password from the request body,
     and returns an access token if successful.
+    Every login starts a new session, the refresh token is kept in Redis and not in the users table.
     
     :param body: OAuth2PasswordRequestForm: Get the username and password from the request body
     :param db: AsyncSession: Get the database session
@@ -60,16 +64,18 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession =
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_password(body.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
     
     access_token = await auth_service.create_access_token(data={"sub": user.email, "test": "Игорь"})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    
-    await repositories_users.update_token(user, refresh_token, db)
+    try:
+        refresh_token = await refresh_tokens.issue(user.email)
+    except RedisError as err:
+        logger.error("refresh token was not stored", exc_info=err)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Service temporarily unavailable")
     
     return {"access_token": access_token,
             "refresh_token": refresh_token,
@@ -78,33 +84,38 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession =
     
     
 @router.get("/refresh_token", response_model=TokenSchema)
-async def refresh_token( credentials: HTTPAuthorizationCredentials = Depends(get_refresh_token), db: AsyncSession = Depends(get_db), ):
+async def refresh_token( credentials: HTTPAuthorizationCredentials = Depends(get_refresh_token), ):
    
     """
     Refresh the access token using a valid refresh token.
 
     This function checks if the refresh token is valid and returns a new access token.
     If the refresh token is invalid, it raises an HTTPException with status code 401 (Unauthorized).
+    The refresh token is rotated in Redis, a token that was already exchanged revokes its whole session
+    and every access token of the user issued up to now.
+    The database is not used.
 
     :param credentials: HTTPAuthorizationCredentials: Get the refresh token from the request header.
-    :param db: AsyncSession: Pass the database session to the function.
     :return: A JSON object containing the access_token, refresh_token, and token_type.
     :doc-author: Trelent
     """
     token = credentials.credentials
     
-    email = await auth_service.decode_refresh_token(token)
-    user = await repositories_users.get_user_by_email(email, db)
+    claims = await auth_service.decode_refresh_token(token)
+    email = claims["sub"]
     
-    if user.refresh_token != token:
-        await repositories_users.update_token(user, None, db)
-        
+    try:
+        refresh_token = await refresh_tokens.rotate(claims)
+    except RefreshTokenReused:
+        await auth_service.revoke_tokens(email)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    except RefreshTokenInvalid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    except RedisError as err:
+        logger.error("refresh token was not rotated", exc_info=err)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Service temporarily unavailable")
         
     access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    
-    await repositories_users.update_token(user, refresh_token, db)
     
     return {"access_token": access_token,
             "refresh_token": refresh_token,
@@ -122,7 +133,7 @@ async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     we return an HTTP 400 error with a detail message of "Verification error".
     If they do exist in our database but their confirmed field is already True (meaning their email has already been confirmed),
     then we return a JSON response with a message saying "Your email is already confirmed".
-    Otherwise, we call repositories.
+    The common case, an unconfirmed user, is a single UPDATE; the user is only looked up when nothing was updated.
 
     :param token: str: Get the token from the URL.
     :param db: AsyncSession: Pass the database connection to the function.
@@ -131,17 +142,15 @@ async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     """
     email = await auth_service.get_email_from_token(token)
     
-    user = await repositories_users.grt_user_by_email(email, db)
+    if await repositories_users.confirmed_email(email, db):
+        return {"message": "Email confirmed"}
+    
+    user = await repositories_users.get_user_by_email(email, db)
     
     if user is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Verification error")
     
-    if user.confirmed:
-        return {"message": "Your email is already confirmed"}
-    
-    await repositories_users.confirmed_email(email, db)        
-       
-    return {"message": "Email confirmed"}
+    return {"message": "Your email is already confirmed"}
     
 @router.get('/{username}')
 async def request_email(username: str, response: Response, db: AsyncSession = Depends(get_db)):
@@ -157,14 +166,12 @@ async def request_email(username: str, response: Response, db: AsyncSession = De
     :doc-author: Trelent
     """
     
-    print('--------------------------------')
-    print(f'{username} save email in DB')
-    print('--------------------------------')
+    logger.info("email opened", extra={"username": username})
     return FileResponse("src/static/open_check.png", media_type="image/png", content_disposition_type="inline")
 
 
 @router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request, db: AsyncSession = Depends(get_db)):
+async def request_email(body: RequestEmail, request: Request, db: AsyncSession = Depends(get_db)):
     
     """
     The request_email function is used to send an email to the user with a link that will allow them
@@ -174,7 +181,6 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     email containing a confirmation link.
     
     :param body: RequestEmail: Get the email from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks
     :param request: Request: Get the base url of the server
     :param db: AsyncSession: Create a database connection
     :return: A dict with a message
@@ -187,6 +193,6 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
         return {"message": "Your email is already confirmed"}
     
     if user:
-        background_tasks.add_task(send_email, user.email, user.username, str(request.base_url))
+        await send_email(user.email, user.username, str(request.base_url))
     
     return {"message": "Check your email for confirmation."}    
\ No newline at end of file
@@ -1,13 +1,20 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status, Path, Query
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status, Path, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User, Role
 from src.services.roles import RoleAccess
 from src.services.auth import auth_service
+from src.services.cursor import cursor_signer
+from src.services.importer import contact_importer
+from src.services.exporter import contact_exporter, parse_fields, EXPORT_FIELDS, MEDIA_TYPES
+from src.services.versions import contact_versions
 from src.database.db import get_db
-from src.schemas.contacts import ContactResponse, ContactSchema, ContactUpdateSchema
+from src.schemas.contacts import (ContactResponse, ContactSchema, ContactUpdateSchema, ImportReport, ContactBatchIds,
+                                  ContactBatchCreate, ContactBatchUpdate, ContactBatchResult, ContactListItem,
+                                  contact_list_adapter, contact_fields_model, contact_fields_adapter)
 from src.repository import contacts as repository_contacts
 
 
@@ -15,10 +22,56 @@ router = APIRouter(prefix="/contacts", tags=["auth"])
 access_to_route_all = RoleAccess([Role.admin, Role.moderator])
 
 
-@router.get("/", response_model=List[ContactResponse])
+def sparse_fields(fields: str | None) -> tuple[str, ...] | None:
+    
+    """
+    The sparse_fields function turns the fields query parameter into the columns to select, in table order.
+    The id is always included, it is needed for the cursor of the next page.
+    
+    :param fields: str | None: Comma separated field names, None for whole contacts
+    :return: The column names or None
+    :doc-author: Trelent
+    """
+    
+    if fields is None:
+        return None
+    
+    requested = set(parse_fields(fields))
+    
+    return tuple(name for name in EXPORT_FIELDS if name == "id" or name in requested)
+
+
+def list_response(contacts: list, response: Response, columns: tuple[str, ...] | None = None) -> Response:
+    
+    """
+    The list_response function serializes a page of contacts without the per-item work of response_model:
+    the rows are validated as one list and encoded to JSON by pydantic-core in a single call.
+    The owner is sent as user_id instead of a nested user object on every contact.
+    Headers already set on response (cursor, ETag) are kept.
+    
+    :param contacts: list: Contacts loaded by the repository, or rows when columns is given
+    :param response: Response: The response of the route
+    :param columns: tuple[str, ...] | None: The selected columns, only these fields are sent
+    :return: The JSON response
+    :doc-author: Trelent
+    """
+    
+    adapter = contact_list_adapter if columns is None else contact_fields_adapter(columns)
+    content = adapter.dump_json(adapter.validate_python(contacts, from_attributes=True))
+    result = Response(content=content, media_type="application/json")
+    result.raw_headers.extend(response.raw_headers)
+    
+    return result
+
+
+@router.get("/", response_model=List[ContactListItem])
 async def get_contacts(
+    request: Request,
+    response: Response,
     limit: int = Query(10, ge=10, le=500),
     offset: int = Query(0, ge=0, le=200),
+    cursor: str | None = Query(None),
+    fields: str | None = Query(None),
     db: AsyncSession = Depends(get_db),
     user: User = Depends(auth_service.get_current_user),
     ):
@@ -26,58 +79,203 @@ async def get_contacts(
     """
     The get_contacts function returns a list of contacts for the current user.
     The limit and offset parameters are used to paginate the results.
+    For deep pages pass the cursor from the X-Next-Cursor header of the previous page instead of offset.
+    The response carries a weak ETag of the contacts version of the user, a request with a matching
+    If-None-Match header is answered with 304 without querying the database. Within DB_READ_YOUR_WRITES_SECONDS
+    of a change the page is read from the primary so a lagging replica can not pair old rows with the new version.
+    X-Total-Count holds the number of contacts of the user, read from the maintained counter.
 
+    :param request: Request: Read the If-None-Match header.
+    :param response: Response: Set the X-Next-Cursor, X-Total-Count and ETag headers.
     :param limit: int: Limit the number of contacts returned.
     :param ge: Specify the minimum value of a parameter.
     :param le: Limit the number of contacts returned.
     :param offset: int: Get the next set of data from the database.
     :param ge: Specify the minimum value that can be passed in.
     :param le: Limit the number of contacts that can be returned.
+    :param cursor: str | None: Opaque cursor of the next page.
+    :param fields: str | None: Comma separated fields to return, e.g. first_name,last_name; only these columns are read.
     :param db: AsyncSession: Pass the database connection to the function.
     :param user: User: Get the user from the database.
-    :return: A list of contacts.
+    :return: A list of contacts, with user_id instead of the nested user.
     :doc-author: Trelent
     """
     
-    contact = await repository_contacts.get_contacts(limit, offset,db, user)
+    scope = str(user.id)
+    after_id = cursor_signer.decode(scope, cursor) if cursor else None
+    columns = sparse_fields(fields)
     
-    return contact
+    not_modified = await contact_versions.check(request, response, user.id, db)
+    if not_modified is not None:
+        return not_modified
+    
+    contacts = await repository_contacts.get_contacts(limit, offset, db, user, after_id, columns)
+    response.headers["X-Total-Count"] = str(await repository_contacts.count_contacts(db, user))
+    
+    if len(contacts) == limit:
+        response.headers["X-Next-Cursor"] = cursor_signer.encode(scope, contacts[-1].id)
+    
+    return list_response(contacts, response, columns)
 
-@router.get("/all", response_model=list[ContactResponse], dependencies=[Depends(access_to_route_all)],)
+@router.get("/all", response_model=list[ContactListItem], dependencies=[Depends(access_to_route_all)],)
 async def get_all_todos(
+    response: Response,
     limit: int = Query(10, ge=10, le=500),
     offset: int = Query(0, ge=0),
+    cursor: str | None = Query(None),
+    fields: str | None = Query(None),
     db: AsyncSession = Depends(get_db),
     user: User = Depends(auth_service.get_current_user),
 ):
     """
     The get_all_todos function returns a list of all todos in the database.
+    For deep pages pass the cursor from the X-Next-Cursor header of the previous page instead of offset.
+    X-Total-Count holds the number of contacts; on Postgres it is the planner estimate,
+    marked with X-Total-Count-Estimated, so it costs the same for any table size.
 
+    :param response: Response: Set the X-Next-Cursor and X-Total-Count headers.
     :param limit: int: Limit the number of contacts returned.
     :param ge: Specify a minimum value for the limit parameter.
     :param le: Limit the number of results returned.
     :param offset: int: Specify the number of records to skip before returning results.
     :param ge: Specify a minimum value.
+    :param cursor: str | None: Opaque cursor of the next page.
+    :param fields: str | None: Comma separated fields to return; only these columns are read.
     :param db: AsyncSession: Access the database.
     :param user: User: Get the current user from the auth_service.
-    :return: A list of contacts.
+    :return: A list of contacts, with user_id instead of the nested user.
+    :doc-author: Trelent
+    """
+    
+    after_id = cursor_signer.decode("all", cursor) if cursor else None
+    columns = sparse_fields(fields)
+    
+    contacts = await repository_contacts.get_all_contacts(limit, offset, db, after_id, columns)
+    total, estimated = await repository_contacts.estimate_all_contacts(db)
+    response.headers["X-Total-Count"] = str(total)
+    if estimated:
+        response.headers["X-Total-Count-Estimated"] = "true"
+    
+    if len(contacts) == limit:
+        response.headers["X-Next-Cursor"] = cursor_signer.encode("all", contacts[-1].id)
+    
+    return list_response(contacts, response, columns)
+
+@router.get("/search", response_model=List[ContactListItem])
+async def search_contacts(
+    response: Response,
+    q: str = Query(min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(auth_service.get_current_user),
+    ):
+    
+    """
+    The search_contacts function searches the contacts of the current user by name, email and phone number.
+    Results are ranked and tolerate typos on Postgres.
+
+    :param response: Response: The response of the route.
+    :param q: str: The search query.
+    :param limit: int: Limit the number of contacts returned.
+    :param db: AsyncSession: Pass the database connection to the function.
+    :param user: User: Get the user from the database.
+    :return: A list of contacts, with user_id instead of the nested user.
+    :doc-author: Trelent
+    """
+    
+    contacts = await repository_contacts.search_contacts(q, limit, db, user)
+    
+    return list_response(contacts, response)
+
+@router.get("/birthdays", response_model=List[ContactListItem])
+async def get_upcoming_birthdays(
+    response: Response,
+    days: int = Query(7, ge=0, le=365),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(auth_service.get_current_user),
+    ):
+    
+    """
+    The get_upcoming_birthdays function returns the contacts of the current user with a birthday in the next days days.
+
+    :param response: Response: The response of the route.
+    :param days: int: How many days ahead to look.
+    :param db: AsyncSession: Pass the database connection to the function.
+    :param user: User: Get the user from the database.
+    :return: A list of contacts ordered by the next birthday, with user_id instead of the nested user.
     :doc-author: Trelent
     """
     
-    contacts = await repository_contacts.get_all_contacts(limit, offset,db, user)
+    contacts = await repository_contacts.get_upcoming_birthdays(days, db, user)
+    
+    return list_response(contacts, response)
+
+def export_response(user_id: int | None, format: str, fields: str | None, gzip: bool) -> StreamingResponse:
+    columns = parse_fields(fields)
+    filename = f"contacts.{format}" + (".gz" if gzip else "")
+    
+    return StreamingResponse(contact_exporter.export(user_id, columns, format, gzip),
+                             media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_contacts(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    fields: str | None = Query(None),
+    gzip: bool = Query(False),
+    user: User = Depends(auth_service.get_current_user),
+    ):
+    
+    """
+    The export_contacts function streams the whole address book of the current user as ndjson or csv.
+
+    :param format: str: ndjson or csv.
+    :param fields: str | None: Comma separated columns to export, all by default.
+    :param gzip: bool: Compress the file with gzip.
+    :param user: User: Get the user from the database.
+    :return: A streaming response.
+    :doc-author: Trelent
+    """
+    
+    return export_response(user.id, format, fields, gzip)
+
+@router.get("/all/export", response_class=StreamingResponse, dependencies=[Depends(access_to_route_all)],)
+async def export_all_contacts(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    fields: str | None = Query(None),
+    gzip: bool = Query(False),
+    ):
+    
+    """
+    The export_all_contacts function streams every contact in the database as ndjson or csv.
+
+    :param format: str: ndjson or csv.
+    :param fields: str | None: Comma separated columns to export, all by default.
+    :param gzip: bool: Compress the file with gzip.
+    :return: A streaming response.
+    :doc-author: Trelent
+    """
     
-    return contacts
+    return export_response(None, format, fields, gzip)
 
 @router.get("/{contact_id}", response_model=ContactResponse)
 async def get_contact(
+    request: Request,
+    response: Response,
     contact_id: int = Path(ge=1),
+    fields: str | None = Query(None),
     db: AsyncSession = Depends(get_db),
     user: User = Depends(auth_service.get_current_user),
 ):
     """
     The get_contact function returns a contact by its id.
+    A request with an If-None-Match header matching the contacts version of the user is answered with 304,
+    within DB_READ_YOUR_WRITES_SECONDS of a change the contact is read from the primary.
     
+    :param request: Request: Read the If-None-Match header
+    :param response: Response: Set the ETag header
     :param contact_id: int: Get the contact id from the url
+    :param fields: str | None: Comma separated fields to return; only these columns are read
     :param db: AsyncSession: Pass the database session to the repository
     :param user: User: Get the current user from the database
     :param : Get the contact id from the url
@@ -85,11 +283,23 @@ async def get_contact(
     :doc-author: Trelent
     """
     
-    contact = await repository_contacts.get_contact(contact_id, db, user)
+    columns = sparse_fields(fields)
+    
+    not_modified = await contact_versions.check(request, response, user.id, db)
+    if not_modified is not None:
+        return not_modified
+    
+    contact = await repository_contacts.get_contact(contact_id, db, user, columns)
     
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND!",)
     
+    if columns is not None:
+        result = Response(content=contact_fields_model(columns).model_validate(contact).model_dump_json(),
+                          media_type="application/json")
+        result.raw_headers.extend(response.raw_headers)
+        return result
+    
     return contact
 
 @router.post("/", response_model=ContactResponse, status_code=status.HTTP_201_CREATED)
@@ -111,10 +321,127 @@ async def create_contact(
     :return: A ContactResponse object.
     :doc-author: Trelent
     """
-    contact = await repository_contacts.create_contact(body, db, user)
+    contact = await repository_contacts.create_todo(body, db, user)
     
     return contact
 
+@router.post("/import", response_model=ImportReport)
+async def import_contacts(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(auth_service.get_current_user),
+    ):
+    
+    """
+    The import_contacts function imports contacts from the raw request body.
+    The body is a csv file with a header row or newline delimited JSON, it is parsed while it is received
+    and written in batches, so uploads of any size use the same amount of memory.
+
+    :param request: Request: Read the body stream.
+    :param format: str: csv or ndjson.
+    :param db: AsyncSession: Pass the database session to the repository layer.
+    :param user: User: Get the user that is currently logged in.
+    :return: An ImportReport with per-row errors and throughput.
+    :doc-author: Trelent
+    """
+    
+    report = await contact_importer.run(request.stream(), format, db, user)
+    
+    return report
+
+@router.post("/batch/get", response_model=ContactBatchResult)
+async def get_contacts_batch(
+    body: ContactBatchIds,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(auth_service.get_current_user),
+    ):
+    
+    """
+    The get_contacts_batch function returns many contacts of the current user with one query.
+
+    :param body: ContactBatchIds: The ids to load.
+    :param db: AsyncSession: Pass the database session to the repository layer.
+    :param user: User: Get the user that is currently logged in.
+    :return: A ContactBatchResult with one item per requested id.
+    :doc-author: Trelent
+    """
+    
+    contacts = await repository_contacts.get_contacts_by_ids(body.ids, db, user)
+    
+    return {"items": [{"index": index, "id": contact_id, "status": "ok", "contact": contacts[contact_id]}
+                      if contact_id in contacts else {"index": index, "id": contact_id, "status": "not_found"}
+                      for index, contact_id in enumerate(body.ids)]}
+
+@router.post("/batch", response_model=ContactBatchResult, status_code=status.HTTP_201_CREATED)
+async def create_contacts_batch(
+    body: ContactBatchCreate,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(auth_service.get_current_user),
+    ):
+    
+    """
+    The create_contacts_batch function creates many contacts in one transaction.
+
+    :param body: ContactBatchCreate: The new contacts.
+    :param db: AsyncSession: Pass the database session to the repository layer.
+    :param user: User: Get the user that is currently logged in.
+    :return: A ContactBatchResult with one item per new contact.
+    :doc-author: Trelent
+    """
+    
+    results = await repository_contacts.create_contacts(body.items, db, user)
+    
+    return {"items": [{"index": index, "status": "error", "error": result} if isinstance(result, str)
+                      else {"index": index, "id": result.id, "status": "ok", "contact": result}
+                      for index, result in enumerate(results)]}
+
+@router.patch("/batch", response_model=ContactBatchResult)
+async def update_contacts_batch(
+    body: ContactBatchUpdate,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(auth_service.get_current_user),
+    ):
+    
+    """
+    The update_contacts_batch function partially updates many contacts in one transaction.
+
+    :param body: ContactBatchUpdate: Contact ids and the fields to change.
+    :param db: AsyncSession: Pass the database session to the repository layer.
+    :param user: User: Get the user that is currently logged in.
+    :return: A ContactBatchResult with one item per update.
+    :doc-author: Trelent
+    """
+    
+    results = await repository_contacts.update_contacts(body.items, db, user)
+    
+    return {"items": [{"index": index, "id": item.id, "status": "error", "error": result} if isinstance(result, str)
+                      else {"index": index, "id": item.id, "status": "ok", "contact": result} if result
+                      else {"index": index, "id": item.id, "status": "not_found"}
+                      for index, (item, result) in enumerate(zip(body.items, results))]}
+
+@router.post("/batch/delete", response_model=ContactBatchResult)
+async def delete_contacts_batch(
+    body: ContactBatchIds,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(auth_service.get_current_user),
+    ):
+    
+    """
+    The delete_contacts_batch function deletes many contacts of the current user with one statement.
+
+    :param body: ContactBatchIds: The ids to delete.
+    :param db: AsyncSession: Pass the database session to the repository layer.
+    :param user: User: Get the user that is currently logged in.
+    :return: A ContactBatchResult with one item per requested id.
+    :doc-author: Trelent
+    """
+    
+    deleted = await repository_contacts.remove_contacts(body.ids, db, user)
+    
+    return {"items": [{"index": index, "id": contact_id, "status": "ok" if contact_id in deleted else "not_found"}
+                      for index, contact_id in enumerate(body.ids)]}
+
 @router.put("/{contact_id}", response_model=ContactResponse)
 async def update_contact(
     body: ContactUpdateSchema,
@@ -1,29 +1,18 @@
-import pickle
+import logging
 
-import cloudinary
-import cloudinary.uploader
-from fastapi import (APIRouter, HTTPException, Depends, status, Path, Query, UploadFile, File,)
-from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import (APIRouter, BackgroundTasks, HTTPException, Depends, Request, status, Path, Query,)
 
-from src.database.db import get_db
 from src.database.models import User
 from src.schemas.user import UserResponse
 from src.services.auth import auth_service
-from src.conf.config import config
-from src.repository import users as repositories_users
+from src.services.avatars import avatar_processor, read_upload
+from src.services.ratelimit import UserRateLimit
 
+logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/users", tags=["users"])
 
-cloudinary.config(
-    cloud_name=config.CLOUDINARY_NAME,
-    api_key=config.CLOUDINARY_API_KEY,
-    api_secret=config.CLOUDINARY_API_SECRET,
-    secure=True,
-)
 
-
-@router.get("/me", response_model=UserResponse, dependencies=[Depends(RateLimiter(times=1, seconds=20))],)
+@router.get("/me", response_model=UserResponse, dependencies=[Depends(UserRateLimit(times=1, seconds=20))],)
 async def det_current_user(user: User = Depends(auth_service.get_current_user)):
     
     """
@@ -37,35 +26,31 @@ async def det_current_user(user: User = Depends(auth_service.get_current_user)):
     """
     return user
 
-@router.path("/avatar", response_model=UserResponse, dependencies=[Depends(RateLimiter(times=1, seconds=20))],)
+AVATAR_BODY = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}}}}}}}
+
+
+@router.patch("/avatar", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(UserRateLimit(times=1, seconds=20))],
+              openapi_extra=AVATAR_BODY,)
 async def get_current_user(
-    file: UploadFile = File(),
+    request: Request,
+    bt: BackgroundTasks,
     user: User = Depends(auth_service.get_current_user),
-    db: AsyncSession = Depends(get_db),
     ):
     
     """
-    The get_current_user function is used to get the current user from the database.
+    The get_current_user function accepts a new avatar for the current user, sent in the file field of a multipart form.
+    The body is parsed as it streams in and rejected past AVATAR_MAX_BYTES, the thumbnail is made and stored
+    after the response is sent, the avatar URL of the user changes once that is done.
 
-    :param file: UploadFile: Get the file from the request.
+    :param request: Request: Stream the multipart body.
+    :param bt: BackgroundTasks: Run the processing after the response.
     :param user: User: Get the current user from the database.
-    :param db: AsyncSession: Access the database.
-    :return: The user object.
+    :return: A dict with a message.
     :doc-author: Trelent
     """
     
-    public_id = f"Web21/{user.mail}"
-    
-    res = cloudinary.uploader.upload(file.file, public_id=public_id, owerite=True)
-    
-    print(f"cloudinary res: {res}")
-    
-    res_url = cloudinary.CloudinaryImage(public_id).build_url(width=250, height=250, crop="fill", version=res.get("version"))
-    
-    user = await repositories_users.update_avatar_url(user.email, res_url, db)
-    
-    auth_service.cache.set(user.email, pickle.dumps(user))
-    
-    auth_service.cache.expire(user.email, 300)
+    data = await read_upload(request)
+    bt.add_task(avatar_processor.process, user.id, user.email, data)
 
-    return user    
\ No newline at end of file
+    return {"message": "Avatar accepted, it will be updated after processing"}
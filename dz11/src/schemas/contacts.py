@@ -1,36 +1,147 @@
 from datetime import date, datetime
+from functools import lru_cache
 from typing import Optional
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, TypeAdapter, create_model, field_validator
 from src.schemas.user import UserResponse
 
 
+def parse_birthday(v):
+    if isinstance(v, str) and len(v) == 10 and v[2] == "." and v[5] == ".":
+        return datetime.strptime(v, "%d.%m.%Y").date()
+    return v
+
+
 class ContactSchema(BaseModel):  
     
     first_name: str = Field(max_length=50, min_length=3)
     last_name: str = Field(max_length=50, min_length=3)
     email: str = Field(max_length=30, min_length=5)
     phone_number: str = Field(max_length=30, min_length=5)
-    birthday: str = Field(max_length=30, min_length=8)
+    birthday: date
     data: Optional[bool] = False
+    
+    @field_validator("birthday", mode="before")
+    @classmethod
+    def validate_birthday(cls, v):
+        return parse_birthday(v)
 
 
 class ContactUpdateSchema(ContactSchema):  
     data: bool
 
 
+class ContactPatchSchema(BaseModel):
+    
+    id: int = Field(ge=1)
+    first_name: Optional[str] = Field(None, max_length=50, min_length=3)
+    last_name: Optional[str] = Field(None, max_length=50, min_length=3)
+    email: Optional[str] = Field(None, max_length=30, min_length=5)
+    phone_number: Optional[str] = Field(None, max_length=30, min_length=5)
+    birthday: Optional[date] = None
+    data: Optional[bool] = None
+    
+    @field_validator("birthday", mode="before")
+    @classmethod
+    def validate_birthday(cls, v):
+        return parse_birthday(v)
+    
+    @field_validator("first_name", "last_name", "email", "phone_number", "birthday")
+    @classmethod
+    def validate_not_null(cls, v):
+        if v is None:
+            raise ValueError("may be omitted but not null")
+        return v
+
+
 class ContactResponse(BaseModel):  
     id: int = 1
     first_name: str
     last_name: str
     email: str
     phone_number: str
-    birthday: str
-    data: bool
-    completed: bool
+    birthday: date
+    data: bool | None
     created_at: datetime | None
     updated_at: datetime | None
     user: UserResponse | None
 
-    class Config:
-        from_attributes: True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ContactListItem(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    email: str
+    phone_number: str
+    birthday: date
+    data: bool | None
+    created_at: datetime | None
+    updated_at: datetime | None
+    user_id: int | None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+# validates and encodes a whole page in one call of pydantic-core, see routes.contacts.list_response
+contact_list_adapter = TypeAdapter(list[ContactListItem])
+
+
+@lru_cache(maxsize=128)
+def contact_fields_model(fields: tuple[str, ...]) -> type[BaseModel]:
+    
+    """
+    The contact_fields_model function builds a response model with only the given fields of ContactListItem.
+    Models are cached, pass the fields in a canonical order so each fieldset is built once.
+    
+    :param fields: tuple[str, ...]: Names of ContactListItem fields
+    :return: The model
+    :doc-author: Trelent
+    """
+    
+    return create_model(f"Contact_{'_'.join(fields)}", __config__=ConfigDict(from_attributes=True),
+                        **{name: (ContactListItem.model_fields[name].annotation, ...) for name in fields})
+
+
+@lru_cache(maxsize=128)
+def contact_fields_adapter(fields: tuple[str, ...]) -> TypeAdapter:
+    return TypeAdapter(list[contact_fields_model(fields)])
+
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+
+class ImportReport(BaseModel):
+    total: int
+    imported: int
+    failed: int
+    errors: list[ImportRowError]
+    seconds: float
+    rows_per_second: float
+
+
+class ContactBatchIds(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=500)
+
+
+class ContactBatchCreate(BaseModel):
+    items: list[ContactSchema] = Field(min_length=1, max_length=500)
+
+
+class ContactBatchUpdate(BaseModel):
+    items: list[ContactPatchSchema] = Field(min_length=1, max_length=500)
+
+
+class ContactBatchItem(BaseModel):
+    index: int
+    id: int | None = None
+    status: str
+    error: str | None = None
+    contact: ContactResponse | None = None
+
+
+class ContactBatchResult(BaseModel):
+    items: list[ContactBatchItem]
@@ -1,29 +1,37 @@
+import logging
 from typing import Optional
 
 from jose import JWTError, jwt  # type: ignore
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 
-from src.database.db import get_db
+from src.database.db import get_db, sessonmanager
 from src.repository import users as repository_users
+from src.services.cache import user_cache
+from src.services.hashing import hasher, HashingBusy
+from src.services.token_cache import token_cache
 from src.conf.config import config
 
 
+logger = logging.getLogger(__name__)
+
+
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated ="auto")
+    hasher = hasher
     SECRET_KEY = config.SECRET_KEY_JWT
     ALGORITHM = config.ALGORITHM
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+    cache = user_cache
+    token_cache = token_cache
     
-    def verify_password(self, plain_password, hashed_password):
+    async def verify_password(self, plain_password, hashed_password):
         
         """
         The verify_password function takes a plain-text password and the hashed version of that password,
             and returns True if they match, False otherwise. This is used to verify that the user's login
-            credentials are correct.
+            credentials are correct. The bcrypt work runs in the hashing executor, not in the event loop.
         
         :param self: Represent the instance of the class
         :param plain_password: Check if the password entered by the user is correct
@@ -32,20 +40,29 @@ class Auth:
         :doc-author: Trelent
         """
         
-        return self.pwd_context.verify(plain_password, hashed_password)
+        try:
+            return await self.hasher.verify(plain_password, hashed_password)
+        except HashingBusy:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy, try again later",
+                                headers={"Retry-After": "1"}, )
     
-    def get_password_hash(self, password:str):
+    async def get_password_hash(self, password:str):
         
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
-            The function uses the pwd_context object to generate a hash from the given password.
+            The hash is computed in the hashing executor, not in the event loop.
         
         :param self: Represent the instance of the class
         :param password: str: Pass the password to be hashed into the function
         :return: A string of the hashed password
         :doc-author: Trelent
         """
-        return self.pwd_context.hash(password)
+        
+        try:
+            return await self.hasher.hash(password)
+        except HashingBusy:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy, try again later",
+                                headers={"Retry-After": "1"}, )
     
     async def create_access_token (self, data: dict, expires_delta: Optional[float] = None):
         
@@ -64,7 +81,7 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(minutes=15)
+            expire = datetime.utcnow() + timedelta(seconds=config.ACCESS_TOKEN_TTL)
             
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})   
         
@@ -95,7 +112,7 @@ class Auth:
         else:
             expire = datetime.utcnow() + timedelta(days=7)
             
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})   
+        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})   
         
         encode_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         
@@ -106,32 +123,33 @@ class Auth:
         """
         The decode_refresh_token function is used to decode the refresh token.
             The function will raise an HTTPException if the token is invalid or has expired.
-            If the token is valid, it will return a string with the email address of 
-            user who owns that refresh_token.
+            If the token is valid, it will return its claims: the email address of the user
+            who owns that refresh_token in sub, its family in fid and its id in jti.
         
         :param self: Represent the instance of a class
         :param refresh_token: str: Pass the refresh token to the function
-        :return: The email of the user
+        :return: The claims of the token
         :doc-author: Trelent
         """
         try:
-            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithm=[self.ALGORITHM])
+            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+        except JWTError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", )
             
-            if payload["scope"] == "refresh_token":
-                email = payload["sub"]
-                
-                return email
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid scope for token", )
-            
-        except:
-           
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", )      
+        if payload.get("scope") == "refresh_token" and payload.get("sub"):
+            return payload
+        
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid scope for token", )
     
     async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)): 
         
         """
         The get_current_user function is a dependency that will be used in the UserRouter class.
         It takes an access token as input and returns the user object associated with it.
+        The user is served from the Redis snapshot cache when possible, the database is queried only on a miss.
+        That read goes to the primary, a replica could fill the cache with a row changed a moment ago.
+        Tokens seen before skip the signature check, their claims come from the in-process token cache.
+        Either way a token issued before the not before timestamp of the user, set by revoke_tokens, is rejected.
         
         :param self: Represent the instance of a class
         :param token: str: Pass the token to the function
@@ -143,24 +161,50 @@ class Auth:
         credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", 
                                               headers={"WWW-Authenticate": "Bearer"}, )
         
-        try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithm=[self.ALGORITHM])
-            
-            if payload["scope"] =="access_token":
-                email = payload["sub"]
-                if email is None:
-                    raise credentials_exception
-            else: 
-                raise credentials_exception    
-        except JWTError as err:
-            raise credentials_exception
+        payload = self.token_cache.get(token)
+        if payload is None:
+            try:
+                payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            except JWTError as err:
+                raise credentials_exception
+            self.token_cache.put(token, payload)
         
-        user = await repository_users.get_user_by_email(email, db)
-        if user is None:
+        if payload.get("scope") =="access_token":
+            email = payload.get("sub")
+            if email is None:
+                raise credentials_exception
+        else: 
+            raise credentials_exception    
+        
+        user, not_before = await self.cache.get_user(email)
+        if payload.get("iat", 0) < not_before:
             raise credentials_exception
+        if user is None:
+            user = await repository_users.get_user_by_email(email, db, primary=True)
+            if user is None:
+                raise credentials_exception
+            
+            await self.cache.set_user(user)
+        
+        await sessonmanager.attach_user(db, user.id)
         
         return user
 
+    async def revoke_tokens(self, email: str) -> None:
+        
+        """
+        The revoke_tokens function rejects the access tokens of the user issued up to now, on every worker.
+        The not before timestamp is kept in Redis next to the user snapshot, the tokens cached by this worker are dropped.
+        
+        :param self: Represent the instance of a class
+        :param email: str: Email of the user
+        :return: None
+        :doc-author: Trelent
+        """
+        
+        await self.cache.revoke_tokens(email)
+        self.token_cache.revoke(email)
+
     def create_email_token(self, data:dict):
         
         """
@@ -198,14 +242,14 @@ class Auth:
         """
         
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithm=[self.ALGORITHM])
+            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             
             email = payload["sub"]
                 
             return email
         
         except JWTError as err:
-            print(err)
+            logger.info("invalid email verification token: %s", err)
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid token for email verification")    
       
 
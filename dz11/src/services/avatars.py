@@ -0,0 +1,169 @@
+import hashlib
+import io
+import logging
+from typing import AsyncIterator
+
+from fastapi import HTTPException, Request, status
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from src.conf.config import config
+from src.database.db import sessonmanager
+from src.repository import users as repository_users
+from src.services.executor import BoundedExecutor, ExecutorBusy
+from src.services.storage import Storage, storage
+
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+class UploadTooLarge(MultiPartException):
+    pass
+
+
+def make_thumbnail(data: bytes, size: int, fmt: str) -> bytes:
+
+    """
+    The make_thumbnail function crops the image to a square, resizes it and encodes it in fmt.
+    It runs in the worker processes of the avatar executor, so it must stay a module level function.
+
+    :param data: bytes: The uploaded image
+    :param size: int: Width and height of the thumbnail
+    :param fmt: str: Output format understood by Pillow, e.g. WEBP
+    :return: The encoded thumbnail
+    :doc-author: Trelent
+    """
+
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image = ImageOps.fit(image.convert("RGB"), (size, size), Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format=fmt)
+
+    return output.getvalue()
+
+
+async def limited_stream(stream: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in stream:
+        received += len(chunk)
+        if received > max_bytes:
+            raise UploadTooLarge("Image is too large")
+        yield chunk
+
+
+async def read_upload(request: Request, max_bytes: int = config.AVATAR_MAX_BYTES) -> bytes:
+
+    """
+    The read_upload function reads the image from the multipart body of the request without letting Starlette
+    spool a body of any size first. A Content-Length over the limit is rejected before the body is read,
+    otherwise the body is parsed as it streams in and the upload stops as soon as it grows past the limit.
+    MULTIPART_OVERHEAD bytes are allowed on top of max_bytes for the boundaries and part headers,
+    the image itself must not be larger than max_bytes.
+
+    :param request: Request: The incoming request with a multipart/form-data body, the image in the file field
+    :param max_bytes: int: Largest accepted image
+    :return: The content of the image
+    :doc-author: Trelent
+    """
+
+    limit = max_bytes + MULTIPART_OVERHEAD
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > limit:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image is too large")
+
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Expected multipart/form-data")
+
+    try:
+        form = await MultiPartParser(request.headers, limited_stream(request.stream(), limit), max_fields=10,
+                                     max_files=1).parse()
+    except UploadTooLarge:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image is too large")
+    except MultiPartException as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=err.message)
+
+    try:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="The file field is required")
+
+        if file.content_type not in CONTENT_TYPES:
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported image type")
+
+        data = await file.read()
+        if len(data) > max_bytes:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image is too large")
+    finally:
+        await form.close()
+
+    return data
+
+
+class AvatarBusy(ExecutorBusy):
+    pass
+
+
+class AvatarExecutor(BoundedExecutor):
+    name = "avatar"
+    busy = AvatarBusy
+
+
+class AvatarProcessor:
+    def __init__(self, backend: Storage = storage, size: int = config.AVATAR_SIZE, fmt: str = config.AVATAR_FORMAT) -> None:
+
+        """
+        The __init__ function sets up the processor. Thumbnails are made in a process pool with its own
+        queue limits, so image work never runs in the event loop and never competes with password hashing.
+
+        :param self: Represent the instance of the class
+        :param backend: Storage: Where the thumbnails are stored
+        :param size: int: Width and height of the thumbnails
+        :param fmt: str: Output format of the thumbnails
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.storage = backend
+        self.size = size
+        self.format = fmt
+        self.executor = AvatarExecutor(kind=config.AVATAR_EXECUTOR, max_workers=config.AVATAR_WORKERS,
+                                       max_pending=config.AVATAR_MAX_PENDING, queue_timeout=config.AVATAR_QUEUE_TIMEOUT)
+
+    async def process(self, user_id: int, email: str, data: bytes) -> str | None:
+
+        """
+        The process function makes the thumbnail, stores it and only then points the avatar of the user to it.
+        It runs after the response is sent and uses its own database session. Errors are logged,
+        the user keeps the previous avatar.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: Id of the user
+        :param email: str: Email of the user
+        :param data: bytes: The uploaded image
+        :return: The URL of the new avatar or None if processing failed
+        :doc-author: Trelent
+        """
+
+        try:
+            thumbnail = await self.executor.run(make_thumbnail, data, self.size, self.format)
+            digest = hashlib.sha256(thumbnail).hexdigest()[:12]
+            url = await self.storage.save(f"avatars/{user_id}-{digest}.{self.format.lower()}", thumbnail,
+                                          f"image/{self.format.lower()}")
+            async with sessonmanager.session() as db:
+                await repository_users.update_avatar(email, url, db)
+        except Exception as err:
+            logger.error("avatar processing failed", extra={"user_id": user_id}, exc_info=err)
+            return None
+
+        logger.info("avatar updated", extra={"user_id": user_id, "bytes": len(data)})
+
+        return url
+
+
+avatar_processor = AvatarProcessor()
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import re
+from ipaddress import ip_address, ip_network
+
+import redis.asyncio as redis
+
+from src.conf.config import config
+
+
+logger = logging.getLogger(__name__)
+
+class BanRules:
+    def __init__(self, ips: list[str], agents: list[str]) -> None:
+
+        """
+        The __init__ function compiles the ban rules once, so a lookup does not depend on the number of rules.
+        Networks are grouped by prefix length: an address is checked with one set lookup per distinct
+        prefix length (at most 33 for IPv4 and 129 for IPv6), whatever the number of banned networks.
+        User agent patterns are joined into one regular expression that is scanned in a single pass.
+        Invalid entries are skipped and counted, a pattern is checked the way it is joined, so inline
+        global flags such as (?i) are rejected too.
+
+        :param self: Represent the instance of the class
+        :param ips: list[str]: Addresses or CIDR networks, e.g. 10.0.0.0/8
+        :param agents: list[str]: Regular expressions searched in the user-agent header
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.networks: dict[int, dict[int, set[int]]] = {4: {}, 6: {}}
+        self.invalid = 0
+        self.ip_count = 0
+        self.agent_count = 0
+
+        for value in ips:
+            try:
+                network = ip_network(value.strip(), strict=False)
+            except ValueError:
+                self.invalid += 1
+                continue
+            prefixes = self.networks[network.version].setdefault(network.prefixlen, set())
+            prefixes.add(int(network.network_address))
+            self.ip_count += 1
+
+        patterns = []
+        for value in agents:
+            try:
+                re.compile(f"(?:{value})")
+            except re.error:
+                self.invalid += 1
+                continue
+            patterns.append(f"(?:{value})")
+
+        self.agent_count = len(patterns)
+        self.agents = re.compile("|".join(patterns)) if patterns else None
+
+    def ip_banned(self, host: str | None) -> bool:
+        if not host:
+            return False
+        try:
+            address = ip_address(host)
+        except ValueError:
+            return False
+
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+
+        value = int(address)
+        bits = address.max_prefixlen
+        for prefixlen, prefixes in self.networks[address.version].items():
+            if (value >> (bits - prefixlen)) << (bits - prefixlen) in prefixes:
+                return True
+
+        return False
+
+    def agent_banned(self, user_agent: str | None) -> bool:
+        return bool(user_agent) and self.agents is not None and self.agents.search(user_agent) is not None
+
+
+class BanList:
+    ips_key = "ban:ips"
+    agents_key = "ban:agents"
+    version_key = "ban:version"
+
+    def __init__(self, ips: list[str] = config.BANNED_IPS, agents: list[str] = config.BANNED_USER_AGENTS,
+                 reload_seconds: float = config.BAN_RELOAD_SECONDS) -> None:
+
+        """
+        The __init__ function starts with the rules from the settings. Once a Redis client is attached by start(),
+        the rules stored in the ban:ips and ban:agents sets are added to them and reloaded whenever
+        the ban:version counter changes, so bans can be edited without a restart:
+
+            SADD ban:ips 10.0.0.0/8
+            SADD ban:agents "curl/.*"
+            INCR ban:version
+
+        :param self: Represent the instance of the class
+        :param ips: list[str]: Addresses or networks that are always banned
+        :param agents: list[str]: User agent patterns that are always banned
+        :param reload_seconds: float: How often the version counter is checked
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.static_ips = list(ips)
+        self.static_agents = list(agents)
+        self.reload_seconds = reload_seconds
+        self.rules = BanRules(self.static_ips, self.static_agents)
+        self.redis: redis.Redis | None = None
+        self.version: bytes | None = None
+        self._task: asyncio.Task | None = None
+
+        self.reloads = 0
+        self.reload_errors = 0
+        self.blocked = 0
+
+    async def start(self, r: redis.Redis) -> None:
+
+        """
+        The start function attaches the Redis client, loads the stored rules and starts the reload task.
+        If Redis is not reachable the static rules stay active and the task keeps retrying.
+
+        :param self: Represent the instance of the class
+        :param r: redis.Redis: Connected Redis client
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.redis = r
+        await self.reload()
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def reload(self, force: bool = False) -> bool:
+
+        """
+        The reload function rebuilds the rules when the version counter in Redis has changed.
+        The new rules are compiled aside and swapped in with one assignment,
+        requests in flight keep using the rules they started with.
+        If the stored rules can not be compiled the old rules are kept and the error is counted.
+
+        :param self: Represent the instance of the class
+        :param force: bool: Rebuild even if the version is the same
+        :return: True if the rules were replaced
+        :doc-author: Trelent
+        """
+
+        if self.redis is None:
+            return False
+
+        try:
+            version = await self.redis.get(self.version_key)
+            if version == self.version and not force:
+                return False
+            ips = await self.redis.smembers(self.ips_key)
+            agents = await self.redis.smembers(self.agents_key)
+        except redis.RedisError:
+            self.reload_errors += 1
+            return False
+
+        try:
+            rules = BanRules(self.static_ips + [self._text(value) for value in ips],
+                             self.static_agents + [self._text(value) for value in agents])
+        except re.error as err:
+            self.reload_errors += 1
+            logger.error("ban rules not reloaded", extra={"version": self._text(version or b"")}, exc_info=err)
+            return False
+
+        self.rules = rules
+        self.version = version
+        self.reloads += 1
+
+        return True
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_seconds)
+            try:
+                await self.reload()
+            except Exception as err:
+                self.reload_errors += 1
+                logger.error("ban rules reload failed", exc_info=err)
+
+    @staticmethod
+    def _text(value: bytes | str) -> str:
+        return value.decode() if isinstance(value, bytes) else value
+
+    def is_banned(self, host: str | None, user_agent: str | None) -> bool:
+
+        """
+        The is_banned function checks the client address and the user-agent header of a request.
+        A missing header or a host that is not an IP address (e.g. a unix socket or the test client) is not banned.
+
+        :param self: Represent the instance of the class
+        :param host: str | None: Client address
+        :param user_agent: str | None: Value of the user-agent header
+        :return: True if the request must be rejected
+        :doc-author: Trelent
+        """
+
+        rules = self.rules
+        banned = rules.ip_banned(host) or rules.agent_banned(user_agent)
+        if banned:
+            self.blocked += 1
+
+        return banned
+
+    def stats(self) -> dict:
+        return {
+            "ips": self.rules.ip_count,
+            "agents": self.rules.agent_count,
+            "invalid": self.rules.invalid,
+            "blocked": self.blocked,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+        }
+
+
+ban_list = BanList()
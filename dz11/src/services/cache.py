@@ -0,0 +1,209 @@
+import json
+import logging
+import time
+from datetime import datetime
+
+import redis.asyncio as redis
+from sqlalchemy.orm import make_transient_to_detached
+
+from src.database.models import Role, User
+from src.conf.config import config
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FIELDS = ("id", "username", "email", "avatar", "role", "confirmed", "created_at", "updated_at")
+
+
+class UserCache:
+    prefix = f"user:v{SNAPSHOT_VERSION}:"
+    not_before_prefix = "user:not_before:"
+
+    def __init__(self, ttl: int = config.USER_CACHE_TTL, token_ttl: int = config.ACCESS_TOKEN_TTL) -> None:
+
+        """
+        The __init__ function sets up an empty cache. The Redis client is attached later by init(),
+        until then every lookup is a miss and every write is skipped.
+
+        :param self: Represent the instance of the class
+        :param ttl: int: Number of seconds a snapshot lives in Redis
+        :param token_ttl: int: Lifetime of an access token, a revocation is kept that long
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.redis: redis.Redis | None = None
+        self.ttl = ttl
+        self.token_ttl = token_ttl
+        self.hits = 0
+        self.misses = 0
+
+    def init(self, r: redis.Redis) -> None:
+
+        """
+        The init function attaches the Redis client created in the application lifespan.
+
+        :param self: Represent the instance of the class
+        :param r: redis.Redis: Connected Redis client
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.redis = r
+
+    def key(self, email: str) -> str:
+        return f"{self.prefix}{email}"
+
+    def not_before_key(self, email: str) -> str:
+        return f"{self.not_before_prefix}{email}"
+
+    @staticmethod
+    def dumps(user: User) -> bytes:
+
+        """
+        The dumps function packs the columns needed to authenticate a request into a compact JSON array.
+        The password hash and the refresh token are never written to the cache.
+
+        :param user: User: The user loaded from the database
+        :return: The snapshot bytes, prefixed with the snapshot version
+        :doc-author: Trelent
+        """
+
+        row = [SNAPSHOT_VERSION]
+        for field in SNAPSHOT_FIELDS:
+            value = getattr(user, field)
+            if isinstance(value, Role):
+                value = value.value
+            elif isinstance(value, datetime):
+                value = value.isoformat()
+            row.append(value)
+
+        return json.dumps(row, separators=(",", ":")).encode()
+
+    @staticmethod
+    def loads(data: bytes) -> User | None:
+
+        """
+        The loads function rebuilds a detached User from a snapshot.
+        Snapshots written by another version of the code are ignored.
+
+        :param data: bytes: The snapshot read from Redis
+        :return: A detached user object or None if the snapshot can not be used
+        :doc-author: Trelent
+        """
+
+        row = json.loads(data)
+        if not row or row[0] != SNAPSHOT_VERSION or len(row) != len(SNAPSHOT_FIELDS) + 1:
+            return None
+
+        values = dict(zip(SNAPSHOT_FIELDS, row[1:]))
+        values["role"] = Role(values["role"]) if values["role"] else None
+        for field in ("created_at", "updated_at"):
+            if values[field]:
+                values[field] = datetime.fromisoformat(values[field])
+
+        user = User(**values)
+        make_transient_to_detached(user)
+
+        return user
+
+    async def get_user(self, email: str) -> tuple[User | None, int]:
+
+        """
+        The get_user function returns the cached user for the given email, or None on a miss,
+        together with the time before which the access tokens of the user are revoked, 0 when they are not.
+        Both are read with one MGET. Redis errors are counted as misses so authentication falls back to the database.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user
+        :return: A detached user object or None and the not before timestamp
+        :doc-author: Trelent
+        """
+
+        data, not_before = None, None
+        if self.redis is not None:
+            try:
+                data, not_before = await self.redis.mget(self.key(email), self.not_before_key(email))
+            except redis.RedisError:
+                data, not_before = None, None
+
+        user = self.loads(data) if data else None
+        if user is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return user, int(not_before or 0)
+
+    async def set_user(self, user: User) -> None:
+
+        """
+        The set_user function stores a snapshot of the user with the configured TTL.
+
+        :param self: Represent the instance of the class
+        :param user: User: The user loaded from the database
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(self.key(user.email), self.dumps(user), ex=self.ttl)
+        except redis.RedisError:
+            pass
+
+    async def invalidate(self, email: str) -> None:
+
+        """
+        The invalidate function drops the snapshot of the user, the next request reloads it from the database.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the changed user
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self.redis is None:
+            return
+        try:
+            await self.redis.delete(self.key(email))
+        except redis.RedisError:
+            pass
+
+    async def revoke_tokens(self, email: str) -> None:
+
+        """
+        The revoke_tokens function rejects every access token of the user issued up to now.
+        The not before timestamp is kept for the lifetime of an access token, older tokens have expired by then.
+        Tokens issued in the same second are rejected too, the iat claim has a resolution of one second.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(self.not_before_key(email), int(time.time()) + 1, ex=self.token_ttl)
+        except redis.RedisError as err:
+            logger.error("access tokens not revoked", exc_info=err)
+
+    def stats(self) -> dict:
+
+        """
+        The stats function returns the hit and miss counters of this worker.
+
+        :param self: Represent the instance of the class
+        :return: A dict with hits, misses and hit_rate
+        :doc-author: Trelent
+        """
+
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+user_cache = UserCache()
@@ -0,0 +1,65 @@
+import base64
+import hashlib
+import hmac
+import json
+
+from fastapi import HTTPException, status
+
+from src.conf.config import config
+
+
+class CursorSigner:
+    def __init__(self, secret: str = config.SECRET_KEY_JWT) -> None:
+        self.secret = secret.encode()
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self.secret, payload, hashlib.sha256).digest()[:12]
+
+    def encode(self, scope: str, last_id: int) -> str:
+
+        """
+        The encode function builds an opaque cursor pointing after the contact with last_id.
+        The cursor is signed, so clients can not forge it or reuse it for another listing.
+
+        :param self: Represent the instance of the class
+        :param scope: str: The listing the cursor belongs to, for example the user id or all
+        :param last_id: int: Id of the last contact on the page
+        :return: The cursor string
+        :doc-author: Trelent
+        """
+
+        payload = json.dumps([scope, last_id], separators=(",", ":")).encode()
+        token = base64.urlsafe_b64encode(payload + self._sign(payload))
+
+        return token.decode().rstrip("=")
+
+    def decode(self, scope: str, cursor: str) -> int:
+
+        """
+        The decode function checks the signature and the scope of the cursor and returns the id to continue from.
+
+        :param self: Represent the instance of the class
+        :param scope: str: The listing the cursor must belong to
+        :param cursor: str: The cursor sent by the client
+        :return: Id of the last contact of the previous page
+        :doc-author: Trelent
+        """
+
+        invalid = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            payload, signature = raw[:-12], raw[-12:]
+            if not hmac.compare_digest(signature, self._sign(payload)):
+                raise invalid
+            cursor_scope, last_id = json.loads(payload)
+        except (ValueError, TypeError):
+            raise invalid
+
+        if cursor_scope != scope or not isinstance(last_id, int):
+            raise invalid
+
+        return last_id
+
+
+cursor_signer = CursorSigner()
@@ -1,54 +1,99 @@
-from pathlib import Path
+import json
+import logging
+import time
+import uuid
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import redis.asyncio as redis
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
-from src.conf.config import config
 
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=config.MAIL_USERNAME,
-    MAIL_PASSWORD=config.MAIL_PASSWORD,
-    MAIL_FROM=config.MAIL_USERNAME,
-    MAIL_PORT=config.MAIL_PORT,
-    MAIL_SERVER=config.MAIL_SERVER,
-    MAIL_FROM_NAME="TODO Systems",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-    )
+logger = logging.getLogger(__name__)
+
+
+class EmailOutbox:
+    outbox_key = "email:outbox"
+    retry_key = "email:retry"
+    dead_key = "email:dead"
+
+    def __init__(self) -> None:
+        self.redis: redis.Redis | None = None
+
+    def init(self, r: redis.Redis) -> None:
+
+        """
+        The init function attaches the Redis client created in the application lifespan or by the email worker.
+
+        :param self: Represent the instance of the class
+        :param r: redis.Redis: Connected Redis client
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.redis = r
+
+    @staticmethod
+    def processing_key(worker: str) -> str:
+        return f"email:processing:{worker}"
+
+    async def enqueue(self, template: str, subject: str, recipient: str, body: dict) -> str:
+
+        """
+        The enqueue function stores a message in the Redis outbox, the email worker renders and sends it.
+        Redis persists the outbox, a message survives a restart of the web or the email worker.
+
+        :param self: Represent the instance of the class
+        :param template: str: Name of the template in src/services/templates
+        :param subject: str: Subject of the message
+        :param recipient: str: Email address of the recipient
+        :param body: dict: Template variables
+        :return: The id of the queued message
+        :doc-author: Trelent
+        """
+
+        if self.redis is None:
+            raise RuntimeError("Email outbox is not initialized")
+
+        job = {"id": uuid.uuid4().hex, "template": template, "subject": subject, "to": recipient, "body": body,
+               "attempts": 0, "queued_at": time.time()}
+        await self.redis.lpush(self.outbox_key, json.dumps(job, separators=(",", ":")))
+
+        return job["id"]
+
+    async def depth(self) -> dict:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.llen(self.outbox_key).zcard(self.retry_key).llen(self.dead_key)
+            outbox, retry, dead = await pipe.execute()
+
+        return {"outbox": outbox, "retry": retry, "dead": dead}
+
+
+email_outbox = EmailOutbox()
 
 
 async def send_email(email: EmailStr, username: str, host: str):
-    
+
     """
-    The send_email function sends an email to the user with a link to verify their email address.
+    The send_email function queues an email to the user with a link to verify their email address.
         The function takes in three arguments:
             -email: the user's email address, which is used as a unique identifier for them.
             -username: the username of the user, which is displayed in the body of the message.
             -host: this is used to construct a URL that will be sent in an HTML template.
-    
+        The message is delivered by the email worker (python -m src.services.email_worker).
+        If the outbox is not reachable the error is logged, the user can ask for the email again.
+
     :param email: EmailStr: Pass the email address to send the message to
     :param username: str: Pass the username to the template
     :param host: str: Pass the hostname of the server to which we want to redirect our user after he/she has confirmed his/her email
     :return: A coroutine object
     :doc-author: Trelent
     """
-    
+
     try:
         token_verification = auth_service.create_email_token({"sub":email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-            )
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="verify_email.html")
-        
-    except ConnectionErrors as err:
-        print(err)
\ No newline at end of file
+        await email_outbox.enqueue("verify_email.html", "Confirm your email ", email,
+                                   {"host": host, "username": username, "token": token_verification})
+
+    except (redis.RedisError, RuntimeError) as err:
+        logger.error("verification email was not queued", extra={"recipient": email}, exc_info=err)
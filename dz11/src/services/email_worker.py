@@ -0,0 +1,359 @@
+import asyncio
+import json
+import logging
+import signal
+import time
+from email.message import EmailMessage
+from email.utils import formataddr
+from pathlib import Path
+
+import aiosmtplib
+import redis.asyncio as redis
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from src.conf.config import config
+from src.services.email import EmailOutbox, email_outbox
+from src.services.logger import log_pipeline
+from src.services.metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+
+templates = Environment(loader=FileSystemLoader(Path(__file__).parent / "templates"), autoescape=select_autoescape())
+
+
+def render(job: dict) -> EmailMessage:
+
+    """
+    The render function builds the MIME message of a queued job from its template.
+
+    :param job: dict: The job stored in the outbox
+    :return: The message ready to send
+    :doc-author: Trelent
+    """
+
+    message = EmailMessage()
+    message["From"] = formataddr(("TODO Systems", config.MAIL_USERNAME))
+    message["To"] = job["to"]
+    message["Subject"] = job["subject"]
+    message.set_content(templates.get_template(job["template"]).render(**job["body"]), subtype="html")
+
+    return message
+
+
+class SMTPPool:
+    def __init__(self, size: int = config.EMAIL_SMTP_CONNECTIONS) -> None:
+
+        """
+        The __init__ function sets up a pool of persistent SMTP connections.
+        Connections are opened on first use and kept open between batches, so the connect, TLS handshake
+        and login are paid once per connection and not once per message.
+
+        :param self: Represent the instance of the class
+        :param size: int: Number of connections
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.size = size
+        self.clients = [self.client() for _ in range(size)]
+        self._idle: asyncio.Queue[aiosmtplib.SMTP] = asyncio.Queue()
+        for client in self.clients:
+            self._idle.put_nowait(client)
+        self.connects = 0
+
+    @staticmethod
+    def client() -> aiosmtplib.SMTP:
+        return aiosmtplib.SMTP(
+            hostname=config.MAIL_SERVER,
+            port=config.MAIL_PORT,
+            username=config.MAIL_USERNAME if config.MAIL_USE_CREDENTIALS else None,
+            password=config.MAIL_PASSWORD if config.MAIL_USE_CREDENTIALS else None,
+            use_tls=config.MAIL_SSL_TLS,
+            start_tls=config.MAIL_STARTTLS,
+            validate_certs=config.MAIL_VALIDATE_CERTS,
+            timeout=config.EMAIL_SMTP_TIMEOUT,
+        )
+
+    def connected(self) -> int:
+        return sum(1 for client in self.clients if client.is_connected)
+
+    async def send(self, message: EmailMessage) -> None:
+
+        """
+        The send function sends a message over an idle connection of the pool.
+        A connection the server has closed since the last batch is reopened and the message is sent once more.
+
+        :param self: Represent the instance of the class
+        :param message: EmailMessage: The message
+        :return: None
+        :doc-author: Trelent
+        """
+
+        client = await self._idle.get()
+        try:
+            for attempt in range(2):
+                if not client.is_connected:
+                    await client.connect()
+                    self.connects += 1
+                try:
+                    await client.send_message(message)
+                    return
+                except aiosmtplib.SMTPServerDisconnected:
+                    client.close()
+                    if attempt:
+                        raise
+        except Exception:
+            if client.is_connected:
+                client.close()
+            raise
+        finally:
+            self._idle.put_nowait(client)
+
+    async def close(self) -> None:
+        for client in self.clients:
+            if client.is_connected:
+                try:
+                    await client.quit()
+                except aiosmtplib.SMTPException:
+                    client.close()
+
+
+class EmailWorker:
+    def __init__(self, outbox: EmailOutbox, pool: SMTPPool, name: str = config.EMAIL_WORKER_NAME,
+                 batch_size: int = config.EMAIL_BATCH_SIZE, max_attempts: int = config.EMAIL_MAX_ATTEMPTS,
+                 backoff_seconds: float = config.EMAIL_BACKOFF_SECONDS, backoff_max: float = config.EMAIL_BACKOFF_MAX_SECONDS) -> None:
+
+        """
+        The __init__ function configures the worker.
+
+        :param self: Represent the instance of the class
+        :param outbox: EmailOutbox: The outbox with an attached Redis client
+        :param pool: SMTPPool: The SMTP connections
+        :param name: str: Name of the worker, messages being sent are parked in email:processing:<name>
+        :param batch_size: int: How many messages are taken from the outbox at once
+        :param max_attempts: int: How many times a message is tried before it goes to email:dead
+        :param backoff_seconds: float: Delay before the first retry, doubled on every further attempt
+        :param backoff_max: float: Longest delay between two attempts
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.outbox = outbox
+        self.pool = pool
+        self.processing_key = outbox.processing_key(name)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max = backoff_max
+        self.stopping = False
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dead = 0
+        self.batches = 0
+        self.send_seconds = 0.0
+        self.queued = {"outbox": 0, "retry": 0, "dead": 0}
+
+    @property
+    def redis(self) -> redis.Redis:
+        return self.outbox.redis
+
+    async def recover(self) -> int:
+
+        """
+        The recover function puts back the messages a previous run of this worker took but did not finish.
+
+        :param self: Represent the instance of the class
+        :return: Number of recovered messages
+        :doc-author: Trelent
+        """
+
+        count = 0
+        while await self.redis.lmove(self.processing_key, self.outbox.outbox_key, "LEFT", "RIGHT"):
+            count += 1
+        return count
+
+    async def promote(self) -> None:
+
+        """
+        The promote function moves the retries that are due back to the outbox.
+        Only the worker that removes a retry from the sorted set requeues it, so several workers can share the outbox.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        due = await self.redis.zrangebyscore(self.outbox.retry_key, "-inf", time.time(), start=0, num=self.batch_size)
+        for raw in due:
+            if await self.redis.zrem(self.outbox.retry_key, raw):
+                await self.redis.rpush(self.outbox.outbox_key, raw)
+
+    async def fetch(self, timeout: float = 1.0) -> list[bytes]:
+
+        """
+        The fetch function takes up to batch_size messages from the outbox, waiting up to timeout seconds for the first one.
+        Taken messages are moved atomically to the processing list of the worker.
+
+        :param self: Represent the instance of the class
+        :param timeout: float: How long to wait for an empty outbox
+        :return: The raw jobs
+        :doc-author: Trelent
+        """
+
+        raw = await self.redis.blmove(self.outbox.outbox_key, self.processing_key, timeout, "RIGHT", "LEFT")
+        if raw is None:
+            return []
+
+        batch = [raw]
+        while len(batch) < self.batch_size:
+            raw = await self.redis.lmove(self.outbox.outbox_key, self.processing_key, "RIGHT", "LEFT")
+            if raw is None:
+                break
+            batch.append(raw)
+
+        return batch
+
+    def backoff(self, attempts: int) -> float:
+        return min(self.backoff_seconds * 2 ** (attempts - 1), self.backoff_max)
+
+    async def deliver(self, raw: bytes) -> None:
+
+        """
+        The deliver function sends one message and settles it: it is dropped from the processing list when sent,
+        scheduled for a retry with exponential backoff when sending failed for any reason, and moved to email:dead
+        after max_attempts failures or when it can not be rendered.
+
+        :param self: Represent the instance of the class
+        :param raw: bytes: The job as stored in the outbox
+        :return: None
+        :doc-author: Trelent
+        """
+
+        started = time.perf_counter()
+        try:
+            job = json.loads(raw)
+            message = render(job)
+        except Exception as err:
+            logger.error("email job can not be rendered", exc_info=err)
+            self.dead += 1
+            await self.redis.lpush(self.outbox.dead_key, raw)
+            await self.redis.lrem(self.processing_key, 1, raw)
+            return
+
+        try:
+            await self.pool.send(message)
+        except Exception as err:
+            if not isinstance(err, (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError)):
+                logger.error("unexpected email send error", exc_info=err, extra={"job_id": job["id"]})
+            self.failed += 1
+            job["attempts"] += 1
+            job["error"] = str(err)
+            retry = json.dumps(job, separators=(",", ":"))
+            if job["attempts"] >= self.max_attempts:
+                self.dead += 1
+                logger.error("email dropped after %s attempts", job["attempts"], extra={"job_id": job["id"], "recipient": job["to"]})
+                await self.redis.lpush(self.outbox.dead_key, retry)
+            else:
+                self.retried += 1
+                delay = self.backoff(job["attempts"])
+                logger.warning("email send failed, retry in %.0fs", delay, extra={"job_id": job["id"], "error": str(err)})
+                await self.redis.zadd(self.outbox.retry_key, {retry: time.time() + delay})
+        else:
+            self.sent += 1
+        finally:
+            self.send_seconds += time.perf_counter() - started
+
+        await self.redis.lrem(self.processing_key, 1, raw)
+
+    async def run_once(self, timeout: float = 1.0) -> int:
+        await self.promote()
+        batch = await self.fetch(timeout)
+        if batch:
+            self.batches += 1
+            await asyncio.gather(*(self.deliver(raw) for raw in batch))
+        self.queued = await self.outbox.depth()
+        return len(batch)
+
+    async def run(self) -> None:
+
+        """
+        The run function sends messages until stop() is called. Redis errors and unexpected errors
+        pause the loop instead of ending it, unfinished messages stay in the processing list.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        recovered = await self.recover()
+        if recovered:
+            logger.info("requeued unfinished emails", extra={"count": recovered})
+
+        while not self.stopping:
+            try:
+                await self.run_once()
+            except redis.RedisError as err:
+                logger.error("email outbox unavailable", exc_info=err)
+                await asyncio.sleep(1)
+            except Exception as err:
+                logger.error("email worker loop failed", exc_info=err)
+                await asyncio.sleep(1)
+
+        await self.pool.close()
+
+    def stop(self) -> None:
+        self.stopping = True
+
+    def collect(self) -> list[tuple[str, dict, float]]:
+        return [
+            ("email_sent_total", {}, self.sent),
+            ("email_failed_total", {}, self.failed),
+            ("email_retried_total", {}, self.retried),
+            ("email_dead_total", {}, self.dead),
+            ("email_batches_total", {}, self.batches),
+            ("email_send_seconds_total", {}, self.send_seconds),
+            ("email_queue_depth", {"queue": "outbox"}, self.queued["outbox"]),
+            ("email_queue_depth", {"queue": "retry"}, self.queued["retry"]),
+            ("email_queue_depth", {"queue": "dead"}, self.queued["dead"]),
+            ("smtp_connections", {}, self.pool.connected()),
+        ]
+
+
+async def main() -> None:
+
+    """
+    The main function runs the email worker until SIGINT or SIGTERM:
+
+        python -m src.services.email_worker
+
+    Its counters are written to METRICS_DIR and show up on /metrics of the web workers.
+
+    :return: None
+    :doc-author: Trelent
+    """
+
+    log_pipeline.start()
+    r = redis.Redis(host=config.REDIS_DOMAIN, port=config.REDIS_PORT, password=config.REDIS_PASSWORD, db=0)
+    email_outbox.init(r)
+
+    worker = EmailWorker(email_outbox, SMTPPool())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    metrics = Metrics()
+    metrics.add_collector(worker.collect)
+    await metrics.start()
+    try:
+        await worker.run()
+    finally:
+        await metrics.stop()
+        await r.aclose()
+        log_pipeline.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
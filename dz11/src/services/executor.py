@@ -0,0 +1,152 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class ExecutorBusy(Exception):
+    pass
+
+
+class BoundedExecutor:
+    executors = {"process": ProcessPoolExecutor, "thread": ThreadPoolExecutor, "inline": None}
+    name = "executor"
+    busy = ExecutorBusy
+
+    def __init__(self, kind: str = "process", max_workers: int | None = None, max_pending: int = 256,
+                 queue_timeout: float = 5.0) -> None:
+
+        """
+        The __init__ function configures the executor, the pool itself is created on first use or by start().
+        Subclasses set name and busy, the exception raised when the queue is full.
+
+        :param self: Represent the instance of the class
+        :param kind: str: process, thread or inline (runs the calls in the event loop, only for tests)
+        :param max_workers: int | None: Size of the pool, defaults to the number of cores
+        :param max_pending: int: How many calls may wait for a free worker before new ones are rejected
+        :param queue_timeout: float: How many seconds a call may wait for a free worker
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if kind not in self.executors:
+            raise ValueError(f"unknown {self.name} executor: {kind}")
+
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._pool: Executor | None = None
+        self._slots = asyncio.Semaphore(self.max_workers)
+
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+        self.max_run_seconds = 0.0
+
+    def start(self) -> None:
+
+        """
+        The start function creates the worker pool. It is called from the application lifespan.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        executor = self.executors[self.kind]
+        if self._pool is None and executor is not None:
+            self._pool = executor(max_workers=self.max_workers)
+
+    def shutdown(self) -> None:
+
+        """
+        The shutdown function stops the worker pool and waits for the running calls.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, func, *args):
+
+        """
+        The run function sends func(*args) to the pool.
+        Calls queue for a free worker, when the queue is full or the wait is too long the busy exception is raised
+        so the caller can shed load instead of piling up requests.
+
+        :param self: Represent the instance of the class
+        :param func: Module level function to run, it must be picklable for the process pool
+        :param args: Arguments for func
+        :return: The result of func
+        :doc-author: Trelent
+        """
+
+        if self.kind == "inline":
+            return self._timed(func, *args)
+
+        if self._slots.locked() and self.waiting >= self.max_pending:
+            self.rejected += 1
+            raise self.busy(f"{self.name} queue is full")
+
+        self.start()
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise self.busy(f"{self.name} queue timeout")
+        finally:
+            self.waiting -= 1
+
+        self.wait_seconds += time.perf_counter() - queued_at
+        self.running += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+        finally:
+            self._record(time.perf_counter() - started)
+            self.running -= 1
+            self._slots.release()
+
+    def _timed(self, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self._record(time.perf_counter() - started)
+
+    def _record(self, elapsed: float) -> None:
+        self.completed += 1
+        self.run_seconds += elapsed
+        self.max_run_seconds = max(self.max_run_seconds, elapsed)
+
+    def stats(self) -> dict:
+
+        """
+        The stats function reports the queue depth and the call latency of this worker.
+
+        :param self: Represent the instance of the class
+        :return: A dict with the executor counters
+        :doc-author: Trelent
+        """
+
+        return {
+            "executor": self.kind,
+            "workers": self.max_workers,
+            "queue_depth": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_seconds": self.wait_seconds / self.completed if self.completed else 0.0,
+            "avg_run_seconds": self.run_seconds / self.completed if self.completed else 0.0,
+            "max_run_seconds": self.max_run_seconds,
+        }
@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date
+from typing import AsyncIterator
+
+from fastapi import HTTPException, status
+
+from src.database.db import sessonmanager
+from src.repository import contacts as repository_contacts
+
+
+EXPORT_FIELDS = ("id", "first_name", "last_name", "email", "phone_number", "birthday", "data", "created_at", "updated_at", "user_id")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def parse_fields(fields: str | None) -> list[str]:
+
+    """
+    The parse_fields function checks the comma separated list of columns requested by the client.
+
+    :param fields: str | None: Comma separated column names, all columns when empty
+    :return: A list of column names
+    :doc-author: Trelent
+    """
+
+    if not fields:
+        return list(EXPORT_FIELDS)
+
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in EXPORT_FIELDS]
+    if unknown or not names:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    return names
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class ContactExporter:
+    def __init__(self, chunk_rows: int = 500) -> None:
+        self.chunk_rows = chunk_rows
+
+    async def encode(self, rows: AsyncIterator, fields: list[str], fmt: str) -> AsyncIterator[bytes]:
+
+        """
+        The encode function turns database rows into ndjson or csv, chunk_rows rows per chunk.
+
+        :param self: Represent the instance of the class
+        :param rows: AsyncIterator: Rows with the requested columns in order
+        :param fields: list[str]: Column names
+        :param fmt: str: ndjson or csv
+        :return: An async iterator of encoded chunks
+        :doc-author: Trelent
+        """
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        count = 0
+
+        if writer:
+            writer.writerow(fields)
+
+        async for row in rows:
+            if writer:
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(zip(fields, row)), default=_json_default, ensure_ascii=False))
+                buffer.write("\n")
+
+            count += 1
+            if count % self.chunk_rows == 0:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+    @staticmethod
+    async def gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        compressor = zlib.compressobj(wbits=31)
+        async for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    async def export(self, user_id: int | None, fields: list[str], fmt: str, compress: bool) -> AsyncIterator[bytes]:
+
+        """
+        The export function streams the contacts of a user (or all contacts when user_id is None).
+        It opens its own session because the response body is sent after the request dependencies are closed.
+        Rows come from a server-side cursor as plain tuples, no ORM objects are built.
+
+        :param self: Represent the instance of the class
+        :param user_id: int | None: Owner of the contacts, None for every contact
+        :param fields: list[str]: Column names to export
+        :param fmt: str: ndjson or csv
+        :param compress: bool: Gzip the output
+        :return: An async iterator of response body chunks
+        :doc-author: Trelent
+        """
+
+        async with sessonmanager.session() as db:
+            rows = repository_contacts.stream_contacts(fields, db, user_id)
+            chunks = self.encode(rows, fields, fmt)
+            if compress:
+                chunks = self.gzip(chunks)
+
+            async for chunk in chunks:
+                yield chunk
+
+
+contact_exporter = ContactExporter()
@@ -0,0 +1,50 @@
+from passlib.context import CryptContext
+
+from src.conf.config import config
+from src.services.executor import BoundedExecutor, ExecutorBusy
+
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class HashingBusy(ExecutorBusy):
+    pass
+
+
+class HashingExecutor(BoundedExecutor):
+    name = "hashing"
+    busy = HashingBusy
+
+    def __init__(self, kind: str = config.HASH_EXECUTOR, max_workers: int | None = config.HASH_WORKERS,
+                 max_pending: int = config.HASH_MAX_PENDING, queue_timeout: float = config.HASH_QUEUE_TIMEOUT) -> None:
+
+        """
+        The __init__ function configures the bcrypt pool from the HASH_* settings.
+
+        :param self: Represent the instance of the class
+        :param kind: str: process, thread or inline (runs bcrypt in the event loop, only for tests)
+        :param max_workers: int | None: Size of the pool, defaults to the number of cores
+        :param max_pending: int: How many calls may wait for a free worker before new ones are rejected
+        :param queue_timeout: float: How many seconds a call may wait for a free worker
+        :return: None
+        :doc-author: Trelent
+        """
+
+        super().__init__(kind=kind, max_workers=max_workers, max_pending=max_pending, queue_timeout=queue_timeout)
+
+    async def hash(self, password: str) -> str:
+        return await self.run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.run(verify_password, plain_password, hashed_password)
+
+
+hasher = HashingExecutor()
@@ -0,0 +1,176 @@
+import codecs
+import csv
+import json
+import time
+from typing import AsyncIterator
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import config
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+from src.schemas.contacts import ContactSchema
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+
+    """
+    The iter_lines function splits a stream of utf-8 byte chunks into text lines.
+    Only the current incomplete line is kept in memory.
+
+    :param chunks: AsyncIterator[bytes]: The request body stream
+    :return: An async iterator of lines without the line break
+    :doc-author: Trelent
+    """
+
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def parse_csv(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict | str]]:
+
+    """
+    The parse_csv function turns csv lines into records keyed by the header row.
+    Quoted fields may contain commas but not line breaks.
+
+    :param lines: AsyncIterator[str]: Lines of the upload
+    :return: An async iterator of (line number, record or parse error)
+    :doc-author: Trelent
+    """
+
+    header = None
+    line_no = 0
+
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+
+        try:
+            values = next(csv.reader([line]))
+        except csv.Error as err:
+            yield line_no, str(err)
+            continue
+
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+
+        if len(values) != len(header):
+            yield line_no, f"expected {len(header)} fields, got {len(values)}"
+            continue
+
+        yield line_no, {name: value for name, value in zip(header, values) if value != ""}
+
+
+async def parse_ndjson(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict | str]]:
+
+    """
+    The parse_ndjson function turns every non-empty line into a JSON object.
+
+    :param lines: AsyncIterator[str]: Lines of the upload
+    :return: An async iterator of (line number, record or parse error)
+    :doc-author: Trelent
+    """
+
+    line_no = 0
+
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+
+        try:
+            record = json.loads(line)
+        except ValueError as err:
+            yield line_no, f"invalid json: {err}"
+            continue
+
+        if not isinstance(record, dict):
+            yield line_no, "expected a json object"
+            continue
+
+        yield line_no, record
+
+
+class ContactImporter:
+    parsers = {"csv": parse_csv, "ndjson": parse_ndjson}
+
+    def __init__(self, batch_size: int = config.IMPORT_BATCH_SIZE, max_errors: int = config.IMPORT_MAX_ERRORS) -> None:
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+
+    async def run(self, chunks: AsyncIterator[bytes], fmt: str, db: AsyncSession, user: User) -> dict:
+
+        """
+        The run function imports contacts from a streamed upload.
+        Records are validated against ContactSchema and written batch_size at a time,
+        so memory use depends on the batch size and not on the size of the upload.
+        Only the first max_errors row errors are kept in the report, the rest are only counted.
+
+        :param self: Represent the instance of the class
+        :param chunks: AsyncIterator[bytes]: The request body stream
+        :param fmt: str: csv or ndjson
+        :param db: AsyncSession: Pass the database session to the function
+        :param user: User: The owner of the imported contacts
+        :return: A report with counters, row errors and throughput
+        :doc-author: Trelent
+        """
+
+        started = time.perf_counter()
+        report = {"total": 0, "imported": 0, "failed": 0, "errors": []}
+        batch: list[dict] = []
+        batch_lines: list[int] = []
+
+        def fail(line_no: int, error: str) -> None:
+            report["failed"] += 1
+            if len(report["errors"]) < self.max_errors:
+                report["errors"].append({"line": line_no, "error": error})
+
+        async def flush() -> None:
+            if not batch:
+                return
+            failed = await repository_contacts.insert_contacts(batch, db, user)
+            for index, error in failed:
+                fail(batch_lines[index], error)
+            report["imported"] += len(batch) - len(failed)
+            batch.clear()
+            batch_lines.clear()
+
+        async for line_no, record in self.parsers[fmt](iter_lines(chunks)):
+            report["total"] += 1
+            if isinstance(record, str):
+                fail(line_no, record)
+                continue
+
+            try:
+                contact = ContactSchema.model_validate(record)
+            except ValidationError as err:
+                fail(line_no, "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in err.errors()))
+                continue
+
+            batch.append(contact.model_dump())
+            batch_lines.append(line_no)
+            if len(batch) >= self.batch_size:
+                await flush()
+
+        await flush()
+
+        report["seconds"] = time.perf_counter() - started
+        report["rows_per_second"] = report["total"] / report["seconds"] if report["seconds"] else 0.0
+
+        return report
+
+
+contact_importer = ContactImporter()
@@ -0,0 +1,213 @@
+import copy
+import json
+import logging
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+from enum import Enum
+from logging.handlers import QueueHandler, QueueListener
+
+from src.conf.config import config
+
+
+SECRET_KEYS = re.compile(r"authorization|password|secret|token|cookie", re.IGNORECASE)
+SECRET_VALUES = (
+    (re.compile(r"(Bearer\s+)\S+", re.IGNORECASE), r"\1***"),
+    (re.compile(r"eyJ[\w-]+\.[\w-]+\.[\w-]+"), "***"),
+)
+RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def redact(value):
+
+    """
+    The redact function masks secrets in a log value: bearer tokens and JWTs inside strings,
+    and the values of keys such as authorization, password or token inside dicts and lists.
+
+    :param value: Any: The value to clean
+    :return: A copy of the value without secrets
+    :doc-author: Trelent
+    """
+
+    if isinstance(value, str):
+        for pattern, replacement in SECRET_VALUES:
+            value = pattern.sub(replacement, value)
+        return value
+    if isinstance(value, dict):
+        return {key: "***" if SECRET_KEYS.search(str(key)) else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, Enum):
+        return value.value
+    return str(value)
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+
+        """
+        The format function writes one JSON object per record.
+        Values passed with extra= become top level keys, secrets are redacted.
+
+        :param self: Represent the instance of the class
+        :param record: logging.LogRecord: The record to format
+        :return: A JSON line
+        :doc-author: Trelent
+        """
+
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_FIELDS and not key.startswith("_"):
+                data[key] = "***" if SECRET_KEYS.search(key) else value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+
+        return json.dumps(redact(data), default=_json_default, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates: dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+
+        """
+        The filter function keeps only a share of the records of high volume events.
+        The event is given with extra={"event": ...}, the share comes from the settings.
+        Warnings and errors are never dropped.
+
+        :param self: Represent the instance of the class
+        :param record: logging.LogRecord: The record to check
+        :return: True if the record is kept
+        :doc-author: Trelent
+        """
+
+        rate = self.rates.get(getattr(record, "event", None))
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        if random.random() >= rate:
+            return False
+
+        record.sample_rate = rate
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, q: queue.Queue) -> None:
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+
+        """
+        The prepare function merges the message arguments in the calling thread, so later changes to them
+        do not show up in the log. Unlike the stock handler the record is not formatted here,
+        the listener thread does the JSON encoding and the traceback formatting.
+
+        :param self: Represent the instance of the class
+        :param record: logging.LogRecord: The record to enqueue
+        :return: A copy of the record ready for the queue
+        :doc-author: Trelent
+        """
+
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    def __init__(self, level: str = config.LOG_LEVEL, queue_size: int = config.LOG_QUEUE_SIZE,
+                 sample_rates: dict[str, float] = config.LOG_SAMPLE_RATES) -> None:
+
+        """
+        The __init__ function configures the pipeline, nothing is installed until start() is called.
+
+        :param self: Represent the instance of the class
+        :param level: str: Level of the root logger
+        :param queue_size: int: How many records may wait for the listener before new ones are dropped
+        :param sample_rates: dict[str, float]: Share of records kept per event name
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.level = level
+        self.queue: queue.Queue = queue.Queue(queue_size)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.handler.addFilter(SamplingFilter(sample_rates))
+        self.listener: QueueListener | None = None
+
+    def start(self) -> None:
+
+        """
+        The start function routes every logger to the in-memory queue and starts the listener thread
+        that formats the records as JSON and writes them to stdout.
+        Logging calls on the request path only put the record on the queue, a full queue drops the record
+        instead of blocking.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self.listener is not None:
+            return
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, output, respect_handler_level=True)
+
+        root = logging.getLogger()
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers = []
+            uvicorn_logger.propagate = True
+
+        self.listener.start()
+
+    def stop(self) -> None:
+
+        """
+        The stop function detaches the queue handler and writes out the records that are still queued.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self.listener is None:
+            return
+
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()
+        self.listener = None
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "dropped": self.handler.dropped}
+
+
+log_pipeline = LogPipeline()
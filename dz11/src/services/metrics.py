@@ -0,0 +1,451 @@
+import asyncio
+import bisect
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable
+
+import redis.asyncio as redis
+
+from src.conf.config import config
+from src.database.db import sessonmanager
+from src.services.banlist import ban_list
+from src.services.cache import user_cache
+from src.services.hashing import hasher
+from src.services.logger import log_pipeline
+from src.services.ratelimit import rate_limiter
+from src.services.refresh_tokens import refresh_tokens
+from src.services.token_cache import token_cache
+from src.services.versions import contact_versions
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROUTE_GROUPS = ("/api/contacts", "/api/auth", "/api/users")
+
+FAMILIES = {
+    "http_requests_total": ("counter", "Finished HTTP requests by route and status"),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by route"),
+    "http_requests_in_flight": ("gauge", "HTTP requests being handled by route group"),
+    "db_pool_connections": ("gauge", "Database pool connections by state"),
+    "db_pool_checkouts_total": ("counter", "Database pool checkouts"),
+    "db_pool_timeouts_total": ("counter", "Database pool checkouts that timed out"),
+    "db_pool_wait_seconds_total": ("counter", "Time spent waiting for a database connection"),
+    "redis_pool_connections": ("gauge", "Redis client connections by state"),
+    "user_cache_requests_total": ("counter", "User cache lookups by result"),
+    "token_cache_requests_total": ("counter", "Verified token cache lookups by result"),
+    "token_cache_entries": ("gauge", "Verified tokens held in the cache"),
+    "refresh_tokens_total": ("counter", "Refresh token sessions by event"),
+    "contacts_not_modified_total": ("counter", "Contact reads answered with 304 Not Modified"),
+    "hash_queue_depth": ("gauge", "Password hash calls waiting for a worker"),
+    "hash_running": ("gauge", "Password hash calls running"),
+    "hash_completed_total": ("counter", "Password hash calls completed"),
+    "hash_rejected_total": ("counter", "Password hash calls rejected by load shedding"),
+    "hash_seconds_total": ("counter", "Time spent hashing passwords"),
+    "ban_blocked_total": ("counter", "Requests rejected by the ban list"),
+    "log_dropped_total": ("counter", "Log records dropped because the queue was full"),
+    "rate_limit_requests_total": ("counter", "Rate limited requests by result"),
+    "rate_limit_redis_calls_total": ("counter", "Rate limiter round trips to Redis by kind"),
+    "rate_limit_keys": ("gauge", "Rate limit buckets held by the worker"),
+    "rate_limit_degraded": ("gauge", "1 while the rate limiter runs without Redis"),
+    "email_sent_total": ("counter", "Emails delivered to the SMTP server"),
+    "email_failed_total": ("counter", "Email send attempts that failed"),
+    "email_retried_total": ("counter", "Emails scheduled for another attempt"),
+    "email_dead_total": ("counter", "Emails given up on"),
+    "email_batches_total": ("counter", "Batches taken from the email outbox"),
+    "email_send_seconds_total": ("counter", "Time spent sending emails"),
+    "email_queue_depth": ("gauge", "Emails waiting by queue"),
+    "smtp_connections": ("gauge", "Open SMTP connections of the email workers"),
+}
+
+
+def series(name: str, **labels) -> str:
+    if not labels:
+        return name
+    values = ",".join(f'{key}="{str(value)}"' for key, value in labels.items())
+    return f"{name}{{{values}}}"
+
+
+def route_group(path: str) -> str:
+    for group in ROUTE_GROUPS:
+        if path.startswith(group):
+            return group
+    return "other"
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+    def samples(self, name: str, **labels) -> dict[str, float]:
+        result = {}
+        total = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            total += count
+            result[series(f"{name}_bucket", **labels, le="+Inf" if bound == float("inf") else bound)] = total
+        result[series(f"{name}_sum", **labels)] = self.sum
+        result[series(f"{name}_count", **labels)] = total
+        return result
+
+
+class Metrics:
+    def __init__(self, directory: str = config.METRICS_DIR, flush_seconds: float = config.METRICS_FLUSH_SECONDS) -> None:
+
+        """
+        The __init__ function sets up the in-process metrics of one worker.
+        Each worker writes its snapshot to <directory>/<pid>-<start>.json, /metrics merges the snapshots of all workers.
+        The start time in the name keeps a new worker that reuses the pid of an old one from overwriting its counters.
+
+        :param self: Represent the instance of the class
+        :param directory: str: Directory shared by the workers of one deployment
+        :param flush_seconds: float: How often the snapshot of this worker is written
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.directory = Path(directory)
+        self.flush_seconds = flush_seconds
+        self.requests: dict[tuple[str, str, int], int] = {}
+        self.latency: dict[tuple[str, str], Histogram] = {}
+        self.in_flight = {group: 0 for group in ROUTE_GROUPS + ("other",)}
+        self.collectors: list[Callable[[], list[tuple[str, dict, float]]]] = []
+        self._task: asyncio.Task | None = None
+        self._pid: int | None = None
+        self._instance: str | None = None
+
+    def instance(self) -> str:
+
+        """
+        The instance function names the snapshot of this process by its pid and start time.
+        It is taken on first use in the process, so workers forked from a preloaded master get their own name.
+
+        :param self: Represent the instance of the class
+        :return: The name of the snapshot file without the suffix
+        :doc-author: Trelent
+        """
+
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._instance = f"{pid}-{time.time_ns() // 1000}"
+        return self._instance
+
+    def observe(self, method: str, route: str, status: int, seconds: float) -> None:
+        key = (method, route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.latency.get((method, route))
+        if histogram is None:
+            histogram = self.latency[(method, route)] = Histogram()
+        histogram.observe(seconds)
+
+    def add_collector(self, collector: Callable[[], list[tuple[str, dict, float]]]) -> None:
+
+        """
+        The add_collector function registers a callable that is asked for its current values on every snapshot.
+        It returns a list of (family, labels, value), the family must be listed in FAMILIES.
+
+        :param self: Represent the instance of the class
+        :param collector: Callable: The collector
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.collectors.append(collector)
+
+    def snapshot(self) -> dict:
+
+        """
+        The snapshot function returns the current values of this worker as {"counters": ..., "gauges": ...},
+        both map a family to its samples. Histograms are stored as their bucket, sum and count samples,
+        so snapshots of several workers are merged by adding the samples up.
+
+        :param self: Represent the instance of the class
+        :return: The snapshot
+        :doc-author: Trelent
+        """
+
+        counters: dict[str, dict[str, float]] = {"http_requests_total": {}, "http_request_duration_seconds": {}}
+        gauges: dict[str, dict[str, float]] = {"http_requests_in_flight": {}}
+
+        for (method, route, status), count in self.requests.items():
+            counters["http_requests_total"][series("http_requests_total", method=method, route=route, status=status)] = count
+        for (method, route), histogram in self.latency.items():
+            counters["http_request_duration_seconds"].update(histogram.samples("http_request_duration_seconds", method=method, route=route))
+        for group, count in self.in_flight.items():
+            gauges["http_requests_in_flight"][series("http_requests_in_flight", group=group)] = count
+
+        for collector in self.collectors:
+            for family, labels, value in collector():
+                target = gauges if FAMILIES[family][0] == "gauge" else counters
+                target.setdefault(family, {})[series(family, **labels)] = value
+
+        return {"pid": os.getpid(), "instance": self.instance(), "parent": os.getppid(),
+                "counters": counters, "gauges": gauges}
+
+    def write(self, data: dict) -> None:
+
+        """
+        The write function stores a snapshot of this worker in the shared directory.
+        The file is replaced atomically, readers never see a half written snapshot.
+
+        :param self: Represent the instance of the class
+        :param data: dict: The snapshot
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{data['instance']}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, separators=(",", ":")))
+        os.replace(tmp, path)
+
+    async def start(self) -> None:
+        if self._task is None:
+            await asyncio.to_thread(self.clean)
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        data = self.snapshot()
+        data["gauges"] = {}
+        await asyncio.to_thread(self.write, data)
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await asyncio.to_thread(self.write, self.snapshot())
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _live(self, path: Path, data: dict) -> bool:
+
+        """
+        The _live function tells whether the worker that wrote a snapshot still runs.
+        A live worker rewrites its file every flush_seconds, an older file belongs to an exited worker
+        even when its pid was given to another process since.
+
+        :param self: Represent the instance of the class
+        :param path: Path: The snapshot file
+        :param data: dict: The snapshot
+        :return: True if the writer is alive
+        :doc-author: Trelent
+        """
+
+        try:
+            age = time.time() - path.stat().st_mtime
+        except OSError:
+            return False
+        return age < 3 * self.flush_seconds and self._alive(data["pid"])
+
+    def _snapshots(self):
+        if not self.directory.is_dir():
+            return
+        for path in self.directory.glob("*.json"):
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            yield path, data
+
+    def clean(self) -> None:
+
+        """
+        The clean function removes the snapshots left by an earlier start of the server when a worker starts.
+        Workers of one master share the parent process: snapshots of exited workers of the same master are kept,
+        so its totals never go down, snapshots of exited processes with another parent are deleted.
+        Live processes writing to the same directory, e.g. the email worker, keep their files.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        parent = os.getppid()
+        for path, data in self._snapshots():
+            if data.get("parent") != parent and not self._live(path, data):
+                path.unlink(missing_ok=True)
+
+    def collect(self) -> dict[str, dict[str, float]]:
+
+        """
+        The collect function merges the live snapshot of this worker with the files written by the other workers.
+        Counters of workers that have exited are kept so totals never go down, their gauges are dropped.
+
+        :param self: Represent the instance of the class
+        :return: Samples per family
+        :doc-author: Trelent
+        """
+
+        own = self.snapshot()
+        snapshots = [own]
+        for path, data in self._snapshots():
+            if path.stem == own["instance"]:
+                continue
+            if not self._live(path, data):
+                data["gauges"] = {}
+            snapshots.append(data)
+
+        merged: dict[str, dict[str, float]] = {}
+        for data in snapshots:
+            for kind in ("counters", "gauges"):
+                for family, samples in data[kind].items():
+                    target = merged.setdefault(family, {})
+                    for key, value in samples.items():
+                        target[key] = target.get(key, 0) + value
+
+        return merged
+
+    def render(self) -> str:
+
+        """
+        The render function formats the merged samples in the Prometheus text format.
+
+        :param self: Represent the instance of the class
+        :return: The body of the /metrics response
+        :doc-author: Trelent
+        """
+
+        lines = []
+        for family, samples in self.collect().items():
+            kind, description = FAMILIES.get(family, ("untyped", family))
+            lines.append(f"# HELP {family} {description}")
+            lines.append(f"# TYPE {family} {kind}")
+            lines.extend(f"{key} {value}" for key, value in samples.items())
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    def __init__(self, app, registry: Metrics) -> None:
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send) -> None:
+
+        """
+        The __call__ function times every HTTP request and records it under its route template,
+        e.g. /api/contacts/{contact_id}, so the number of series does not grow with the ids in the urls.
+        Requests that match no route are recorded as <unmatched>.
+
+        :param self: Represent the instance of the class
+        :param scope: The ASGI scope
+        :param receive: The ASGI receive channel
+        :param send: The ASGI send channel
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        group = route_group(scope["path"])
+        status = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.registry.in_flight[group] += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.registry.in_flight[group] -= 1
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "<unmatched>"
+            self.registry.observe(scope["method"], path, status, time.perf_counter() - started)
+
+
+def pool_collector() -> list[tuple[str, dict, float]]:
+    stats = sessonmanager.pool_stats()
+    engines = [("primary", stats["primary"])] + [(f"replica{index}", replica) for index, replica in enumerate(stats["replicas"])]
+    result = []
+    for name, engine in engines:
+        for state in ("checked_in", "checked_out", "overflow"):
+            if state in engine:
+                result.append(("db_pool_connections", {"engine": name, "state": state}, max(engine[state], 0)))
+        if "checkouts" in engine:
+            result.append(("db_pool_checkouts_total", {"engine": name}, engine["checkouts"]))
+            result.append(("db_pool_timeouts_total", {"engine": name}, engine["timeouts"]))
+            result.append(("db_pool_wait_seconds_total", {"engine": name}, engine["avg_wait_seconds"] * engine["checkouts"]))
+    return result
+
+
+def services_collector() -> list[tuple[str, dict, float]]:
+    cache = user_cache.stats()
+    hashing = hasher.stats()
+    tokens = token_cache.stats()
+    limits = rate_limiter.stats()
+    return [
+        ("user_cache_requests_total", {"result": "hit"}, cache["hits"]),
+        ("user_cache_requests_total", {"result": "miss"}, cache["misses"]),
+        ("token_cache_requests_total", {"result": "hit"}, tokens["hits"]),
+        ("token_cache_requests_total", {"result": "miss"}, tokens["misses"]),
+        ("token_cache_entries", {}, tokens["size"]),
+        ("contacts_not_modified_total", {}, contact_versions.not_modified),
+        *(("refresh_tokens_total", {"event": event}, value) for event, value in refresh_tokens.stats().items()),
+        ("hash_queue_depth", {}, hashing["queue_depth"]),
+        ("hash_running", {}, hashing["running"]),
+        ("hash_completed_total", {}, hashing["completed"]),
+        ("hash_rejected_total", {}, hashing["rejected"]),
+        ("hash_seconds_total", {}, hasher.run_seconds),
+        ("ban_blocked_total", {}, ban_list.stats()["blocked"]),
+        ("log_dropped_total", {}, log_pipeline.stats()["dropped"]),
+        ("rate_limit_requests_total", {"result": "allowed"}, limits["allowed"]),
+        ("rate_limit_requests_total", {"result": "limited"}, limits["limited"]),
+        ("rate_limit_redis_calls_total", {"kind": "acquire"}, limits["acquires"]),
+        ("rate_limit_redis_calls_total", {"kind": "sync"}, limits["syncs"]),
+        ("rate_limit_keys", {}, limits["keys"]),
+        ("rate_limit_degraded", {}, int(limits["degraded"])),
+    ]
+
+
+def redis_collector(r: redis.Redis) -> Callable[[], list[tuple[str, dict, float]]]:
+
+    """
+    The redis_collector function builds a collector for the connection pool of a Redis client.
+
+    :param r: redis.Redis: The client created in the application lifespan
+    :return: The collector
+    :doc-author: Trelent
+    """
+
+    def collect() -> list[tuple[str, dict, float]]:
+        pool = r.connection_pool
+        available = len(getattr(pool, "_available_connections", []))
+        in_use = len(getattr(pool, "_in_use_connections", []))
+        return [
+            ("redis_pool_connections", {"state": "available"}, available),
+            ("redis_pool_connections", {"state": "in_use"}, in_use),
+        ]
+
+    return collect
+
+
+metrics = Metrics()
+metrics.add_collector(pool_collector)
+metrics.add_collector(services_collector)
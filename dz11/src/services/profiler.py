@@ -0,0 +1,203 @@
+import logging
+import re
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.conf.config import config
+
+
+logger = logging.getLogger(__name__)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w$])\d+(?:\.\d+)?\b")
+PLACEHOLDER_LISTS = re.compile(r"\((?:\s*(?:\?|%s|\$\d+|:\w+)\s*,)+\s*(?:\?|%s|\$\d+|:\w+)\s*\)")
+SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize(statement: str) -> str:
+
+    """
+    The normalize function reduces a statement to its shape: literals become ?, lists of placeholders
+    become a single one and whitespace is collapsed. Statements that differ only in their values
+    are counted together.
+
+    :param statement: str: SQL text sent to the driver
+    :return: The normalized text
+    :doc-author: Trelent
+    """
+
+    statement = LITERALS.sub("?", statement)
+    statement = PLACEHOLDER_LISTS.sub("(?)", statement)
+
+    return SPACES.sub(" ", statement).strip()
+
+
+class QueryProfile:
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: dict[str, list] = {}
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def repeated(self, threshold: int) -> list[tuple[str, int, float]]:
+
+        """
+        The repeated function lists the statements run at least threshold times, the usual sign of an N+1 pattern.
+
+        :param self: Represent the instance of the class
+        :param threshold: int: Minimal number of runs
+        :return: A list of (normalized statement, count, seconds), most frequent first
+        :doc-author: Trelent
+        """
+
+        result = [(statement, count, seconds) for statement, (count, seconds) in self.statements.items() if count >= threshold]
+        return sorted(result, key=lambda item: item[1], reverse=True)
+
+
+class QueryProfiler:
+    def __init__(self, max_queries: int = config.PROFILER_MAX_QUERIES, max_seconds: float = config.PROFILER_MAX_DB_SECONDS,
+                 repeat_threshold: int = config.PROFILER_REPEAT_THRESHOLD) -> None:
+
+        """
+        The __init__ function sets the budget of a request.
+
+        :param self: Represent the instance of the class
+        :param max_queries: int: Number of statements a request may run
+        :param max_seconds: float: Time a request may spend in the database
+        :param repeat_threshold: int: How often the same statement may run before it is reported as N+1
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.max_queries = max_queries
+        self.max_seconds = max_seconds
+        self.repeat_threshold = repeat_threshold
+        self.current: ContextVar[QueryProfile | None] = ContextVar("query_profile", default=None)
+        self.installed = False
+
+    def install(self) -> None:
+
+        """
+        The install function hooks the profiler into every engine, including the replicas.
+        Statements are only recorded while a request profile is active, the hooks cost one context lookup otherwise.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self.installed:
+            return
+        event.listen(Engine, "before_cursor_execute", self._before)
+        event.listen(Engine, "after_cursor_execute", self._after)
+        self.installed = True
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if self.current.get() is not None:
+            conn.info.setdefault("profiler_started", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        profile = self.current.get()
+        started = conn.info.get("profiler_started")
+        if profile is not None and started:
+            profile.record(normalize(statement), time.perf_counter() - started.pop())
+
+    def over_budget(self, profile: QueryProfile) -> list[str]:
+        reasons = []
+        if profile.count > self.max_queries:
+            reasons.append("queries")
+        if profile.seconds > self.max_seconds:
+            reasons.append("time")
+        if profile.repeated(self.repeat_threshold):
+            reasons.append("repeated")
+        return reasons
+
+    def report(self, method: str, path: str, profile: QueryProfile) -> None:
+
+        """
+        The report function logs a request that went over its budget, with its most repeated statements.
+
+        :param self: Represent the instance of the class
+        :param method: str: HTTP method
+        :param path: str: Route template or path of the request
+        :param profile: QueryProfile: What the request ran
+        :return: None
+        :doc-author: Trelent
+        """
+
+        reasons = self.over_budget(profile)
+        if not reasons:
+            return
+
+        repeated = profile.repeated(self.repeat_threshold)[:5]
+        logger.warning("query budget exceeded", extra={
+            "event": "query_budget",
+            "method": method,
+            "path": path,
+            "reasons": reasons,
+            "queries": profile.count,
+            "db_seconds": round(profile.seconds, 6),
+            "repeated": [{"statement": statement, "count": count, "seconds": round(seconds, 6)} for statement, count, seconds in repeated],
+        })
+
+
+class QueryProfilerMiddleware:
+    def __init__(self, app, profiler: QueryProfiler) -> None:
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send) -> None:
+
+        """
+        The __call__ function profiles one HTTP request. The statements run before the response starts are
+        summarized in a Server-Timing header (db;dur=<ms>;desc="<n> queries") and X-DB-Budget: exceeded
+        is added when the budget is already blown; statements run while a streamed body is sent are
+        only counted in the log line.
+
+        :param self: Represent the instance of the class
+        :param scope: The ASGI scope
+        :param receive: The ASGI receive channel
+        :param send: The ASGI send channel
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
+        token = self.profiler.current.set(profile)
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                timing = f'db;dur={profile.seconds * 1000:.1f};desc="{profile.count} queries"'
+                headers.append((b"server-timing", timing.encode()))
+                if self.profiler.over_budget(profile):
+                    headers.append((b"x-db-budget", b"exceeded"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.profiler.current.reset(token)
+            route = scope.get("route")
+            self.profiler.report(scope["method"], getattr(route, "path", None) or scope["path"], profile)
+
+
+query_profiler = QueryProfiler()
@@ -0,0 +1,308 @@
+import asyncio
+import logging
+import math
+import time
+
+import redis.asyncio as redis
+from fastapi import Depends, HTTPException, Request, status
+
+from src.conf.config import config
+from src.database.models import User
+from src.services.auth import auth_service
+
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] bucket, ARGV capacity, refill rate per second, cost, 1 to take the tokens only if available
+TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 1
+if ARGV[4] == "1" then
+    if tokens >= cost then
+        tokens = tokens - cost
+    else
+        allowed = 0
+    end
+else
+    tokens = math.max(0, tokens - cost)
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", tostring(now))
+redis.call("PEXPIRE", KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+
+class Bucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated", "pending")
+
+    def __init__(self, capacity: int, rate: float, tokens: float, now: float) -> None:
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = tokens
+        self.updated = now
+        self.pending = 0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.pending += 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    prefix = "ratelimit"
+
+    def __init__(self, sync_seconds: float = config.RATE_LIMIT_SYNC_SECONDS, max_keys: int = config.RATE_LIMIT_MAX_KEYS) -> None:
+
+        """
+        The __init__ function sets up the two tiers of the limiter. Every worker keeps a token bucket per key
+        and decides locally; the buckets are reconciled with the shared buckets in Redis every sync_seconds
+        by one pipelined call of an atomic Lua script. Only the first request of a key that is not in memory
+        waits for Redis, so a client can not get a fresh budget on every worker.
+        Without Redis the limiter runs on the local buckets alone until Redis is reachable again.
+
+        :param self: Represent the instance of the class
+        :param sync_seconds: float: How often the local buckets are reconciled with Redis
+        :param max_keys: int: Number of buckets kept in memory, the oldest one is dropped first
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.sync_seconds = sync_seconds
+        self.max_keys = max_keys
+        self.buckets: dict[str, Bucket] = {}
+        self.redis: redis.Redis | None = None
+        self.script = None
+        self.degraded = True
+        self._task: asyncio.Task | None = None
+
+        self.allowed = 0
+        self.limited = 0
+        self.acquires = 0
+        self.syncs = 0
+        self.errors = 0
+
+    async def start(self, r: redis.Redis) -> None:
+
+        """
+        The start function attaches the Redis client and starts the reconciliation task.
+        If Redis is not reachable the application still starts, the limiter stays local until the task reconnects.
+
+        :param self: Represent the instance of the class
+        :param r: redis.Redis: Redis client
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.redis = r
+        self.script = r.register_script(TOKEN_BUCKET)
+        try:
+            await r.script_load(TOKEN_BUCKET)
+            self.degraded = False
+        except redis.RedisError as err:
+            self._degrade(err)
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.sync()
+
+    def _degrade(self, err: Exception) -> None:
+        self.errors += 1
+        if not self.degraded:
+            logger.warning("rate limiter lost Redis, limiting per worker", exc_info=err)
+        self.degraded = True
+
+    def _add(self, key: str, bucket: Bucket) -> Bucket:
+        if key not in self.buckets and len(self.buckets) >= self.max_keys:
+            del self.buckets[next(iter(self.buckets))]
+        return self.buckets.setdefault(key, bucket)
+
+    async def acquire(self, key: str, capacity: int, rate: float) -> float:
+
+        """
+        The acquire function takes one token from the bucket of a key.
+        A key seen for the first time by this worker takes its token from Redis, so the decision
+        accounts for the other workers. Later requests only touch the local bucket.
+
+        :param self: Represent the instance of the class
+        :param key: str: The bucket, e.g. /api/users/me:user:1
+        :param capacity: int: Size of the bucket
+        :param rate: float: Tokens added per second
+        :return: 0 if the request is allowed, otherwise seconds until a token is available
+        :doc-author: Trelent
+        """
+
+        bucket = self.buckets.get(key)
+        if bucket is None and not self.degraded:
+            try:
+                allowed, tokens = await self.script(keys=[f"{self.prefix}:{key}"], args=[capacity, rate, 1, 1])
+            except redis.RedisError as err:
+                self._degrade(err)
+            else:
+                self.acquires += 1
+                tokens = float(tokens)
+                bucket = self._add(key, Bucket(capacity, rate, tokens, time.monotonic()))
+                bucket.tokens = min(bucket.tokens, tokens)
+                if int(allowed):
+                    self.allowed += 1
+                    return 0.0
+                self.limited += 1
+                return (1 - tokens) / rate
+
+        if bucket is None:
+            bucket = self._add(key, Bucket(capacity, rate, capacity, time.monotonic()))
+
+        retry = bucket.take(time.monotonic())
+        if retry:
+            self.limited += 1
+        else:
+            self.allowed += 1
+
+        return retry
+
+    async def sync(self) -> None:
+
+        """
+        The sync function reconciles the local buckets with Redis in one pipeline: the tokens taken locally
+        since the last sync are removed from the shared bucket and the local bucket is set to what is left,
+        including what the other workers took. Full buckets with nothing to report are forgotten.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self.redis is None:
+            return
+
+        if self.degraded:
+            try:
+                await self.redis.ping()
+            except redis.RedisError:
+                self.errors += 1
+                return
+            self.degraded = False
+            logger.info("rate limiter reconnected to Redis")
+
+        now = time.monotonic()
+        batch = []
+        for key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if not bucket.pending and bucket.tokens >= bucket.capacity:
+                del self.buckets[key]
+                continue
+            batch.append((key, bucket, bucket.pending))
+
+        if not batch:
+            return
+
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, bucket, pending in batch:
+                    await self.script(keys=[f"{self.prefix}:{key}"], args=[bucket.capacity, bucket.rate, pending, 0],
+                                      client=pipe)
+                results = await pipe.execute()
+        except redis.RedisError as err:
+            self._degrade(err)
+            return
+
+        self.syncs += 1
+        now = time.monotonic()
+        for (key, bucket, pending), (_, tokens) in zip(batch, results):
+            bucket.pending -= pending
+            bucket.tokens = max(float(tokens) - bucket.pending, 0.0)
+            bucket.updated = now
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_seconds)
+            await self.sync()
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self.buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "acquires": self.acquires,
+            "syncs": self.syncs,
+            "errors": self.errors,
+            "degraded": self.degraded,
+        }
+
+
+rate_limiter = RateLimiter()
+
+
+class RateLimit:
+    def __init__(self, times: int, seconds: float, limiter: RateLimiter = rate_limiter) -> None:
+
+        """
+        The __init__ function configures a limit of times requests per seconds for one route,
+        counted per client address. Use it as a route dependency:
+
+            dependencies=[Depends(RateLimit(times=5, seconds=60))]
+
+        :param self: Represent the instance of the class
+        :param times: int: Requests allowed in a burst
+        :param seconds: float: Time in which the whole burst is refilled
+        :param limiter: RateLimiter: The limiter holding the buckets
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.capacity = times
+        self.rate = times / seconds
+        self.limiter = limiter
+
+    async def check(self, request: Request, identity: str) -> None:
+        route = request.scope.get("route")
+        path = route.path if route is not None else request.url.path
+        retry = await self.limiter.acquire(f"{path}:{identity}", self.capacity, self.rate)
+        if retry:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too Many Requests",
+                                headers={"Retry-After": str(math.ceil(retry))})
+
+    async def __call__(self, request: Request) -> None:
+        host = request.client.host if request.client else "unknown"
+        await self.check(request, f"ip:{host}")
+
+
+class UserRateLimit(RateLimit):
+
+    async def __call__(self, request: Request, user: User = Depends(auth_service.get_current_user)) -> None:
+
+        """
+        The __call__ function counts the requests of the current user, wherever they come from.
+        The user is resolved by the same dependency as in the route, FastAPI runs it once per request.
+
+        :param self: Represent the instance of the class
+        :param request: Request: The incoming request
+        :param user: User: The current user
+        :return: None
+        :doc-author: Trelent
+        """
+
+        await self.check(request, f"user:{user.id}")
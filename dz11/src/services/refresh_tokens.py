@@ -0,0 +1,138 @@
+import logging
+import uuid
+
+import redis.asyncio as redis
+
+from src.conf.config import config
+from src.services.auth import auth_service
+
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] family, ARGV presented jti, next jti, ttl; 1 rotated, 0 unknown family, -1 reuse, the family is revoked
+ROTATE = """
+local current = redis.call("HGET", KEYS[1], "jti")
+if not current then
+    return 0
+end
+if current ~= ARGV[1] then
+    redis.call("DEL", KEYS[1])
+    return -1
+end
+redis.call("HSET", KEYS[1], "jti", ARGV[2])
+redis.call("EXPIRE", KEYS[1], ARGV[3])
+return 1
+"""
+
+
+class RefreshTokenInvalid(Exception):
+    pass
+
+
+class RefreshTokenReused(RefreshTokenInvalid):
+    pass
+
+
+class RefreshTokenStore:
+    prefix = "refresh:family"
+
+    def __init__(self, ttl: int = config.REFRESH_TOKEN_TTL) -> None:
+
+        """
+        The __init__ function sets up the store of refresh token families.
+        Every login starts a family: refresh:family:<fid> holds the owner and the jti of the only token
+        of the family that may still be used. Each refresh replaces the jti, so presenting an older token
+        of the family is a reuse and revokes the whole family. A user has one family per session,
+        the users table is not written on login or refresh.
+
+        :param self: Represent the instance of the class
+        :param ttl: int: Lifetime of a refresh token in seconds, a family expires when it is not refreshed in time
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.ttl = ttl
+        self.redis: redis.Redis | None = None
+        self.script = None
+
+        self.issued = 0
+        self.rotated = 0
+        self.reused = 0
+        self.rejected = 0
+
+    def init(self, r: redis.Redis) -> None:
+
+        """
+        The init function attaches the Redis client created in the application lifespan.
+
+        :param self: Represent the instance of the class
+        :param r: redis.Redis: Redis client
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.redis = r
+        self.script = r.register_script(ROTATE)
+
+    def key(self, family: str) -> str:
+        return f"{self.prefix}:{family}"
+
+    async def issue(self, email: str) -> str:
+
+        """
+        The issue function starts a new family for a login and returns its first refresh token.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user
+        :return: The refresh token
+        :doc-author: Trelent
+        """
+
+        family, jti = uuid.uuid4().hex, uuid.uuid4().hex
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.key(family), mapping={"sub": email, "jti": jti}).expire(self.key(family), self.ttl)
+            await pipe.execute()
+        self.issued += 1
+
+        return await auth_service.create_refresh_token(data={"sub": email, "fid": family, "jti": jti}, expires_delta=self.ttl)
+
+    async def rotate(self, claims: dict) -> str:
+
+        """
+        The rotate function exchanges a verified refresh token for the next token of its family.
+        The check and the swap are one atomic script, of two concurrent requests with the same token only one succeeds.
+
+        :param self: Represent the instance of the class
+        :param claims: dict: The claims of the presented token, as returned by decode_refresh_token
+        :return: The new refresh token
+        :raises RefreshTokenReused: The token was already exchanged, the family is revoked
+        :raises RefreshTokenInvalid: The family expired or was revoked
+        :doc-author: Trelent
+        """
+
+        family, jti = claims.get("fid"), claims.get("jti")
+        if not family or not jti:
+            self.rejected += 1
+            raise RefreshTokenInvalid
+
+        next_jti = uuid.uuid4().hex
+        result = int(await self.script(keys=[self.key(family)], args=[jti, next_jti, self.ttl]))
+
+        if result < 0:
+            self.reused += 1
+            logger.warning("refresh token reused, session revoked", extra={"family": family, "subject": claims.get("sub")})
+            raise RefreshTokenReused
+        if result == 0:
+            self.rejected += 1
+            raise RefreshTokenInvalid
+
+        self.rotated += 1
+
+        return await auth_service.create_refresh_token(data={"sub": claims["sub"], "fid": family, "jti": next_jti},
+                                                       expires_delta=self.ttl)
+
+    def stats(self) -> dict:
+        return {"issued": self.issued, "rotated": self.rotated, "reused": self.reused, "rejected": self.rejected}
+
+
+refresh_tokens = RefreshTokenStore()
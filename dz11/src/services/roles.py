@@ -1,9 +1,14 @@
+import logging
 from typing import Any
+
 from fastapi import Request, Depends, HTTPException, status
 from src.database.models import Role, User
 from src.services.auth import auth_service
 
 
+logger = logging.getLogger(__name__)
+
+
 class RoleAccess:
     def __init__(self, allowed_roles: list[Role]) -> None:
         
@@ -33,7 +38,7 @@ class RoleAccess:
         :return: A function that takes a request and user as parameters
         :doc-author: Trelent
         """
-        print(user.role, self.allowed_roles)
-        
         if user.role not in self.allowed_roles:
+            logger.info("access denied", extra={"event": "access_denied", "user_id": user.id, "role": user.role,
+                                                "path": request.url.path})
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="FORBIDDEN")
\ No newline at end of file
@@ -0,0 +1,97 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import cloudinary
+import cloudinary.uploader
+
+from src.conf.config import config
+
+
+class Storage(ABC):
+
+    @abstractmethod
+    async def save(self, key: str, data: bytes, content_type: str) -> str:
+
+        """
+        The save function stores a file and returns its public URL.
+
+        :param self: Represent the instance of the class
+        :param key: str: Path of the file inside the storage, e.g. avatars/1.webp
+        :param data: bytes: Content of the file
+        :param content_type: str: Media type of the file
+        :return: The URL of the stored file
+        :doc-author: Trelent
+        """
+
+
+class LocalStorage(Storage):
+    def __init__(self, root: str = config.STORAGE_LOCAL_DIR, base_url: str = config.STORAGE_BASE_URL) -> None:
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    async def save(self, key: str, data: bytes, content_type: str) -> str:
+
+        """
+        The save function writes the file under the storage root in a worker thread,
+        the new file replaces the old one atomically. The root is served by the application at STORAGE_BASE_URL.
+
+        :param self: Represent the instance of the class
+        :param key: str: Path of the file inside the storage
+        :param data: bytes: Content of the file
+        :param content_type: str: Media type of the file
+        :return: The URL of the stored file
+        :doc-author: Trelent
+        """
+
+        await asyncio.to_thread(self._write, key, data)
+
+        return f"{self.base_url}/{key}"
+
+
+class CloudinaryStorage(Storage):
+    def __init__(self) -> None:
+        cloudinary.config(
+            cloud_name=config.CLOUDINARY_NAME,
+            api_key=config.CLOUDINARY_API_KEY,
+            api_secret=config.CLOUDINARY_API_SECRET,
+            secure=True,
+        )
+
+    async def save(self, key: str, data: bytes, content_type: str) -> str:
+
+        """
+        The save function uploads the file to Cloudinary in a worker thread, the SDK is blocking.
+
+        :param self: Represent the instance of the class
+        :param key: str: Public id of the file, without the extension
+        :param data: bytes: Content of the file
+        :param content_type: str: Media type of the file
+        :return: The versioned URL of the uploaded file
+        :doc-author: Trelent
+        """
+
+        public_id = key.rsplit(".", 1)[0]
+        res = await asyncio.to_thread(cloudinary.uploader.upload, data, public_id=public_id, overwrite=True)
+
+        return cloudinary.CloudinaryImage(public_id).build_url(version=res.get("version"))
+
+
+backends = {"local": LocalStorage, "cloudinary": CloudinaryStorage}
+
+
+def get_storage(name: str = config.STORAGE_BACKEND) -> Storage:
+    if name not in backends:
+        raise ValueError(f"unknown storage backend: {name}")
+    return backends[name]()
+
+
+storage = get_storage()
@@ -0,0 +1,115 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+from src.conf.config import config
+
+
+class TokenCache:
+    def __init__(self, maxsize: int = config.TOKEN_CACHE_SIZE) -> None:
+
+        """
+        The __init__ function sets up an empty LRU of verified token claims.
+        Tokens are keyed by their sha256 digest, the raw token is never kept.
+
+        :param self: Represent the instance of the class
+        :param maxsize: int: Number of tokens kept, the least recently used one is dropped first
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.maxsize = maxsize
+        self._entries: OrderedDict[bytes, dict] = OrderedDict()
+        self._subjects: dict[str, set[bytes]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> dict | None:
+
+        """
+        The get function returns the claims of a token verified earlier, or None.
+        An entry is dropped once the exp claim of its token has passed, so an expired token is always
+        sent to jwt.decode and rejected there.
+
+        :param self: Represent the instance of the class
+        :param token: str: The bearer token
+        :return: The verified claims or None
+        :doc-author: Trelent
+        """
+
+        key = self.key(token)
+        claims = self._entries.get(key)
+        if claims is not None and claims["exp"] <= time.time():
+            self._remove(key)
+            claims = None
+
+        if claims is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        return claims
+
+    def put(self, token: str, claims: dict) -> None:
+
+        """
+        The put function remembers the claims of a token that passed signature verification.
+        Tokens without an exp claim are not cached.
+
+        :param self: Represent the instance of the class
+        :param token: str: The bearer token
+        :param claims: dict: The claims returned by jwt.decode
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if not isinstance(claims.get("exp"), (int, float)):
+            return
+
+        key = self.key(token)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = claims
+        self._subjects.setdefault(claims.get("sub"), set()).add(key)
+
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: bytes) -> None:
+        claims = self._entries.pop(key, None)
+        if claims is None:
+            return
+        keys = self._subjects.get(claims.get("sub"))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._subjects[claims.get("sub")]
+
+    def revoke(self, subject: str) -> None:
+
+        """
+        The revoke function drops every cached token of a subject, their next use is verified again.
+        It is called when the tokens of a user are revoked.
+
+        :param self: Represent the instance of the class
+        :param subject: str: The sub claim, the email of the user
+        :return: None
+        :doc-author: Trelent
+        """
+
+        for key in list(self._subjects.get(subject, ())):
+            self._remove(key)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+token_cache = TokenCache()
@@ -0,0 +1,165 @@
+import logging
+import time
+
+import redis.asyncio as redis
+from fastapi import Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import config
+from src.database.db import use_primary
+
+
+logger = logging.getLogger(__name__)
+
+# part of every ETag, bump it when the JSON of contact responses changes so cached copies are not reused
+REPRESENTATION = 2
+
+
+class ContactVersions:
+    prefix = "contacts:versions:"
+
+    def __init__(self, ttl: int = config.CONTACTS_VERSION_TTL,
+                 window: float = config.DB_READ_YOUR_WRITES_SECONDS) -> None:
+
+        """
+        The __init__ function sets up the per-user version counters of the contacts.
+        A counter is bumped after every committed change of the contacts of its user, so an ETag built
+        from it changes with the data. A new counter starts from the current time in microseconds,
+        a counter lost from Redis can not come back with a value an old ETag was built from.
+        The counter is a hash with the version and the time of the last bump.
+
+        :param self: Represent the instance of the class
+        :param ttl: int: Seconds a counter is kept after the last change
+        :param window: float: Seconds after a bump during which the contacts are read from the primary
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.redis: redis.Redis | None = None
+        self.ttl = ttl
+        self.window = window
+        self.not_modified = 0
+
+    def init(self, r: redis.Redis) -> None:
+
+        """
+        The init function attaches the Redis client created in the application lifespan.
+
+        :param self: Represent the instance of the class
+        :param r: redis.Redis: Redis client
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.redis = r
+
+    def key(self, user_id: int) -> str:
+        return f"{self.prefix}{user_id}"
+
+    async def get(self, user_id: int) -> tuple[int, float] | None:
+
+        """
+        The get function returns the contacts version of a user and the time of its last bump,
+        starting the counter if there is none. A counter that was never bumped has 0.0 as its bump time.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: Id of the user
+        :return: The version and the bump time or None if Redis is not available
+        :doc-author: Trelent
+        """
+
+        if self.redis is None:
+            return None
+        key = self.key(user_id)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hsetnx(key, "version", time.time_ns() // 1000).hmget(key, "version", "bumped")
+                created, (version, bumped) = await pipe.execute()
+            if created:
+                await self.redis.expire(key, self.ttl)
+        except redis.RedisError:
+            return None
+
+        return int(version), float(bumped or 0.0)
+
+    async def bump(self, user_id: int) -> None:
+
+        """
+        The bump function moves the contacts version of a user forward and records when it happened.
+        It is called after the change is committed, a reader that got the old version can only have read the old rows.
+        If Redis can not be reached the counter is dropped instead, when even that fails the error is logged.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: Id of the user
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self.redis is None:
+            return
+        key = self.key(user_id)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hsetnx(key, "version", time.time_ns() // 1000).hincrby(key, "version", 1)
+                pipe.hset(key, "bumped", time.time()).expire(key, self.ttl)
+                await pipe.execute()
+        except redis.RedisError as err:
+            try:
+                await self.redis.delete(key)
+            except redis.RedisError:
+                logger.error("contacts version not bumped", extra={"user_id": user_id}, exc_info=err)
+
+    @staticmethod
+    def etag(user_id: int, version: int) -> str:
+        return f'W/"{REPRESENTATION}-{user_id}-{version}"'
+
+    @staticmethod
+    def matches(if_none_match: str | None, etag: str) -> bool:
+        if not if_none_match:
+            return False
+        opaque = etag.removeprefix("W/")
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+            if candidate == "*" or candidate.removeprefix("W/") == opaque:
+                return True
+        return False
+
+    async def check(self, request: Request, response: Response, user_id: int,
+                    db: AsyncSession | None = None) -> Response | None:
+
+        """
+        The check function answers a conditional read of the contacts of a user.
+        When the If-None-Match header of the request holds the current ETag it returns a 304 response
+        and the route returns it without querying the database. Otherwise the ETag is set on the response
+        of the route. Without Redis no ETag is sent and every request is served in full.
+        When the version was bumped within DB_READ_YOUR_WRITES_SECONDS the reads of db go to the primary,
+        a lagging replica could pair old rows with the new ETag; older versions are served from the replica.
+
+        :param self: Represent the instance of the class
+        :param request: Request: The incoming request
+        :param response: Response: The response of the route
+        :param user_id: int: Id of the current user
+        :param db: AsyncSession | None: Session of the route, pinned to the primary after a recent bump
+        :return: A 304 response or None
+        :doc-author: Trelent
+        """
+
+        current = await self.get(user_id)
+        if current is None:
+            return None
+
+        version, bumped = current
+        etag = self.etag(user_id, version)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if self.matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        response.headers.update(headers)
+        if db is not None and time.time() - bumped < self.window:
+            use_primary(db)
+
+        return None
+
+
+contact_versions = ContactVersions()
@@ -9,7 +9,7 @@ from src.database.db import get_db
 
 import sys
 import os
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -54,8 +54,9 @@ def user():
 
 @pytest.fixture()
 def token(client, user, session, monkeypatch):
-    mock_send_email = MagicMock()
+    mock_send_email = AsyncMock()
     monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+    monkeypatch.setattr("src.routes.auth.refresh_tokens.issue", AsyncMock(return_value="refresh_token"))
     client.post("/api/auth/signup", json=user)
     current_user: User = session.query(User).filter(User.email == user.get('email')).first()
     current_user.confirmed = True
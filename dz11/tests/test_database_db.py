@@ -0,0 +1,156 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+import redis.asyncio as redis
+from sqlalchemy import exc as sa_exc, select, update
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.conf.config import config
+from src.database.db import DatabaseSessionManager, InstrumentedPool, read_only
+from src.database.models import Base, User
+
+
+class TestRoutingSession(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        primary = os.path.join(self.dir.name, "primary.db")
+        replica = os.path.join(self.dir.name, "replica.db")
+        self.manager = DatabaseSessionManager(f"sqlite+aiosqlite:///{primary}", [f"sqlite+aiosqlite:///{replica}"])
+
+        for engine, name in ((self.manager.engine, "primary"), (self.manager.replicas[0], "replica")):
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+                await conn.execute(User.__table__.insert().values(id=1, username=name, email="deadpool@example.com",
+                                                                  password="hash"))
+
+    async def asyncTearDown(self):
+        await self.manager.close()
+        self.dir.cleanup()
+
+    @staticmethod
+    async def read(db, marked=True):
+        stmt = select(User.username).where(User.id == 1)
+        return await db.scalar(read_only(stmt) if marked else stmt)
+
+    async def test_marked_read_goes_to_replica(self):
+        async with self.manager.session() as db:
+            self.assertEqual(await self.read(db), "replica")
+            self.assertEqual(await self.read(db, marked=False), "primary")
+            self.assertNotIn("wrote", db.info)
+
+    async def test_dml_goes_to_primary(self):
+        async with self.manager.session() as db:
+            await db.execute(update(User).where(User.id == 1).values(username="updated"))
+
+            self.assertTrue(db.info["wrote"])
+            self.assertEqual(await self.read(db), "updated")
+
+    async def test_flush_goes_to_primary(self):
+        async with self.manager.session() as db:
+            db.add(User(id=2, username="wade", email="wade@example.com", password="hash"))
+            await db.flush()
+
+            self.assertTrue(db.info["wrote"])
+            self.assertEqual(await db.scalar(read_only(select(User.username).where(User.id == 2))), "wade")
+
+    async def test_commit_pins_reads_of_the_user(self):
+        async with self.manager.session() as db:
+            await self.manager.attach_user(db, 1)
+            await db.execute(update(User).where(User.id == 1).values(username="updated"))
+            await db.commit()
+
+            self.assertNotIn("wrote", db.info)
+
+        async with self.manager.session() as db:
+            await self.manager.attach_user(db, 1)
+            self.assertEqual(await self.read(db), "updated")
+
+        async with self.manager.session() as db:
+            await self.manager.attach_user(db, 2)
+            self.assertEqual(await self.read(db), "replica")
+
+    async def test_commit_marks_user_in_redis(self):
+        self.manager.init(AsyncMock())
+
+        async with self.manager.session() as db:
+            await self.manager.attach_user(db, 1)
+            db.add(User(id=2, username="wade", email="wade@example.com", password="hash"))
+            await db.commit()
+        await asyncio.sleep(0)
+
+        self.manager.redis.set.assert_awaited_once_with("db:recent_write:1", 1, px=int(config.DB_READ_YOUR_WRITES_SECONDS * 1000))
+
+    async def test_recent_write_of_other_worker(self):
+        self.manager.init(MagicMock())
+        self.manager.redis.exists = AsyncMock(return_value=1)
+
+        async with self.manager.session() as db:
+            await self.manager.attach_user(db, 1)
+            self.assertEqual(await self.read(db), "primary")
+
+        self.manager.redis.exists.assert_awaited_once_with("db:recent_write:1")
+
+    async def test_redis_down_uses_local_window(self):
+        self.manager.init(MagicMock())
+        self.manager.redis.exists = AsyncMock(side_effect=redis.ConnectionError("down"))
+
+        async with self.manager.session() as db:
+            await self.manager.attach_user(db, 1)
+            self.assertEqual(await self.read(db), "replica")
+
+        self.manager.mark_write(1)
+
+        async with self.manager.session() as db:
+            await self.manager.attach_user(db, 1)
+            self.assertEqual(await self.read(db), "primary")
+
+
+class TestInstrumentedPool(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.dir.name, 'pool.db')}",
+                                          poolclass=InstrumentedPool, pool_size=1, max_overflow=0, pool_timeout=0.2)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.dir.cleanup()
+
+    async def test_wait_and_timeout(self):
+        async def hold(seconds):
+            async with self.engine.connect():
+                await asyncio.sleep(seconds)
+
+        holder = asyncio.create_task(hold(0.1))
+        await asyncio.sleep(0.01)
+        async with self.engine.connect():
+            pass
+        await holder
+
+        stats = DatabaseSessionManager.engine_stats(self.engine)
+
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertEqual(stats["timeouts"], 0)
+        self.assertGreaterEqual(stats["max_wait_seconds"], 0.05)
+
+        holder = asyncio.create_task(hold(0.5))
+        await asyncio.sleep(0.01)
+        with self.assertRaises(sa_exc.TimeoutError):
+            async with self.engine.connect():
+                pass
+        await holder
+
+        stats = DatabaseSessionManager.engine_stats(self.engine)
+
+        self.assertEqual(stats["checkouts"], 4)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertGreaterEqual(stats["max_wait_seconds"], 0.2)
+        self.assertEqual(stats["checked_out"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,17 +1,23 @@
 import unittest
+from datetime import date
 from unittest.mock import AsyncMock, patch, MagicMock, Mock
+from pydantic import ValidationError
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.schemas.contacts import ContactSchema
 from src.database.models import Contact, User
-from src.repository.contacts import (get_all_contacts, get_contacts, get_contact, create_todo, remove_contact, update_contact,)
+from src.repository.contacts import (get_all_contacts, get_contacts, get_contact, create_todo, remove_contact, update_contact, search_contacts,
+                                     get_upcoming_birthdays, remove_contacts, update_contacts, create_contacts, change_count, count_contacts,
+                                     estimate_all_contacts,)
+from src.schemas.contacts import ContactPatchSchema
 
 
 class testContacts(unittest.IsolatedAsyncioTestCase):
     
     def setUp(self):
         self.session = AsyncMock(spec=AsyncSession) 
-        self.contact = Contact(id=1, first_name='test',last_name ='testovich', email='test email', phone_number='0985680323', birthday='28.04.1982')
+        self.contact = Contact(id=1, first_name='test',last_name ='testovich', email='test email', phone_number='0985680323', birthday=date(1982, 4, 28))
         self.contacts = [self.contact,
                         Contact(id=2, first_name=self.contact.first_name, last_name=self.contact.last_name, 
                                 email='test_email', phone_number='test_phone', birthday=self.contact.birthday),
@@ -28,8 +34,36 @@ class testContacts(unittest.IsolatedAsyncioTestCase):
         self.session.execute.return_value = mocked_contacts
         result =await get_contacts(limit, offset,self.session, User())
         
+        self.assertNotIn("JOIN users", str(self.session.execute.call_args.args[0]))
         self.assertEqual(result, contacts)
     
+    
+    async def test_get_contacts_after_id(self):
+        limit= 10
+        contacts = self.contacts[1:]
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = contacts
+        self.session.execute.return_value = mocked_contacts
+        result =await get_contacts(limit, 0, self.session, User(id=1), after_id=1)
+        
+        sql = str(self.session.execute.call_args.args[0])
+        self.assertIn("contacts.id >", sql)
+        self.assertNotIn("OFFSET", sql)
+        self.assertEqual(result, contacts)
+    
+    
+    async def test_get_contacts_columns(self):
+        rows = [(1, 'test', 'testovich')]
+        mocked_contacts = MagicMock()
+        mocked_contacts.all.return_value = rows
+        self.session.execute.return_value = mocked_contacts
+        result = await get_contacts(10, 0, self.session, User(id=1), columns=("id", "first_name", "last_name"))
+        
+        sql = str(self.session.execute.call_args.args[0])
+        self.assertTrue(sql.startswith("SELECT contacts.id, contacts.first_name, contacts.last_name \nFROM contacts \n"))
+        self.assertNotIn("users", sql)
+        self.assertEqual(result, rows)
+    
         
     async def test_get_all_contacts(self):
         contact = Contact()
@@ -44,8 +78,57 @@ class testContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result, contact)
     
     
+    async def test_search_contacts_fallback(self):
+        self.session.get_bind.return_value.dialect.name = 'sqlite'
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = self.contacts[:1]
+        self.session.execute.return_value = mocked_contacts
+        result = await search_contacts('testo', 10, self.session, User(id=1))
+        
+        sql = str(self.session.execute.call_args.args[0])
+        self.assertIn("LIKE", sql)
+        self.assertEqual(result, self.contacts[:1])
+    
+    
+    async def test_search_contacts_postgres(self):
+        self.session.get_bind.return_value.dialect.name = 'postgresql'
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = self.contacts
+        self.session.execute.return_value = mocked_contacts
+        result = await search_contacts('tset', 10, self.session, User(id=1))
+        
+        sql = str(self.session.execute.call_args.args[0])
+        self.assertIn("to_tsvector", sql)
+        self.assertIn("word_similarity", sql)
+        self.assertEqual(result, self.contacts)
+    
+    
+    async def test_get_upcoming_birthdays_year_wrap(self):
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = self.contacts
+        self.session.execute.return_value = mocked_contacts
+        result = await get_upcoming_birthdays(7, self.session, User(id=1), today=date(2024, 12, 28))
+        
+        stmt = self.session.execute.call_args.args[0]
+        params = stmt.compile().params
+        self.assertIn("contacts.birthday_md >= ", str(stmt))
+        self.assertIn("OR contacts.birthday_md <= ", str(stmt))
+        self.assertIn(1228, params.values())
+        self.assertIn(104, params.values())
+        self.assertEqual(result, self.contacts)
+    
+    
+    def test_birthday_md(self):
+        self.assertEqual(self.contact.birthday_md, 428)
+    
+    
     async def test_create_contact(self):
         body= ContactSchema(first_name=self.contact.first_name, last_name='Test',  email='Test email', phone_number='0965680323', birthday='28.04.1982',)
+        
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one.return_value = Contact(id=1, **body.model_dump())
+        self.session.execute.return_value = mocked_contact
+        
         result = await create_todo(body, self.session, User())
       
         self.assertEqual(result.first_name, self.contact.first_name)    
@@ -109,6 +192,116 @@ class testContacts(unittest.IsolatedAsyncioTestCase):
         
         self.assertIsNone(result, 'db returned object')
 
+    async def test_remove_contacts(self):
+        
+        mocked_ids = MagicMock()
+        mocked_ids.scalars.return_value.all.return_value = [1, 3]
+        self.session.execute.return_value = mocked_ids
+        
+        self.session.get_bind.return_value.dialect.name = 'postgresql'
+        result = await remove_contacts([1, 2, 3], db=self.session, user=User(id=1))
+        
+        self.assertEqual(result, {1, 3})
+        self.assertEqual(self.session.execute.await_count, 2)
+        counter = self.session.execute.await_args_list[1].args[0].compile(dialect=postgresql.dialect())
+        self.assertIn("ON CONFLICT (user_id) DO UPDATE SET count = (contact_counts.count + %(count_1)s", str(counter))
+        self.assertEqual(counter.params["count_1"], -2)
+        self.session.commit.assert_called_once()
+    
+    
+    @patch('src.repository.contacts.get_contacts_by_ids', new_callable=AsyncMock)
+    async def test_create_contacts_conflict(self, mock_get_by_ids):
+        mocked_rows = MagicMock()
+        mocked_rows.all.return_value = [(5, 'testovich2')]
+        self.session.execute.return_value = mocked_rows
+        self.session.get_bind.return_value.dialect.name = 'postgresql'
+        mock_get_by_ids.return_value = {5: self.contacts[1]}
+        bodies = [ContactSchema(first_name='test', last_name=last_name, email='test@email.com', phone_number='0985680323',
+                                birthday=date(1982, 4, 28)) for last_name in ('testovich', 'testovich2', 'testovich2')]
+        
+        result = await create_contacts(bodies, self.session, User(id=1))
+        
+        self.assertEqual(result, ['last_name already exists', self.contacts[1], 'last_name already exists'])
+        stmt, values = self.session.execute.await_args_list[0].args
+        self.assertIn("ON CONFLICT (last_name) DO NOTHING", str(stmt.compile(dialect=postgresql.dialect())))
+        self.assertEqual([row['last_name'] for row in values], ['testovich', 'testovich2'])
+        self.assertEqual(mock_get_by_ids.await_args.args[0], [5])
+        self.session.commit.assert_called_once()
+    
+    
+    async def test_change_count_zero(self):
+        await change_count(1, 0, self.session)
+        
+        self.session.execute.assert_not_awaited()
+    
+    
+    async def test_count_contacts(self):
+        mocked_count = MagicMock()
+        mocked_count.scalar_one_or_none.return_value = None
+        self.session.execute.return_value = mocked_count
+        
+        self.assertEqual(await count_contacts(self.session, User(id=1)), 0)
+        self.assertIn("contact_counts.user_id", str(self.session.execute.call_args.args[0]))
+    
+    
+    async def test_estimate_all_contacts(self):
+        self.session.get_bind.return_value.dialect.name = 'postgresql'
+        mocked_estimate = MagicMock()
+        mocked_estimate.scalar_one_or_none.return_value = 120000
+        self.session.execute.return_value = mocked_estimate
+        
+        self.assertEqual(await estimate_all_contacts(self.session), (120000, True))
+        self.assertIn("pg_class", str(self.session.execute.call_args.args[0]))
+    
+    
+    async def test_estimate_all_contacts_not_analyzed(self):
+        self.session.get_bind.return_value.dialect.name = 'postgresql'
+        mocked_estimate = MagicMock()
+        mocked_estimate.scalar_one_or_none.return_value = -1
+        mocked_estimate.scalar_one.return_value = 42
+        self.session.execute.return_value = mocked_estimate
+        
+        self.assertEqual(await estimate_all_contacts(self.session), (42, False))
+    
+    
+    async def test_update_contacts_not_owned(self):
+        
+        mocked_ids = MagicMock()
+        mocked_ids.scalars.return_value.all.return_value = []
+        self.session.execute.return_value = mocked_ids
+        
+        result = await update_contacts([ContactPatchSchema(id=5, data=True)], db=self.session, user=User(id=1))
+        
+        self.assertEqual(result, [None])
+        self.assertEqual(self.session.execute.await_count, 1)
+        self.session.commit.assert_not_called()
+    
+    @patch('src.repository.contacts.get_contacts_by_ids', new_callable=AsyncMock)
+    async def test_update_contacts_last_name_taken(self, mock_get_by_ids):
+        
+        owned, holders = MagicMock(), MagicMock()
+        owned.scalars.return_value.all.return_value = [1, 2, 3]
+        holders.all.return_value = [('taken', 9)]
+        self.session.execute.side_effect = [owned, holders, MagicMock()]
+        mock_get_by_ids.return_value = {1: self.contacts[0], 2: self.contacts[1], 3: self.contacts[2]}
+        items = [ContactPatchSchema(id=1, last_name='taken'), ContactPatchSchema(id=2, last_name='fresh'),
+                 ContactPatchSchema(id=3, last_name='fresh')]
+        
+        result = await update_contacts(items, db=self.session, user=User(id=1))
+        
+        self.assertEqual(result, ['last_name already exists', self.contacts[1], 'last_name already exists'])
+        self.assertEqual(self.session.execute.await_args_list[2].args[1], [{'id': 2, 'last_name': 'fresh'}])
+        self.session.commit.assert_called_once()
+    
+    def test_patch_rejects_null(self):
+        
+        with self.assertRaises(ValidationError):
+            ContactPatchSchema(id=1, first_name=None)
+        with self.assertRaises(ValidationError):
+            ContactPatchSchema(id=1, birthday=None)
+        
+        self.assertEqual(ContactPatchSchema(id=1, data=None).model_dump(exclude_unset=True), {'id': 1, 'data': None})
+
     
 if __name__ == "__main__":
     unittest.main()
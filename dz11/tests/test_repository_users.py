@@ -1,32 +1,41 @@
 import unittest
 from unittest.mock import patch, AsyncMock, MagicMock
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.schemas.user import UserSchema
 
 from src.database.models import User
-from src.repository.users import (get_user_by_email, create_user, update_token, update_avatar, confirmed_email,)
+from src.repository.users import (get_user_by_email, create_user, update_avatar, confirmed_email,)
 
  
 class TestUser(unittest.IsolatedAsyncioTestCase):
     
-    def setup (self):
+    def setUp (self):
         self.session = AsyncMock(spec=AsyncSession)
         self.user = User()
     
         
     async def test_get_user_by_email(self):
         mocked_user = MagicMock()
-        mocked_user.scalars.return_value.all.return_value = self.user
+        mocked_user.scalar_one_or_none.return_value = self.user
         self.session.execute.return_value = mocked_user
         
         result = await get_user_by_email(email='test@email', db=self.session)
         
         self.assertEqual(result, self.user)
+        self.assertTrue(self.session.execute.call_args.args[0].get_execution_options().get("replica"))
         
+    async def test_get_user_by_email_primary(self):
+        self.session.execute.return_value = MagicMock()
+        
+        await get_user_by_email(email='test@email', db=self.session, primary=True)
+        
+        self.assertFalse(self.session.execute.call_args.args[0].get_execution_options().get("replica"))
+        
+    @patch('src.repository.users.dialect_name', return_value='postgresql')
     @patch('src.repository.users.Gravatar')  
-    @patch('src.repository.users.User') 
-    async def test_create_user_success(self, MockUser, MockGravatar):
+    async def test_create_user_success(self, MockGravatar, MockDialectName):
         
         mock_db_session = self.session
         mock_gravatar_instance = MockGravatar.return_value
@@ -34,55 +43,63 @@ class TestUser(unittest.IsolatedAsyncioTestCase):
         
         user_data = UserSchema(email='test@example.com', username='Test User', password='Password')
         real_user_instance = User(**user_data.model_dump(), avatar='http://example.com/avatar.jpg')
-        mock_user_instance = MockUser.return_value = real_user_instance
-        mock_user_instance.email = user_data.email
-        mock_user_instance.username = user_data.username
-        mock_user_instance.avatar = 'http://example.com/avatar.jpg'
+        mock_db_session.execute.return_value = MagicMock()
+        mock_db_session.execute.return_value.scalar_one_or_none.return_value = real_user_instance
         
         created_user = await create_user(user_data, mock_db_session)
-        mock_db_session.add.assert_called_once_with(mock_user_instance)
+        stmt = mock_db_session.execute.await_args.args[0]
+        self.assertIn('ON CONFLICT DO NOTHING', str(stmt.compile(dialect=postgresql.dialect())))
+        self.assertEqual(stmt.compile().params['avatar'], 'http://example.com/avatar.jpg')
+        mock_db_session.execute.assert_awaited_once()
         mock_db_session.commit.assert_called_once()
-        mock_db_session.refresh.assert_called_once_with(mock_user_instance)
         
         self.assertEqual(created_user.email, user_data.email)
         self.assertEqual(created_user.username, user_data.username)
         self.assertEqual(created_user.avatar, 'http://example.com/avatar.jpg')
     
+    @patch('src.repository.users.dialect_name', return_value='postgresql')
     @patch('src.repository.users.Gravatar')
-    @patch('src.repository.users.User')
-    async def test_create_user_with_gravatar_error(self, MockUser, MockGravatar):
+    async def test_create_user_with_gravatar_error(self, MockGravatar, MockDialectName):
         mock_db_session = self.session
         mock_gravatar_instance = MockGravatar.return_value
         mock_gravatar_instance.get_image.side_effect = Exception('Gravatar error')
         
         user_data = UserSchema(email='test@example.com', username='Test User', password='Password')
-        mock_user_instance = MockUser.return_value = User(**user_data.model_dump(), avatar=None)
-        mock_user_instance.email = 'test@example.com'
-        mock_user_instance.username = 'Test User'
+        mock_db_session.execute.return_value = MagicMock()
+        mock_db_session.execute.return_value.scalar_one_or_none.return_value = User(**user_data.model_dump(), avatar=None)
 
         created_user = await create_user(user_data, mock_db_session)
-        mock_db_session.add.assert_called_once_with(mock_user_instance)
+        self.assertIsNone(mock_db_session.execute.await_args.args[0].compile().params['avatar'])
         mock_db_session.commit.assert_called_once()
-        mock_db_session.refresh.assert_called_once_with(created_user)
         
         self.assertEqual(created_user.email, user_data.email)
         self.assertEqual(created_user.username, user_data.username)
         self.assertIsNone(created_user.avatar)
+    
+    @patch('src.repository.users.dialect_name', return_value='postgresql')
+    @patch('src.repository.users.Gravatar')
+    async def test_create_user_exists(self, MockGravatar, MockDialectName):
+        self.session.execute.return_value = MagicMock()
+        self.session.execute.return_value.scalar_one_or_none.return_value = None
+        user_data = UserSchema(email='test@example.com', username='Test User', password='Password')
+        
+        created_user = await create_user(user_data, self.session)
+        
+        self.assertIsNone(created_user)
 
-    @patch('src.repository.users.User')
-    async def test_update_token(self, Mock_User):
-        mock_user= Mock_User.return_value
-        token = 'new token'
-        await update_token(mock_user, token, self.session)
-        self.assertEqual(token, mock_user.refresh_token)
+    async def test_confirmed_email(self):
+        self.session.execute.return_value = MagicMock()
+        self.session.execute.return_value.scalar_one_or_none.return_value = 1
+        result = await confirmed_email('test email', self.session)
+        self.assertTrue(result)
+        self.session.execute.assert_awaited_once()
         self.session.commit.assert_called_once()
 
-    @patch('src.repository.users.get_user_by_email')
-    async def test_confirmed_email(self, MockGetUserByEmail):
-        mock_get = MockGetUserByEmail.return_value = User()
-        await confirmed_email('test email', self.session)
-        self.assertEqual(mock_get.confirmed, True)
-        self.session.commit.assert_called_once()
+    async def test_confirmed_email_already_confirmed(self):
+        self.session.execute.return_value = MagicMock()
+        self.session.execute.return_value.scalar_one_or_none.return_value = None
+        result = await confirmed_email('test email', self.session)
+        self.assertFalse(result)
 
 
     @patch('src.repository.users.get_user_by_email', new_callable=AsyncMock)
@@ -33,7 +33,8 @@ def test_login_user_not_confirmed(client, user):
     assert data["detail"] == "Email not confirmed"
 
 
-def test_login_user(client, session, user):
+def test_login_user(client, session, user, monkeypatch):
+    monkeypatch.setattr("src.routes.auth.refresh_tokens.issue", AsyncMock(return_value="refresh_token"))
     current_user: User = session.query(User).filter(User.email == user.get('email')).first()
     current_user.confirmed = True
     session.commit()
@@ -0,0 +1,58 @@
+import json
+import unittest
+from datetime import date, datetime
+
+from fastapi import HTTPException, Response
+
+from src.database.models import Contact, Role, User
+from src.routes.contacts import list_response, sparse_fields
+
+
+class TestListResponse(unittest.TestCase):
+
+    def setUp(self):
+        self.user = User(id=1, username='deadpool', email='deadpool@example.com', avatar='avatar', role=Role.user)
+        self.contacts = [Contact(id=i, first_name='test', last_name=f'testovich{i}', email='test email', phone_number='0985680323',
+                                 birthday=date(1982, 4, 28), data=False, created_at=datetime(2024, 1, 1), updated_at=None,
+                                 user_id=1, user=self.user)
+                         for i in range(1, 4)]
+
+    def test_list_response(self):
+        response = Response()
+        response.headers["X-Next-Cursor"] = "cursor"
+
+        result = list_response(self.contacts, response)
+        data = json.loads(result.body)
+
+        self.assertEqual(result.media_type, "application/json")
+        self.assertEqual(result.headers["x-next-cursor"], "cursor")
+        self.assertEqual([item["id"] for item in data], [1, 2, 3])
+        self.assertEqual(data[0]["birthday"], "1982-04-28")
+        self.assertEqual(data[0]["created_at"], "2024-01-01T00:00:00")
+        self.assertEqual(data[0]["user_id"], 1)
+        self.assertNotIn("user", data[0])
+
+    def test_empty_list(self):
+        self.assertEqual(list_response([], Response()).body, b"[]")
+
+    def test_list_response_columns(self):
+        result = list_response(self.contacts, Response(), ("id", "last_name"))
+
+        self.assertEqual(json.loads(result.body)[0], {"id": 1, "last_name": "testovich1"})
+
+
+class TestSparseFields(unittest.TestCase):
+
+    def test_sparse_fields(self):
+        self.assertIsNone(sparse_fields(None))
+        self.assertEqual(sparse_fields("last_name, first_name"), ("id", "first_name", "last_name"))
+
+    def test_unknown_field(self):
+        with self.assertRaises(HTTPException) as err:
+            sparse_fields("first_name,password")
+
+        self.assertEqual(err.exception.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from fastapi import HTTPException
+
+from src.database.models import User
+from src.services.auth import Auth
+from src.services.token_cache import TokenCache
+
+
+class TestRevokeTokens(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.auth = Auth()
+        self.auth.cache = MagicMock()
+        self.auth.cache.revoke_tokens = AsyncMock()
+        self.auth.token_cache = TokenCache()
+        self.user = User(id=1, username='deadpool', email='deadpool@example.com')
+        self.auth.cache.get_user = AsyncMock(return_value=(self.user, 0))
+        self.db = MagicMock()
+        self.db.info = {}
+        self.token = await self.auth.create_access_token(data={"sub": self.user.email})
+
+    async def test_valid_token(self):
+        self.assertIs(await self.auth.get_current_user(self.token, self.db), self.user)
+        self.assertEqual(self.db.info["user_id"], 1)
+
+    async def test_revoked_token_cached(self):
+        await self.auth.get_current_user(self.token, self.db)
+        self.auth.cache.get_user.return_value = (self.user, int(time.time()) + 1)
+
+        with self.assertRaises(HTTPException) as err:
+            await self.auth.get_current_user(self.token, self.db)
+
+        self.assertEqual(err.exception.status_code, 401)
+        self.assertEqual(self.auth.token_cache.hits, 1)
+
+    async def test_revoked_token_not_cached(self):
+        self.auth.cache.get_user.return_value = (None, int(time.time()) + 1)
+
+        with self.assertRaises(HTTPException) as err:
+            await self.auth.get_current_user(self.token, self.db)
+
+        self.assertEqual(err.exception.status_code, 401)
+        self.assertEqual(self.auth.token_cache.misses, 1)
+
+    async def test_revoke_tokens(self):
+        await self.auth.get_current_user(self.token, self.db)
+
+        await self.auth.revoke_tokens(self.user.email)
+
+        self.auth.cache.revoke_tokens.assert_awaited_once_with(self.user.email)
+        self.assertEqual(self.auth.token_cache.stats()["size"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
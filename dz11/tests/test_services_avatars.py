@@ -0,0 +1,121 @@
+import asyncio
+import importlib.util
+import io
+import tempfile
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fastapi import HTTPException, Request
+
+from src.services.avatars import AvatarBusy, AvatarExecutor, AvatarProcessor, make_thumbnail, read_upload
+from src.services.hashing import HashingBusy
+from src.services.storage import LocalStorage
+
+
+def upload(data: bytes, content_type: str = "image/png", content_length: bool = True) -> Request:
+    body = (b"--boundary\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.png\"\r\n"
+            + f"Content-Type: {content_type}\r\n\r\n".encode() + data + b"\r\n--boundary--\r\n")
+    headers = [(b"content-type", b"multipart/form-data; boundary=boundary")]
+    if content_length:
+        headers.append((b"content-length", str(len(body)).encode()))
+    chunks = [body[i:i + 1024] for i in range(0, len(body), 1024)]
+
+    async def receive():
+        chunk = chunks.pop(0) if chunks else b""
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+    return Request({"type": "http", "method": "PATCH", "headers": headers}, receive)
+
+
+class TestAvatars(unittest.IsolatedAsyncioTestCase):
+
+    async def test_read_upload(self):
+        self.assertEqual(await read_upload(upload(b"x" * 100), max_bytes=100), b"x" * 100)
+
+    async def test_read_upload_too_large(self):
+        with self.assertRaises(HTTPException) as err:
+            await read_upload(upload(b"x" * 101), max_bytes=100)
+
+        self.assertEqual(err.exception.status_code, 413)
+
+    async def test_read_upload_content_length_rejected_before_body(self):
+        request = upload(b"x" * 20000)
+        request._receive = AsyncMock()
+
+        with self.assertRaises(HTTPException) as err:
+            await read_upload(request, max_bytes=100)
+
+        self.assertEqual(err.exception.status_code, 413)
+        request._receive.assert_not_awaited()
+
+    async def test_read_upload_stream_stops_past_limit(self):
+        with self.assertRaises(HTTPException) as err:
+            await read_upload(upload(b"x" * 200000, content_length=False), max_bytes=100)
+
+        self.assertEqual(err.exception.status_code, 413)
+
+    async def test_read_upload_wrong_type(self):
+        with self.assertRaises(HTTPException) as err:
+            await read_upload(upload(b"x", "text/plain"))
+
+        self.assertEqual(err.exception.status_code, 415)
+
+    async def test_local_storage(self):
+        with tempfile.TemporaryDirectory() as root:
+            url = await LocalStorage(root=root, base_url="/media/").save("avatars/1.webp", b"data", "image/webp")
+
+            self.assertEqual(url, "/media/avatars/1.webp")
+            with open(f"{root}/avatars/1.webp", "rb") as fh:
+                self.assertEqual(fh.read(), b"data")
+
+    async def test_process_updates_avatar_after_store(self):
+        backend = AsyncMock()
+        backend.save.return_value = "/media/avatars/1-abc.webp"
+        processor = AvatarProcessor(backend=backend)
+        processor.executor = AsyncMock()
+        processor.executor.run.return_value = b"thumbnail"
+
+        with patch("src.services.avatars.repository_users.update_avatar") as update_avatar, \
+                patch("src.services.avatars.sessonmanager.session") as session:
+            url = await processor.process(1, "deadpool@example.com", b"image")
+
+        self.assertEqual(url, "/media/avatars/1-abc.webp")
+        update_avatar.assert_awaited_once_with("deadpool@example.com", url, session.return_value.__aenter__.return_value)
+
+    async def test_process_failure_keeps_avatar(self):
+        processor = AvatarProcessor(backend=AsyncMock())
+        processor.executor = AsyncMock()
+        processor.executor.run.side_effect = OSError("cannot identify image file")
+
+        with patch("src.services.avatars.repository_users.update_avatar") as update_avatar:
+            self.assertIsNone(await processor.process(1, "deadpool@example.com", b"image"))
+
+        update_avatar.assert_not_called()
+
+    async def test_executor_busy(self):
+        executor = AvatarExecutor(kind="thread", max_workers=1, queue_timeout=0.01)
+        try:
+            running = asyncio.create_task(executor.run(time.sleep, 0.1))
+            await asyncio.sleep(0.01)
+
+            with self.assertRaises(AvatarBusy) as err:
+                await executor.run(time.sleep, 0)
+
+            self.assertNotIsInstance(err.exception, HashingBusy)
+            await running
+        finally:
+            executor.shutdown()
+
+    @unittest.skipUnless(importlib.util.find_spec("PIL"), "Pillow is not installed")
+    def test_make_thumbnail(self):
+        from PIL import Image
+
+        source = io.BytesIO()
+        Image.new("RGB", (400, 300), "red").save(source, format="PNG")
+        with Image.open(io.BytesIO(make_thumbnail(source.getvalue(), 250, "PNG"))) as image:
+            self.assertEqual(image.size, (250, 250))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import re
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import redis.asyncio as redis
+
+from src.services.banlist import BanList, BanRules
+
+
+class TestBanRules(unittest.TestCase):
+
+    def setUp(self):
+        self.rules = BanRules(["192.168.1.1", "10.0.0.0/8", "2001:db8::/32", "not an ip"], [r"Googlebot", r"Python-urllib", r"("])
+
+    def test_ip_banned(self):
+        self.assertTrue(self.rules.ip_banned("192.168.1.1"))
+        self.assertTrue(self.rules.ip_banned("10.20.30.40"))
+        self.assertTrue(self.rules.ip_banned("2001:db8::1"))
+        self.assertTrue(self.rules.ip_banned("::ffff:10.1.1.1"))
+        self.assertFalse(self.rules.ip_banned("192.168.1.3"))
+        self.assertFalse(self.rules.ip_banned("11.0.0.1"))
+
+    def test_host_not_ip(self):
+        self.assertFalse(self.rules.ip_banned("testclient"))
+        self.assertFalse(self.rules.ip_banned(None))
+
+    def test_agent_banned(self):
+        self.assertTrue(self.rules.agent_banned("Mozilla/5.0 (compatible; Googlebot/2.1)"))
+        self.assertTrue(self.rules.agent_banned("Python-urllib/3.11"))
+        self.assertFalse(self.rules.agent_banned("Mozilla/5.0"))
+        self.assertFalse(self.rules.agent_banned(None))
+
+    def test_invalid_rules_skipped(self):
+        self.assertEqual(self.rules.invalid, 2)
+        self.assertEqual(self.rules.ip_count, 3)
+        self.assertEqual(self.rules.agent_count, 2)
+
+    def test_inline_global_flags_rejected(self):
+        rules = BanRules([], [r"(?i)curl", r"wget"])
+
+        self.assertEqual(rules.invalid, 1)
+        self.assertTrue(rules.agent_banned("Wget/1.21 wget"))
+
+
+class TestBanList(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = AsyncMock()
+        self.ban_list = BanList(ips=["127.0.0.1"], agents=[], reload_seconds=60)
+
+    async def test_reload_from_redis(self):
+        self.redis.get.return_value = b"1"
+        self.redis.smembers.side_effect = [{b"172.16.0.0/12"}, {b"curl/"}]
+        self.ban_list.redis = self.redis
+
+        self.assertTrue(await self.ban_list.reload())
+        self.assertTrue(self.ban_list.is_banned("127.0.0.1", None))
+        self.assertTrue(self.ban_list.is_banned("172.20.1.1", None))
+        self.assertTrue(self.ban_list.is_banned("8.8.8.8", "curl/8.0"))
+        self.assertEqual(self.ban_list.stats()["blocked"], 3)
+
+    async def test_reload_same_version(self):
+        self.redis.get.return_value = b"1"
+        self.ban_list.redis = self.redis
+        self.ban_list.version = b"1"
+
+        self.assertFalse(await self.ban_list.reload())
+        self.redis.smembers.assert_not_called()
+
+    async def test_reload_redis_down(self):
+        self.redis.get.side_effect = redis.ConnectionError()
+        self.ban_list.redis = self.redis
+
+        self.assertFalse(await self.ban_list.reload())
+        self.assertTrue(self.ban_list.is_banned("127.0.0.1", None))
+        self.assertEqual(self.ban_list.stats()["reload_errors"], 1)
+
+    async def test_reload_keeps_rules_on_compile_error(self):
+        self.redis.get.return_value = b"2"
+        self.redis.smembers.side_effect = [set(), {b"curl/"}]
+        self.ban_list.redis = self.redis
+
+        with patch("src.services.banlist.BanRules", side_effect=re.error("bad")):
+            self.assertFalse(await self.ban_list.reload())
+
+        self.assertTrue(self.ban_list.is_banned("127.0.0.1", None))
+        self.assertIsNone(self.ban_list.version)
+        self.assertEqual(self.ban_list.stats()["reload_errors"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+from src.database.models import User, Role
+from src.services.cache import UserCache
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = AsyncMock()
+        self.cache = UserCache(ttl=60, token_ttl=900)
+        self.cache.init(self.redis)
+        self.user = User(id=1, username='deadpool', email='deadpool@example.com', password='hash',
+                         avatar='http://example.com/avatar.jpg', role=Role.admin,
+                         confirmed=True, created_at=datetime(2024, 6, 1, 12, 0), updated_at=None)
+
+    def test_snapshot_roundtrip(self):
+        data = UserCache.dumps(self.user)
+        result = UserCache.loads(data)
+
+        self.assertEqual(result.id, self.user.id)
+        self.assertEqual(result.email, self.user.email)
+        self.assertEqual(result.role, Role.admin)
+        self.assertEqual(result.created_at, self.user.created_at)
+        self.assertNotIn(b'hash', data)
+        self.assertNotIn(b'token', data)
+
+    def test_snapshot_other_version(self):
+        self.assertIsNone(UserCache.loads(b'[0,1,"deadpool"]'))
+
+    async def test_get_user_hit(self):
+        self.redis.mget.return_value = [UserCache.dumps(self.user), None]
+        result, not_before = await self.cache.get_user(self.user.email)
+
+        self.redis.mget.assert_called_once_with('user:v1:deadpool@example.com', 'user:not_before:deadpool@example.com')
+        self.assertEqual(result.username, self.user.username)
+        self.assertEqual(not_before, 0)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    async def test_get_user_miss(self):
+        self.redis.mget.return_value = [None, b'1700000000']
+        result, not_before = await self.cache.get_user(self.user.email)
+
+        self.assertIsNone(result)
+        self.assertEqual(not_before, 1700000000)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    async def test_revoke_tokens(self):
+        await self.cache.revoke_tokens(self.user.email)
+
+        key, not_before = self.redis.set.call_args.args
+        self.assertEqual(key, 'user:not_before:deadpool@example.com')
+        self.assertGreater(not_before, time.time())
+        self.assertEqual(self.redis.set.call_args.kwargs, {'ex': 900})
+
+    async def test_set_user(self):
+        await self.cache.set_user(self.user)
+
+        self.redis.set.assert_called_once_with('user:v1:deadpool@example.com', UserCache.dumps(self.user), ex=60)
+
+    async def test_invalidate(self):
+        await self.cache.invalidate(self.user.email)
+
+        self.redis.delete.assert_called_once_with('user:v1:deadpool@example.com')
+
+
+if __name__ == "__main__":
+    unittest.main()
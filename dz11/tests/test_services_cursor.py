@@ -0,0 +1,36 @@
+import unittest
+
+from fastapi import HTTPException
+
+from src.services.cursor import CursorSigner
+
+
+class TestCursorSigner(unittest.TestCase):
+
+    def setUp(self):
+        self.signer = CursorSigner('test secret')
+
+    def test_roundtrip(self):
+        cursor = self.signer.encode('1', 42)
+
+        self.assertEqual(self.signer.decode('1', cursor), 42)
+
+    def test_other_scope(self):
+        cursor = self.signer.encode('1', 42)
+
+        with self.assertRaises(HTTPException) as err:
+            self.signer.decode('2', cursor)
+        self.assertEqual(err.exception.status_code, 400)
+
+    def test_forged_cursor(self):
+        forged = CursorSigner('other secret').encode('1', 42)
+
+        with self.assertRaises(HTTPException):
+            self.signer.decode('1', forged)
+
+        with self.assertRaises(HTTPException):
+            self.signer.decode('1', 'not a cursor')
+
+
+if __name__ == "__main__":
+    unittest.main()
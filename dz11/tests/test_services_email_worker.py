@@ -0,0 +1,120 @@
+import importlib.util
+import json
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import aiosmtplib
+
+from src.services.email import EmailOutbox
+from src.services.email_worker import EmailWorker, SMTPPool, render
+
+
+def job(**fields):
+    data = {"id": "1", "template": "verify_email.html", "subject": "Confirm your email ", "to": "deadpool@example.com",
+            "body": {"host": "http://localhost/", "username": "deadpool", "token": "abc"}, "attempts": 0}
+    data.update(fields)
+    return json.dumps(data).encode()
+
+
+class TestEmailWorker(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.outbox = EmailOutbox()
+        self.outbox.init(AsyncMock())
+        self.pool = AsyncMock()
+        self.worker = EmailWorker(self.outbox, self.pool, name="test", batch_size=10, max_attempts=3,
+                                  backoff_seconds=10, backoff_max=15)
+
+    def test_render(self):
+        message = render(json.loads(job()))
+
+        self.assertEqual(message["To"], "deadpool@example.com")
+        self.assertIn("api/auth/confirmed_email/abc", message.get_content())
+
+    async def test_deliver_sent(self):
+        raw = job()
+        await self.worker.deliver(raw)
+
+        self.pool.send.assert_awaited_once()
+        self.outbox.redis.lrem.assert_awaited_once_with("email:processing:test", 1, raw)
+        self.assertEqual(self.worker.sent, 1)
+
+    async def test_deliver_retry(self):
+        self.pool.send.side_effect = aiosmtplib.SMTPConnectError("down")
+        with patch("src.services.email_worker.time.time", return_value=1000.0):
+            await self.worker.deliver(job(attempts=1))
+
+        retry, score = next(iter(self.outbox.redis.zadd.await_args.args[1].items()))
+        self.assertEqual(json.loads(retry)["attempts"], 2)
+        self.assertEqual(score, 1015.0)
+        self.assertEqual(self.worker.retried, 1)
+
+    async def test_deliver_dead(self):
+        self.pool.send.side_effect = aiosmtplib.SMTPConnectError("down")
+        await self.worker.deliver(job(attempts=2))
+
+        self.outbox.redis.lpush.assert_awaited_once()
+        self.assertEqual(self.outbox.redis.lpush.await_args.args[0], "email:dead")
+        self.outbox.redis.zadd.assert_not_awaited()
+        self.assertEqual(self.worker.dead, 1)
+
+    async def test_deliver_unexpected_error_retried(self):
+        self.pool.send.side_effect = ValueError("bad header")
+        raw = job()
+        await self.worker.deliver(raw)
+
+        self.outbox.redis.zadd.assert_awaited_once()
+        self.outbox.redis.lrem.assert_awaited_once_with("email:processing:test", 1, raw)
+        self.assertEqual(self.worker.failed, 1)
+
+    async def test_run_survives_unexpected_error(self):
+        calls = 0
+
+        async def run_once():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise ValueError("boom")
+            self.worker.stop()
+
+        with patch.object(self.worker, "recover", AsyncMock(return_value=0)), \
+                patch.object(self.worker, "run_once", run_once), \
+                patch("src.services.email_worker.asyncio.sleep", AsyncMock()):
+            await self.worker.run()
+
+        self.assertEqual(calls, 2)
+        self.pool.close.assert_awaited_once()
+
+    async def test_fetch_batch(self):
+        self.outbox.redis.blmove.return_value = job(id="1")
+        self.outbox.redis.lmove.side_effect = [job(id="2"), None]
+
+        batch = await self.worker.fetch()
+
+        self.assertEqual(len(batch), 2)
+
+
+@unittest.skipUnless(importlib.util.find_spec("aiosmtpd"), "aiosmtpd is not installed")
+class TestSMTPPool(unittest.IsolatedAsyncioTestCase):
+
+    async def test_reuses_connection(self):
+        from aiosmtpd.controller import Controller
+        from aiosmtpd.handlers import Sink
+
+        controller = Controller(Sink(), hostname="127.0.0.1", port=8025)
+        controller.start()
+        try:
+            with patch.multiple("src.services.email_worker.config", MAIL_SERVER="127.0.0.1", MAIL_PORT=8025,
+                                MAIL_SSL_TLS=False, MAIL_STARTTLS=False, MAIL_USE_CREDENTIALS=False):
+                pool = SMTPPool(size=1)
+            for _ in range(3):
+                await pool.send(render(json.loads(job())))
+            await pool.close()
+        finally:
+            controller.stop()
+
+        self.assertEqual(pool.connects, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
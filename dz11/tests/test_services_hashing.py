@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+
+from src.services.hashing import HashingExecutor, HashingBusy
+
+
+def slow_echo(value):
+    import time
+    time.sleep(0.2)
+    return value
+
+
+class TestHashingExecutor(unittest.IsolatedAsyncioTestCase):
+
+    async def test_hash_and_verify(self):
+        hasher = HashingExecutor(kind="process", max_workers=2)
+        try:
+            hashed = await hasher.hash('123456789')
+            self.assertTrue(await hasher.verify('123456789', hashed))
+            self.assertFalse(await hasher.verify('password', hashed))
+        finally:
+            hasher.shutdown()
+
+        stats = hasher.stats()
+        self.assertEqual(stats['completed'], 3)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertGreater(stats['avg_run_seconds'], 0)
+
+    async def test_full_queue_rejected(self):
+        hasher = HashingExecutor(kind="thread", max_workers=1, max_pending=1, queue_timeout=5)
+        try:
+            running = asyncio.create_task(hasher.run(slow_echo, 1))
+            queued = asyncio.create_task(hasher.run(slow_echo, 2))
+            await asyncio.sleep(0.05)
+
+            with self.assertRaises(HashingBusy):
+                await hasher.run(slow_echo, 3)
+
+            self.assertEqual(await running, 1)
+            self.assertEqual(await queued, 2)
+            self.assertEqual(hasher.stats()['rejected'], 1)
+        finally:
+            hasher.shutdown()
+
+    async def test_queue_timeout(self):
+        hasher = HashingExecutor(kind="thread", max_workers=1, queue_timeout=0.05)
+        try:
+            running = asyncio.create_task(hasher.run(slow_echo, 1))
+            await asyncio.sleep(0.01)
+
+            with self.assertRaises(HashingBusy):
+                await hasher.run(slow_echo, 2)
+
+            await running
+        finally:
+            hasher.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from src.database.models import User
+from src.services.importer import ContactImporter, iter_lines, parse_csv
+
+
+async def chunks(data: bytes, size: int = 5):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+class TestImporter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_iter_lines(self):
+        data = 'first\r\nсекунда\nthird'.encode()
+        result = [line async for line in iter_lines(chunks(data))]
+
+        self.assertEqual(result, ['first', 'секунда', 'third'])
+
+    async def test_parse_csv(self):
+        data = b'first_name,last_name\n"Carl, Jr",Carlson\nonly_one\n'
+        result = [row async for row in parse_csv(iter_lines(chunks(data)))]
+
+        self.assertEqual(result[0], (2, {'first_name': 'Carl, Jr', 'last_name': 'Carlson'}))
+        self.assertEqual(result[1][0], 3)
+        self.assertIsInstance(result[1][1], str)
+
+    @patch('src.services.importer.repository_contacts.insert_contacts', new_callable=AsyncMock)
+    async def test_run_batches(self, mock_insert):
+        mock_insert.return_value = []
+        rows = b''.join(b'{"first_name":"Test","last_name":"Test%d","email":"test@email","phone_number":"0985680323","birthday":"28.04.1982"}\n' % i
+                        for i in range(5))
+        report = await ContactImporter(batch_size=2).run(chunks(rows + b'{"first_name":"x"}\n', 64), 'ndjson', AsyncMock(), User(id=1))
+
+        self.assertEqual(mock_insert.await_count, 3)
+        self.assertEqual(report['total'], 6)
+        self.assertEqual(report['imported'], 5)
+        self.assertEqual(report['failed'], 1)
+        self.assertEqual(report['errors'][0]['line'], 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
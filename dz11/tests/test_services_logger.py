@@ -0,0 +1,53 @@
+import json
+import logging
+import queue
+import unittest
+from unittest.mock import patch
+
+from src.database.models import Role
+from src.services.logger import DroppingQueueHandler, JsonFormatter, SamplingFilter, redact
+
+
+class TestLogger(unittest.TestCase):
+
+    def record(self, msg, *args, level=logging.INFO, **extra):
+        record = logging.LogRecord('test', level, __file__, 1, msg, args, None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_redact(self):
+        result = redact({'Authorization': 'Bearer abc', 'headers': ['Bearer eyJa.eyJb.sig'], 'data': {'password': 'qwerty'}})
+
+        self.assertEqual(result, {'Authorization': '***', 'headers': ['Bearer ***'], 'data': {'password': '***'}})
+
+    def test_json_format(self):
+        record = self.record('token %s', 'Bearer secret', user_id=1, role=Role.admin, refresh_token='abc')
+        data = json.loads(JsonFormatter().format(record))
+
+        self.assertEqual(data['msg'], 'token Bearer ***')
+        self.assertEqual(data['user_id'], 1)
+        self.assertEqual(data['role'], 'admin')
+        self.assertEqual(data['refresh_token'], '***')
+        self.assertEqual(data['level'], 'INFO')
+
+    def test_sampling(self):
+        sampler = SamplingFilter({'request_banned': 0.1})
+
+        with patch('src.services.logger.random.random', return_value=0.5):
+            self.assertFalse(sampler.filter(self.record('banned', event='request_banned')))
+            self.assertTrue(sampler.filter(self.record('banned', event='request_banned', level=logging.WARNING)))
+            self.assertTrue(sampler.filter(self.record('other', event='other')))
+        with patch('src.services.logger.random.random', return_value=0.05):
+            self.assertTrue(sampler.filter(self.record('banned', event='request_banned')))
+
+    def test_full_queue_drops(self):
+        handler = DroppingQueueHandler(queue.Queue(1))
+        handler.handle(self.record('first'))
+        handler.handle(self.record('second'))
+
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(handler.dropped, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.services.metrics import Histogram, Metrics, route_group
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.metrics = Metrics(directory=self.tmp.name, flush_seconds=60)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_histogram_buckets(self):
+        histogram = Histogram()
+        histogram.observe(0.003)
+        histogram.observe(0.2)
+        samples = histogram.samples('latency', route='/')
+
+        self.assertEqual(samples['latency_bucket{route="/",le="0.005"}'], 1)
+        self.assertEqual(samples['latency_bucket{route="/",le="0.25"}'], 2)
+        self.assertEqual(samples['latency_bucket{route="/",le="+Inf"}'], 2)
+        self.assertEqual(samples['latency_count{route="/"}'], 2)
+
+    def test_route_group(self):
+        self.assertEqual(route_group('/api/contacts/5'), '/api/contacts')
+        self.assertEqual(route_group('/metrics'), 'other')
+
+    def test_merge_workers(self):
+        self.metrics.observe('GET', '/api/contacts/', 200, 0.01)
+        key = 'http_requests_total{method="GET",route="/api/contacts/",status="200"}'
+        other = {'pid': 999999999, 'counters': {'http_requests_total': {key: 4}},
+                 'gauges': {'http_requests_in_flight': {'http_requests_in_flight{group="other"}': 3}}}
+        Path(self.tmp.name, '999999999.json').write_text(json.dumps(other))
+
+        merged = self.metrics.collect()
+
+        self.assertEqual(merged['http_requests_total'][key], 5)
+        self.assertEqual(merged['http_requests_in_flight']['http_requests_in_flight{group="other"}'], 0)
+
+    def test_pid_reuse_keeps_counters(self):
+        self.metrics.observe('GET', '/api/contacts/', 200, 0.01)
+        self.metrics.write(self.metrics.snapshot())
+        restarted = Metrics(directory=self.tmp.name, flush_seconds=60)
+        restarted._pid, restarted._instance = os.getpid(), f'{os.getpid()}-1'
+        restarted.observe('GET', '/api/contacts/', 200, 0.01)
+        restarted.write(restarted.snapshot())
+
+        self.assertEqual(len(list(Path(self.tmp.name).glob('*.json'))), 2)
+        key = 'http_requests_total{method="GET",route="/api/contacts/",status="200"}'
+        self.assertEqual(restarted.collect()['http_requests_total'][key], 2)
+
+    def test_clean_removes_previous_start(self):
+        snapshot = {'pid': 999999999, 'counters': {}, 'gauges': {}}
+        Path(self.tmp.name, '999999999-1.json').write_text(json.dumps({**snapshot, 'parent': os.getppid() + 1}))
+        Path(self.tmp.name, '999999999-2.json').write_text(json.dumps({**snapshot, 'parent': os.getppid()}))
+        self.metrics.write(self.metrics.snapshot())
+
+        self.metrics.clean()
+
+        self.assertEqual(sorted(path.name for path in Path(self.tmp.name).glob('*.json')),
+                         sorted(['999999999-2.json', f'{self.metrics.instance()}.json']))
+
+    def test_render(self):
+        self.metrics.observe('POST', '/api/auth/login', 401, 0.3)
+        text = self.metrics.render()
+
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn('http_requests_total{method="POST",route="/api/auth/login",status="401"} 1', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
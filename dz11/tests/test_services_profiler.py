@@ -0,0 +1,48 @@
+import unittest
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.services.profiler import QueryProfile, QueryProfiler, normalize
+
+
+class TestQueryProfiler(unittest.IsolatedAsyncioTestCase):
+
+    profiler = QueryProfiler(max_queries=5, max_seconds=1.0, repeat_threshold=3)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.profiler.install()
+
+    def test_normalize(self):
+        self.assertEqual(normalize("SELECT * FROM contacts\n WHERE id = 5 AND email = 'a@b.c'"),
+                         "SELECT * FROM contacts WHERE id = ? AND email = ?")
+        self.assertEqual(normalize("SELECT * FROM contacts WHERE id IN ($1, $2, $3)"),
+                         "SELECT * FROM contacts WHERE id IN (?)")
+
+    def test_over_budget(self):
+        profile = QueryProfile()
+        for _ in range(3):
+            profile.record("SELECT ?", 0.001)
+
+        self.assertEqual(self.profiler.over_budget(profile), ["repeated"])
+        self.assertEqual(profile.repeated(3), [("SELECT ?", 3, profile.seconds)])
+
+    async def test_records_statements(self):
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        profile = QueryProfile()
+        token = self.profiler.current.set(profile)
+        try:
+            async with engine.connect() as conn:
+                for contact_id in range(4):
+                    await conn.execute(text(f"SELECT {contact_id}"))
+        finally:
+            self.profiler.current.reset(token)
+            await engine.dispose()
+
+        self.assertEqual(profile.count, 4)
+        self.assertEqual(profile.repeated(3)[0][:2], ("SELECT ?", 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
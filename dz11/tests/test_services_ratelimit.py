@@ -0,0 +1,183 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import redis.asyncio as redis
+from fastapi import HTTPException
+
+from src.services.ratelimit import RateLimit, RateLimiter
+
+
+class FakeScript:
+    """Python version of the Lua token bucket, with the clock of the test."""
+
+    def __init__(self, server):
+        self.server = server
+
+    async def __call__(self, keys, args, client=None):
+        if client is not None:
+            client.calls.append((keys, args))
+            return client
+        return self.run(keys, args)
+
+    def run(self, keys, args):
+        if self.server.down:
+            raise redis.ConnectionError("down")
+        self.server.calls += 1
+        capacity, rate, cost, acquire = args
+        now = self.server.now
+        tokens, ts = self.server.buckets.get(keys[0], (capacity, now))
+        tokens = min(capacity, tokens + max(0, now - ts) * rate)
+        allowed = 1
+        if acquire:
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                allowed = 0
+        else:
+            tokens = max(0, tokens - cost)
+        self.server.buckets[keys[0]] = (tokens, now)
+        return [allowed, str(tokens).encode()]
+
+
+class FakePipeline:
+
+    def __init__(self, script):
+        self.script = script
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def execute(self):
+        return [self.script.run(keys, args) for keys, args in self.calls]
+
+
+class FakeRedis:
+
+    def __init__(self):
+        self.buckets = {}
+        self.calls = 0
+        self.now = 1000.0
+        self.down = False
+        self.script = FakeScript(self)
+
+    def register_script(self, source):
+        return self.script
+
+    async def script_load(self, source):
+        if self.down:
+            raise redis.ConnectionError("down")
+
+    async def ping(self):
+        if self.down:
+            raise redis.ConnectionError("down")
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self.script)
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = FakeRedis()
+        self.workers = [RateLimiter(sync_seconds=3600), RateLimiter(sync_seconds=3600)]
+        for worker in self.workers:
+            await worker.start(self.server)
+
+    async def asyncTearDown(self):
+        for worker in self.workers:
+            await worker.stop()
+
+    async def test_hot_key_stays_local(self):
+        limiter = self.workers[0]
+        results = [await limiter.acquire("/me:user:1", 3, 0.1) for _ in range(10)]
+
+        self.assertEqual(results[:3], [0.0, 0.0, 0.0])
+        self.assertTrue(all(retry > 0 for retry in results[3:]))
+        self.assertEqual(self.server.calls, 1)
+        self.assertEqual(limiter.stats()["limited"], 7)
+
+    async def test_first_request_of_worker_checks_redis(self):
+        first, second = self.workers
+
+        self.assertEqual(await first.acquire("/me:user:1", 1, 0.05), 0.0)
+        self.assertGreater(await second.acquire("/me:user:1", 1, 0.05), 0.0)
+
+    async def test_sync_shares_local_usage(self):
+        first, second = self.workers
+        await first.acquire("/me:user:1", 5, 0.01)
+        await second.acquire("/me:user:1", 5, 0.01)
+        for _ in range(3):
+            await first.acquire("/me:user:1", 5, 0.01)
+
+        await first.sync()
+        await second.sync()
+
+        self.assertEqual(first.buckets["/me:user:1"].pending, 0)
+        self.assertEqual(second.buckets["/me:user:1"].tokens, 0)
+        self.assertGreater(await second.acquire("/me:user:1", 5, 0.01), 0.0)
+
+    async def test_full_buckets_are_dropped(self):
+        limiter = self.workers[0]
+        await limiter.acquire("/me:user:1", 1, 1000.0)
+        await limiter.sync()
+
+        with patch("src.services.ratelimit.time.monotonic", return_value=limiter.buckets["/me:user:1"].updated + 1):
+            await limiter.sync()
+
+        self.assertEqual(limiter.buckets, {})
+
+    async def test_degraded_without_redis(self):
+        self.server.down = True
+        limiter = RateLimiter(sync_seconds=3600)
+        await limiter.start(self.server)
+
+        self.assertTrue(limiter.stats()["degraded"])
+        self.assertEqual(await limiter.acquire("/me:ip:1.2.3.4", 1, 0.05), 0.0)
+        self.assertGreater(await limiter.acquire("/me:ip:1.2.3.4", 1, 0.05), 0.0)
+
+        self.server.down = False
+        await limiter.sync()
+
+        self.assertFalse(limiter.degraded)
+        self.assertEqual(self.server.buckets["ratelimit:/me:ip:1.2.3.4"][0], 0)
+        await limiter.stop()
+
+    async def test_redis_lost_on_acquire(self):
+        limiter = self.workers[0]
+        self.server.down = True
+
+        self.assertEqual(await limiter.acquire("/me:user:2", 1, 0.05), 0.0)
+        self.assertTrue(limiter.degraded)
+        self.assertEqual(limiter.stats()["errors"], 1)
+
+    async def test_max_keys(self):
+        limiter = RateLimiter(max_keys=2)
+        for user in range(3):
+            await limiter.acquire(f"/me:user:{user}", 1, 0.05)
+
+        self.assertEqual(list(limiter.buckets), ["/me:user:1", "/me:user:2"])
+
+
+class TestRateLimit(unittest.IsolatedAsyncioTestCase):
+
+    async def test_too_many_requests(self):
+        dependency = RateLimit(times=1, seconds=20, limiter=RateLimiter())
+        request = MagicMock()
+        request.scope = {"route": MagicMock(path="/api/users/me")}
+        request.client.host = "10.0.0.1"
+
+        await dependency(request)
+        with self.assertRaises(HTTPException) as err:
+            await dependency(request)
+
+        self.assertEqual(err.exception.status_code, 429)
+        self.assertEqual(err.exception.headers["Retry-After"], "20")
+        self.assertIn("/api/users/me:ip:10.0.0.1", dependency.limiter.buckets)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from fastapi import HTTPException
+
+from src.services.auth import auth_service
+from src.services.refresh_tokens import RefreshTokenInvalid, RefreshTokenReused, RefreshTokenStore
+
+
+class TestRefreshTokenStore(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.pipe = MagicMock()
+        self.pipe.execute = AsyncMock()
+        self.redis = MagicMock()
+        self.redis.pipeline.return_value.__aenter__.return_value = self.pipe
+        self.script = AsyncMock(return_value=1)
+        self.redis.register_script.return_value = self.script
+        self.store = RefreshTokenStore(ttl=3600)
+        self.store.init(self.redis)
+
+    async def test_issue_starts_family(self):
+        token = await self.store.issue("test@example.com")
+        claims = await auth_service.decode_refresh_token(token)
+
+        self.assertEqual(claims["sub"], "test@example.com")
+        self.pipe.hset.assert_called_once_with(f"refresh:family:{claims['fid']}",
+                                               mapping={"sub": "test@example.com", "jti": claims["jti"]})
+        self.pipe.hset.return_value.expire.assert_called_once_with(f"refresh:family:{claims['fid']}", 3600)
+        self.pipe.execute.assert_awaited_once()
+
+    async def test_rotate_keeps_family(self):
+        claims = await auth_service.decode_refresh_token(await self.store.issue("test@example.com"))
+
+        rotated = await auth_service.decode_refresh_token(await self.store.rotate(claims))
+
+        self.assertEqual(rotated["fid"], claims["fid"])
+        self.assertNotEqual(rotated["jti"], claims["jti"])
+        self.script.assert_awaited_once_with(keys=[f"refresh:family:{claims['fid']}"], args=[claims["jti"], rotated["jti"], 3600])
+        self.assertEqual(self.store.stats()["rotated"], 1)
+
+    async def test_rotate_reused(self):
+        self.script.return_value = -1
+
+        with self.assertRaises(RefreshTokenReused):
+            await self.store.rotate({"sub": "test@example.com", "fid": "f", "jti": "old"})
+
+        self.assertEqual(self.store.stats()["reused"], 1)
+
+    async def test_rotate_unknown_family(self):
+        self.script.return_value = 0
+
+        with self.assertRaises(RefreshTokenInvalid):
+            await self.store.rotate({"sub": "test@example.com", "fid": "f", "jti": "j"})
+
+    async def test_rotate_token_without_family(self):
+        with self.assertRaises(RefreshTokenInvalid):
+            await self.store.rotate({"sub": "test@example.com"})
+
+        self.script.assert_not_awaited()
+
+    async def test_access_token_is_not_a_refresh_token(self):
+        token = await auth_service.create_access_token(data={"sub": "test@example.com"})
+
+        with self.assertRaises(HTTPException) as err:
+            await auth_service.decode_refresh_token(token)
+
+        self.assertEqual(err.exception.detail, "Invalid scope for token")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import time
+import unittest
+
+from src.services.token_cache import TokenCache
+
+
+class TestTokenCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TokenCache(maxsize=2)
+        self.claims = {"sub": "deadpool@example.com", "scope": "access_token", "exp": time.time() + 60}
+
+    def test_hit(self):
+        self.cache.put("token1", self.claims)
+
+        self.assertEqual(self.cache.get("token1"), self.claims)
+        self.assertIsNone(self.cache.get("token2"))
+        self.assertEqual(self.cache.stats()["hit_rate"], 0.5)
+
+    def test_expired(self):
+        self.cache.put("token1", {**self.claims, "exp": time.time() - 1})
+
+        self.assertIsNone(self.cache.get("token1"))
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_no_exp_not_cached(self):
+        self.cache.put("token1", {"sub": "deadpool@example.com"})
+
+        self.assertIsNone(self.cache.get("token1"))
+
+    def test_lru_eviction(self):
+        self.cache.put("token1", self.claims)
+        self.cache.put("token2", self.claims)
+        self.cache.get("token1")
+        self.cache.put("token3", self.claims)
+
+        self.assertIsNotNone(self.cache.get("token1"))
+        self.assertIsNone(self.cache.get("token2"))
+
+    def test_revoke(self):
+        self.cache.put("token1", self.claims)
+        self.cache.put("token2", {**self.claims, "sub": "other@example.com"})
+        self.cache.revoke("deadpool@example.com")
+
+        self.assertIsNone(self.cache.get("token1"))
+        self.assertIsNotNone(self.cache.get("token2"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+import redis.asyncio as redis
+from fastapi import Response
+
+from src.services.versions import ContactVersions
+
+
+class TestContactVersions(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.pipe = MagicMock()
+        self.pipe.execute = AsyncMock(return_value=[0, [b"1700000000000001", None]])
+        self.redis = MagicMock()
+        self.redis.pipeline.return_value.__aenter__.return_value = self.pipe
+        self.redis.delete = AsyncMock()
+        self.redis.expire = AsyncMock()
+        self.versions = ContactVersions(ttl=60, window=5.0)
+        self.versions.init(self.redis)
+        self.request = MagicMock()
+        self.request.headers = {}
+
+    def test_matches(self):
+        etag = ContactVersions.etag(1, 5)
+
+        self.assertTrue(ContactVersions.matches(etag, etag))
+        self.assertTrue(ContactVersions.matches(f'"x", {etag.removeprefix("W/")}', etag))
+        self.assertTrue(ContactVersions.matches("*", etag))
+        self.assertFalse(ContactVersions.matches(ContactVersions.etag(1, 6), etag))
+        self.assertFalse(ContactVersions.matches(None, etag))
+
+    async def test_get(self):
+        self.assertEqual(await self.versions.get(1), (1700000000000001, 0.0))
+        self.redis.expire.assert_not_awaited()
+
+    async def test_get_starts_counter(self):
+        self.pipe.execute.return_value = [1, [b"1700000000000001", None]]
+
+        await self.versions.get(1)
+
+        self.pipe.hsetnx.assert_called_once()
+        self.redis.expire.assert_awaited_once_with("contacts:versions:1", 60)
+
+    async def test_get_without_redis(self):
+        self.assertIsNone(await ContactVersions().get(1))
+
+    async def test_check_sets_etag(self):
+        response = Response()
+
+        self.assertIsNone(await self.versions.check(self.request, response, 1))
+        self.assertEqual(response.headers["etag"], ContactVersions.etag(1, 1700000000000001))
+
+    async def test_check_old_bump_reads_replica(self):
+        self.pipe.execute.return_value = [0, [b"1700000000000002", str(time.time() - 60).encode()]]
+        db = MagicMock()
+        db.info = {}
+
+        self.assertIsNone(await self.versions.check(self.request, Response(), 1, db))
+        self.assertNotIn("primary", db.info)
+
+    async def test_check_recent_bump_reads_primary(self):
+        self.pipe.execute.return_value = [0, [b"1700000000000002", str(time.time()).encode()]]
+        db = MagicMock()
+        db.info = {}
+        response = Response()
+
+        self.assertIsNone(await self.versions.check(self.request, response, 1, db))
+        self.assertTrue(db.info["primary"])
+        self.assertEqual(response.headers["etag"], ContactVersions.etag(1, 1700000000000002))
+
+    async def test_check_not_modified(self):
+        self.request.headers = {"if-none-match": ContactVersions.etag(1, 1700000000000001)}
+
+        response = await self.versions.check(self.request, Response(), 1)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.versions.not_modified, 1)
+
+    async def test_check_redis_down(self):
+        self.pipe.execute.side_effect = redis.ConnectionError("down")
+        self.request.headers = {"if-none-match": "*"}
+        response = Response()
+
+        self.assertIsNone(await self.versions.check(self.request, response, 1))
+        self.assertNotIn("etag", response.headers)
+
+    async def test_bump(self):
+        await self.versions.bump(1)
+
+        self.pipe.hsetnx.return_value.hincrby.assert_called_once_with("contacts:versions:1", "version", 1)
+        self.assertEqual(self.pipe.hset.call_args.args[:2], ("contacts:versions:1", "bumped"))
+        self.pipe.execute.assert_awaited_once()
+
+    async def test_bump_failed_drops_counter(self):
+        self.pipe.execute.side_effect = redis.ConnectionError("down")
+
+        await self.versions.bump(1)
+
+        self.redis.delete.assert_awaited_once_with("contacts:versions:1")
+
+
+if __name__ == '__main__':
+    unittest.main()